@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Project, PullRequest, Job, GeneratedTest, TestRun, Failure, FailureCluster, PatchSuggestion
+from .models import Project, PullRequest, Job, GeneratedTest, TestRun, Failure, FailureCluster, PatchSuggestion, GenerationCacheEntry, TestResultCacheEntry, CacheStats, TestDuration, WebhookDelivery, AnalysisFinding, AnalysisCacheEntry, SymbolIndexEntry, CoverageMap, PullRequestSummary, StageCheckpoint, TestFlakiness
 
 admin.site.register(Project)
 admin.site.register(PullRequest)
@@ -9,3 +9,15 @@ admin.site.register(TestRun)
 admin.site.register(Failure)
 admin.site.register(FailureCluster)
 admin.site.register(PatchSuggestion)
+admin.site.register(GenerationCacheEntry)
+admin.site.register(TestResultCacheEntry)
+admin.site.register(CacheStats)
+admin.site.register(TestDuration)
+admin.site.register(WebhookDelivery)
+admin.site.register(AnalysisFinding)
+admin.site.register(AnalysisCacheEntry)
+admin.site.register(SymbolIndexEntry)
+admin.site.register(CoverageMap)
+admin.site.register(PullRequestSummary)
+admin.site.register(StageCheckpoint)
+admin.site.register(TestFlakiness)
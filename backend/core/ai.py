@@ -4,10 +4,15 @@ import ast
 import json
 import textwrap
 from typing import List, Tuple, Dict, Any, Optional
-import requests
+from . import llm
+from . import clustering
+from . import index as index_mod
 
-HF_API_URL = os.getenv("HF_INFERENCE_API_URL")
-HF_API_KEY = os.getenv("HF_API_KEY")
+HF_API_URL = llm.HF_API_URL
+HF_API_KEY = llm.HF_API_KEY
+
+# Where generated test files are written inside the checkout.
+GENERATED_DIR = "tests/generated"
 
 PROMPT_TEMPLATE = """You are an expert test generator. Given Python source code, write focused pytest tests.
 Aim for:
@@ -16,91 +21,149 @@ Aim for:
 - edge cases and error handling
 
 Return only test file content without explanations.
+Import the code under test from module `{module}`.
+Source:
+{code}
+"""
+
+DIFF_PROMPT_TEMPLATE = """You are an expert test generator. A pull request changed the Python code below.
+Write focused pytest tests ONLY for these symbols of module `{module}`: {symbols}
+Aim for:
+- deterministic unit tests
+- property-based tests using hypothesis for pure functions
+- edge cases and error handling
+
+Return only test file content without explanations.
+Import the code under test from module `{module}`.
 Source:
 {code}
 """
 
+def generated_path(source_rel: str) -> str:
+    return f"{GENERATED_DIR}/test_{os.path.basename(source_rel)}"
+
+def generator_id() -> str:
+    # Identifies what would produce the tests; part of the generation cache key.
+    return llm.backend_id() or "heuristic"
+
 def call_hf(prompt: str) -> Optional[str]:
-    if not HF_API_URL or not HF_API_KEY:
+    client = llm.get_client()
+    if client is None:
         return None
-    headers = {"Authorization": f"Bearer {HF_API_KEY}"}
-    resp = requests.post(HF_API_URL, headers=headers, json={"inputs": prompt}, timeout=120)
-    if resp.status_code == 200:
-        try:
-            data = resp.json()
-            if isinstance(data, list) and data:
-                return data[0].get("generated_text", "")
-            if isinstance(data, dict) and "generated_text" in data:
-                return data["generated_text"]
-            # Some endpoints return raw text
-            return resp.text
-        except Exception:
-            return resp.text
-    return None
-
-def heuristic_generate_tests(py_file_path: str, code: str) -> str:
+    return client.generate(prompt)
+
+def symbol_source(code: str, symbols: List[str]) -> str:
+    # Only the source of the changed symbols, so the prompt stays small.
     try:
         tree = ast.parse(code)
     except Exception:
-        tree = None
+        return code
+    wanted = {s.split(".")[0] for s in symbols}
+    parts = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name in wanted:
+            parts.append(ast.get_source_segment(code, node) or "")
+    return "\n\n".join(parts) or code
+
+def heuristic_generate_tests(py_file_path: str, code: str, only: Optional[List[str]] = None,
+                             module: Optional[str] = None, symbols: Optional[List[Dict[str, Any]]] = None) -> str:
+    # `module` and `symbols` come from the project index; without them the file is parsed here.
+    if symbols is None:
+        symbols = index_mod.parse(code)["symbols"]
+    wanted = {s.split(".")[-1] for s in only} if only is not None else None
     tests = ["import pytest", "from hypothesis import given, strategies as st"]
-    module_name = os.path.basename(py_file_path).replace(".py", "")
+    module_name = module or os.path.basename(py_file_path).replace(".py", "")
     tests.append(f"import {module_name} as module")
-    if tree:
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef) and not node.name.startswith("_"):
-                fname = node.name
+    for sym in symbols:
+        if sym["kind"] == "function" and not sym["name"].startswith("_"):
+            if wanted is not None and sym["name"] not in wanted:
+                continue
+            fname = sym["name"]
+            tests.append("")
+            tests.append(f"def test_{fname}_basic():")
+            tests.append(f"    # basic smoke test for {fname}")
+            # naive arg defaults for the required parameters
+            params = ["0" for _ in sym["params"]]
+            call_args = ", ".join(params)
+            tests.append(f"    try:")
+            tests.append(f"        _ = module.{fname}({call_args})")
+            tests.append(f"    except Exception as e:")
+            tests.append(f"        pytest.fail(f'unexpected error: { '{'}e{'}' }')")
+
+            # property-based sketch for single-arg numeric
+            if len(params) == 1:
                 tests.append("")
-                tests.append(f"def test_{fname}_basic():")
-                tests.append(f"    # basic smoke test for {fname}")
-                call_args = " "
-                # naive arg defaults
-                params = []
-                for arg in node.args.args:
-                    if arg.arg == "self":
-                        continue
-                    params.append("0")
-                call_args = ", ".join(params)
-                tests.append(f"    try:")
-                tests.append(f"        _ = module.{fname}({call_args})")
-                tests.append(f"    except Exception as e:")
-                tests.append(f"        pytest.fail(f'unexpected error: { '{'}e{'}' }')")
-
-                # property-based sketch for single-arg numeric
-                if len(params) == 1:
-                    tests.append("")
-                    tests.append(f"@given(st.integers())")
-                    tests.append(f"def test_{fname}_property(x):")
-                    tests.append(f"    # property: function should not crash for any integer")
-                    tests.append(f"    module.{fname}(x)")
+                tests.append(f"@given(st.integers())")
+                tests.append(f"def test_{fname}_property(x):")
+                tests.append(f"    # property: function should not crash for any integer")
+                tests.append(f"    module.{fname}(x)")
     return "\n".join(tests)
 
-def generate_tests_for_repo(files: List[str], read_file) -> List[Tuple[str, str, str]]:
-    outputs: List[Tuple[str, str, str]] = []
+def build_prompt(path: str, code: str, only: Optional[List[str]], index=None) -> str:
+    # With the project index the prompt carries the targeted source plus the signatures
+    # it depends on, instead of the first 8000 characters of the file.
+    if index is not None and path in index:
+        module = index.modules[path]
+        context = index.context(path, code, only)
+    else:
+        module = path[:-3].replace(os.sep, ".")
+        context = (symbol_source(code, only) if only else code)[:8000]
+    if only:
+        return DIFF_PROMPT_TEMPLATE.format(module=module, symbols=", ".join(only), code=context)
+    return PROMPT_TEMPLATE.format(module=module, code=context)
+
+def generate_tests_for_repo(files: List[str], read_file,
+                            symbols: Optional[Dict[str, List[str]]] = None,
+                            cache=None, index=None) -> List[Tuple[str, str, str]]:
+    # With `symbols` (file -> changed symbol names) only those files/symbols are targeted.
+    # `cache` (see core.cache.GenerationCache) short-circuits unchanged sources.
+    # `index` (see core.index.ProjectIndex) supplies import paths and prompt context.
+    outputs: List[Optional[Tuple[str, str, str]]] = []
+    pending = []
     for f in files:
         if not f.endswith(".py"):
             continue
         if os.path.basename(f).startswith("test_"):
             continue
+        if symbols is not None and f not in symbols:
+            continue
         code = read_file(f)
-        prompt = PROMPT_TEMPLATE.format(code=code[:8000])
-        llm = call_hf(prompt)
-        if llm and "def test" in llm:
-            content = llm
-            rationale = "Generated via HF model"
+        only = symbols.get(f) if symbols is not None else None
+        test_rel_path = generated_path(f)
+        prompt = build_prompt(f, code, only, index)
+        cached = cache.get(f, code, only, prompt) if cache is not None else None
+        if cached:
+            outputs.append((test_rel_path, cached[0], cached[1]))
+            continue
+        outputs.append(None)
+        pending.append((len(outputs) - 1, f, code, only, test_rel_path, prompt))
+
+    # All LLM calls for the repo go out together: pooled, rate limited and batched for HF,
+    # queued onto the local server's slots (token budget, latency SLO) for the local backend.
+    client = llm.get_client()
+    prompts = [p[-1] for p in pending]
+    texts = client.generate_many(prompts) if client is not None and prompts else [None] * len(pending)
+
+    for (idx, f, code, only, test_rel_path, prompt), text in zip(pending, texts):
+        if text and "def test" in text:
+            content = text
+            rationale = f"Generated via {client.label}"
+            cacheable = True
         else:
-            content = heuristic_generate_tests(f, code)
+            if index is not None and f in index:
+                content = heuristic_generate_tests(f, code, only, index.modules[f], index.symbols(f))
+            else:
+                content = heuristic_generate_tests(f, code, only)
             rationale = "Heuristic AST-based generator"
-        test_rel_path = f"tests/generated/test_{os.path.basename(f)}"
-        outputs.append((test_rel_path, content, rationale))
-    return outputs
+            # A heuristic fallback after a failed LLM call must not mask the LLM next time.
+            cacheable = generator_id() == "heuristic"
+        if only:
+            rationale += f" (changed: {', '.join(only)})"
+        if cache is not None and cacheable:
+            cache.put(f, code, only, content, rationale, prompt)
+        outputs[idx] = (test_rel_path, content, rationale)
+    return [o for o in outputs if o is not None]
 
 def cluster_failures(failures: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    clusters: Dict[str, Dict[str, Any]] = {}
-    for f in failures:
-        key = f.get("message", "")[:120] + f.get("test_name", "")[:60]
-        if key not in clusters:
-            clusters[key] = {"summary": f.get("message", "")[:280], "count": 0, "items": []}
-        clusters[key]["count"] += 1
-        clusters[key]["items"].append(f)
-    return clusters
+    # Keyed by fingerprint; see core.clustering for the normalization/merging rules.
+    return clustering.cluster(failures)
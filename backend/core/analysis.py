@@ -0,0 +1,189 @@
+import functools
+import hashlib
+import json
+import os
+import shlex
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from django.db.models import F
+from django.utils import timezone
+from .models import Project, AnalysisCacheEntry
+from . import sandbox
+from . import cache as cache_mod
+
+# Static analysis of the files a PR touches. Each tool writes a machine-readable
+# report to a temp file (so log noise never corrupts it), findings are stored per
+# (tool, file) and cached on the file's blob, the tool version and its config.
+
+# Config files that change what the tools report; part of every cache key.
+CONFIG_FILES = ["setup.cfg", "tox.ini", ".flake8", "pyproject.toml", ".bandit", ".semgrep.yml", ".semgrepignore"]
+# Keep command lines well under ARG_MAX.
+FILES_PER_CALL = 200
+# Semgrep ruleset: a registry name (p/ci) or a rules file on the worker. A local file is hashed
+# into the cache key; registry rules change upstream, so cached results expire every
+# SEMGREP_RULES_TTL seconds (0 = never).
+SEMGREP_CONFIG = os.getenv("SEMGREP_CONFIG", "p/ci")
+SEMGREP_RULES_TTL = int(os.getenv("SEMGREP_RULES_TTL", "86400"))
+
+def _rel(path: str) -> str:
+    return os.path.normpath(path[2:] if path.startswith("./") else path)
+
+def parse_bandit(raw: str) -> List[Dict[str, Any]]:
+    data = json.loads(raw or "{}")
+    return [{
+        "path": _rel(r.get("filename", "")),
+        "line": r.get("line_number") or 0,
+        "column": r.get("col_offset") or 0,
+        "rule": r.get("test_id", ""),
+        "severity": (r.get("issue_severity") or "low").lower(),
+        "message": r.get("issue_text", ""),
+    } for r in data.get("results", [])]
+
+def parse_flake8(raw: str) -> List[Dict[str, Any]]:
+    findings = []
+    for line in raw.splitlines():
+        parts = line.split(":", 3)
+        if len(parts) < 4 or not parts[1].isdigit():
+            continue
+        code, _, text = parts[3].strip().partition(" ")
+        findings.append({
+            "path": _rel(parts[0]),
+            "line": int(parts[1]),
+            "column": int(parts[2]) if parts[2].isdigit() else 0,
+            "rule": code,
+            # pyflakes errors and syntax errors are real bugs; the rest is style
+            "severity": "medium" if code.startswith(("F", "E9")) else "low",
+            "message": text,
+        })
+    return findings
+
+SEMGREP_SEVERITY = {"ERROR": "high", "WARNING": "medium", "INFO": "low"}
+
+def parse_semgrep(raw: str) -> List[Dict[str, Any]]:
+    data = json.loads(raw or "{}")
+    return [{
+        "path": _rel(r.get("path", "")),
+        "line": r.get("start", {}).get("line", 0),
+        "column": r.get("start", {}).get("col", 0),
+        "rule": r.get("check_id", ""),
+        "severity": SEMGREP_SEVERITY.get(r.get("extra", {}).get("severity", ""), "low"),
+        "message": r.get("extra", {}).get("message", ""),
+    } for r in data.get("results", [])]
+
+# name -> (command template, parser, applies to path)
+TOOLS: Dict[str, Tuple[str, Callable[[str], List[Dict[str, Any]]], Callable[[str], bool]]] = {
+    "bandit": ("bandit -q -f json -o {out} {files}", parse_bandit, lambda p: p.endswith(".py")),
+    "flake8": ("flake8 --exit-zero --format='%(path)s:%(row)d:%(col)d: %(code)s %(text)s' --output-file={out} {files}",
+               parse_flake8, lambda p: p.endswith(".py")),
+    "semgrep": (f"semgrep scan --quiet --json --metrics=off --config {shlex.quote(SEMGREP_CONFIG)} -o {{out}} {{files}}",
+                parse_semgrep, lambda p: True),
+}
+
+@functools.lru_cache(maxsize=None)
+def tool_version(tool: str) -> str:
+    code, out = sandbox.run_cmd(f"{tool} --version", timeout=120)
+    return out.strip().splitlines()[0] if code == 0 and out.strip() else ""
+
+def config_hash(workdir: str) -> str:
+    h = hashlib.sha256()
+    for name in CONFIG_FILES:
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(name.encode() + b"\0" + f.read())
+    return h.hexdigest()
+
+def rules_version(tool: str) -> str:
+    """What the tool's rules are, beyond its version and the repo's config files."""
+    if tool != "semgrep":
+        return ""
+    if os.path.isfile(SEMGREP_CONFIG):
+        with open(SEMGREP_CONFIG, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    epoch = int(time.time() // SEMGREP_RULES_TTL) if SEMGREP_RULES_TTL > 0 else 0
+    return f"{SEMGREP_CONFIG}@{epoch}"
+
+def cache_key(tool: str, version: str, config: str, path: str, blob: str, rules: str = "") -> str:
+    return hashlib.sha256("\0".join([tool, version, config, path, blob, rules]).encode()).hexdigest()
+
+def run_tool(tool: str, workdir: str, files: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """Findings for files, or None if the tool is missing or its report is unusable."""
+    template, parser, _ = TOOLS[tool]
+    findings: List[Dict[str, Any]] = []
+    for i in range(0, len(files), FILES_PER_CALL):
+        fd, out_path = tempfile.mkstemp(prefix=f"qa-{tool}-", suffix=".out")
+        os.close(fd)
+        try:
+            batch = " ".join(shlex.quote(f) for f in files[i:i + FILES_PER_CALL])
+            code, out = sandbox.run_cmd(template.format(out=out_path, files=batch), cwd=workdir, timeout=900)
+            if code in (124, 126, 127):
+                return None
+            with open(out_path, "r", encoding="utf-8", errors="ignore") as f:
+                findings.extend(parser(f.read()))
+        except (OSError, ValueError):
+            return None
+        finally:
+            os.unlink(out_path)
+    return findings
+
+def analyze(project: Project, workdir: str, files: List[str], read_file) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Run every tool on the files it applies to, reusing cached per-file results.
+    Returns (findings with a "tool" field, per-tool stats)."""
+    blobs = {}
+    for rel in files:
+        try:
+            blobs[rel] = cache_mod.blob_sha(read_file(rel))
+        except (OSError, UnicodeDecodeError):
+            continue
+    config = config_hash(workdir)
+
+    plans: Dict[str, Dict[str, str]] = {}
+    cached: Dict[str, List[Dict[str, Any]]] = {}
+    for tool, (_, _, applies) in TOOLS.items():
+        version = tool_version(tool)
+        rules = rules_version(tool)
+        targets = {rel: cache_key(tool, version, config, rel, blob, rules) for rel, blob in blobs.items() if applies(rel)}
+        if not version or not targets:
+            plans[tool] = {}
+            continue
+        rows = list(AnalysisCacheEntry.objects.filter(key__in=list(targets.values())).values_list("id", "key", "findings"))
+        if rows:
+            AnalysisCacheEntry.objects.filter(id__in=[r[0] for r in rows]).update(hits=F("hits") + 1, last_used_at=timezone.now())
+        hit_keys = {key for _, key, _ in rows}
+        cached[tool] = [dict(f, tool=tool) for _, _, fs in rows for f in fs]
+        plans[tool] = {rel: key for rel, key in targets.items() if key not in hit_keys}
+
+    with ThreadPoolExecutor(max_workers=len(TOOLS)) as pool:
+        futures = {tool: pool.submit(run_tool, tool, workdir, sorted(todo)) for tool, todo in plans.items() if todo}
+        fresh = {tool: fut.result() for tool, fut in futures.items()}
+
+    findings: List[Dict[str, Any]] = []
+    stats: Dict[str, Dict[str, Any]] = {}
+    hits = misses = 0
+    for tool, (_, _, applies) in TOOLS.items():
+        todo = plans.get(tool, {})
+        result = fresh.get(tool)
+        findings.extend(cached.get(tool, []))
+        targets = sum(1 for rel in blobs if applies(rel))
+        if not tool_version(tool):
+            stats[tool] = {"status": "unavailable", "files": targets, "scanned": 0, "cached": 0}
+            continue
+        if todo and result is None:
+            stats[tool] = {"status": "failed", "files": targets, "scanned": 0, "cached": targets - len(todo)}
+            continue
+        by_path: Dict[str, List[Dict[str, Any]]] = {rel: [] for rel in todo}
+        for f in result or []:
+            if f["path"] in by_path:
+                by_path[f["path"]].append(f)
+        AnalysisCacheEntry.objects.bulk_create([
+            AnalysisCacheEntry(project=project, key=todo[rel], tool=tool, path=rel, findings=fs)
+            for rel, fs in by_path.items()
+        ], batch_size=500, ignore_conflicts=True)
+        findings.extend(dict(f, tool=tool) for fs in by_path.values() for f in fs)
+        stats[tool] = {"status": "ok", "files": targets, "scanned": len(todo), "cached": targets - len(todo)}
+        hits += targets - len(todo)
+        misses += len(todo)
+    cache_mod.record(project, "analysis", hits, misses)
+    return findings, stats
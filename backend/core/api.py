@@ -0,0 +1,42 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import generics
+from rest_framework.pagination import PageNumberPagination
+from .models import PullRequest, TestRun, Failure, TEST_RUN_LIST_FIELDS
+from .serializers import PullRequestSerializer, TestRunSerializer, FailureSerializer
+
+# Read-only, paginated JSON listings. Each one is a single indexed query per page
+# and leaves out large text columns (output, JUnit XML, stack traces).
+
+class Pagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+class PullRequestList(generics.ListAPIView):
+    """Most recently updated PRs, optionally for one ?project=org/repo."""
+    serializer_class = PullRequestSerializer
+    pagination_class = Pagination
+
+    def get_queryset(self):
+        qs = PullRequest.objects.select_related("project", "summary").order_by("-updated_at")
+        repo = self.request.query_params.get("project")
+        return qs.filter(project__repo_full_name=repo) if repo else qs
+
+class TestRunList(generics.ListAPIView):
+    """A PR's runs, newest first."""
+    serializer_class = TestRunSerializer
+    pagination_class = Pagination
+
+    def get_queryset(self):
+        k = self.kwargs
+        pr = get_object_or_404(PullRequest.objects.only("id"), project__repo_full_name=f"{k['user']}/{k['project']}",
+                               number=k["number"])
+        return TestRun.objects.filter(pr=pr).only(*TEST_RUN_LIST_FIELDS).order_by("-started_at")
+
+class FailureList(generics.ListAPIView):
+    """A run's failures; the stack trace is in the JUnit report."""
+    serializer_class = FailureSerializer
+    pagination_class = Pagination
+
+    def get_queryset(self):
+        return Failure.objects.filter(test_run_id=self.kwargs["run_id"]).defer("stacktrace").order_by("id")
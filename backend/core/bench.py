@@ -0,0 +1,239 @@
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr, escape
+from . import sandbox
+from . import llm
+from . import llm_stub
+from . import github
+from . import github_stub
+from . import ai as ai_mod
+
+# Benchmark harness: synthetic Python repos of a given size served from a local
+# file:// git root, offline fakes for the LLM and GitHub, and timing/memory
+# measurement of single stages or the whole pipeline (see `manage.py pipeline_bench`).
+
+BENCH_REPO = "bench/synthetic"
+BENCH_PR = 1
+
+# (exception, failing assertion) pairs; failing tests cycle through them so triage sees several clusters.
+FAILURE_KINDS = [
+    ("AssertionError", "assert {fn}(1) == -1"),
+    ("ZeroDivisionError", "assert {fn}(1) / 0"),
+    ("KeyError", "assert {{}}['missing_{n}'] == {fn}(1)"),
+]
+
+def _module_source(i: int, functions: int, extra: int = 0) -> str:
+    parts = [f'"""Synthetic module {i}."""\n']
+    for j in range(functions + extra):
+        parts.append(
+            f"def f_{i}_{j}(x, y=1):\n"
+            f"    total = x\n"
+            f"    for k in range(y):\n"
+            f"        total += k * {j}\n"
+            f"    return total + {j}\n"
+        )
+    parts.append(
+        f"class Model{i}:\n"
+        f"    def __init__(self, value=0):\n"
+        f"        self.value = value\n\n"
+        f"    def bump(self, by=1):\n"
+        f"        self.value += by\n"
+        f"        return self.value\n"
+    )
+    return "\n\n".join(parts)
+
+def _test_source(i: int, functions: int, failing: List[int]) -> str:
+    names = ", ".join(f"f_{i}_{j}" for j in range(functions))
+    parts = [f"from pkg.mod_{i} import {names}\n"]
+    for j in range(functions):
+        fn = f"f_{i}_{j}"
+        if j in failing:
+            _, check = FAILURE_KINDS[(i + j) % len(FAILURE_KINDS)]
+            body = check.format(fn=fn, n=j)
+        else:
+            body = f"assert {fn}(1) == {1 + j}"
+        parts.append(f"def test_{fn}():\n    {body}\n")
+    return "\n\n".join(parts)
+
+def _git(cmd: str, cwd: str) -> None:
+    code, out = sandbox.run_cmd(cmd, cwd=cwd, timeout=300)
+    if code != 0:
+        raise RuntimeError(f"{cmd} failed: {out}")
+
+def make_repo(root: str, files: int = 50, functions: int = 10, failing: int = 5, changed: int = 5,
+              seed: int = 0) -> Tuple[str, str]:
+    """Create root/<BENCH_REPO>.git: `files` modules of `functions` functions each with one test per
+    function (`failing` of them failing), and refs/pull/<BENCH_PR>/head adding a function to `changed`
+    modules. The same arguments always give the same commits. Returns (bare repo path, PR head sha)."""
+    rng = random.Random(seed)
+    work = os.path.join(root, "_work")
+    bare = os.path.join(root, f"{BENCH_REPO}.git")
+    failing_at: Dict[int, List[int]] = {}
+    for n in rng.sample(range(files * functions), min(failing, files * functions)):
+        failing_at.setdefault(n // functions, []).append(n % functions)
+    sources = {"pkg/__init__.py": "", "tests/__init__.py": "", "requirements.txt": "pytest\n"}
+    for i in range(files):
+        sources[f"pkg/mod_{i}.py"] = _module_source(i, functions)
+        sources[f"tests/test_mod_{i}.py"] = _test_source(i, functions, failing_at.get(i, []))
+    sandbox.write_files(work, sources)
+    env = ("GIT_AUTHOR_NAME=bench GIT_AUTHOR_EMAIL=bench@example.com GIT_COMMITTER_NAME=bench "
+           "GIT_COMMITTER_EMAIL=bench@example.com GIT_AUTHOR_DATE='2026-01-01T00:00:00Z' "
+           "GIT_COMMITTER_DATE='2026-01-01T00:00:00Z'")
+    _git("git init -q -b main .", work)
+    _git(f"git add -A && {env} git commit -q -m base", work)
+    _git("git checkout -q -b pr", work)
+    sandbox.write_files(work, {f"pkg/mod_{i}.py": _module_source(i, functions, extra=1)
+                               for i in sorted(rng.sample(range(files), min(changed, files)))})
+    _git(f"git add -A && {env} git commit -q -m change", work)
+    _git(f"git update-ref refs/pull/{BENCH_PR}/head HEAD && git checkout -q main", work)
+    os.makedirs(os.path.dirname(bare), exist_ok=True)
+    _git(f"git clone -q --mirror {work} {bare}", root)
+    _, head = sandbox.run_cmd(f"git rev-parse refs/pull/{BENCH_PR}/head", cwd=bare)
+    return bare, head.strip()
+
+def checkout(bare: str, dest: str) -> str:
+    """Working copy of the PR head at dest, for stage benchmarks that need a checkout."""
+    os.makedirs(dest, exist_ok=True)
+    _git(f"git clone -q {bare} . && git fetch -q origin refs/pull/{BENCH_PR}/head && git checkout -q FETCH_HEAD", dest)
+    return dest
+
+def synthetic_failures(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Failure dicts shaped like the triage stage's query, spread over a few distinct causes."""
+    rng = random.Random(seed)
+    out = []
+    for n in range(count):
+        exc, _ = FAILURE_KINDS[n % len(FAILURE_KINDS)]
+        i, j = rng.randrange(1000), rng.randrange(50)
+        out.append({
+            "id": n,
+            "test_name": f"tests/test_mod_{i}.py::test_f_{i}_{j}",
+            "message": f"{exc}: value {rng.randrange(10 ** 6)} at 0x{rng.randrange(16 ** 8):08x}",
+            "stacktrace": (f"tests/test_mod_{i}.py:{j + 3}: in test_f_{i}_{j}\n    assert f_{i}_{j}(1)\n"
+                           f"pkg/mod_{i}.py:{rng.randrange(1, 200)}: {exc}"),
+            "file": f"tests/test_mod_{i}.py",
+            "line": j + 3,
+            "failure_type": exc,
+        })
+    return out
+
+def write_junit(path: str, cases: int, failing: int, seed: int = 0) -> str:
+    """A pytest-style JUnit report with `cases` test cases, `failing` of them failed."""
+    failures = synthetic_failures(failing, seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'<?xml version="1.0" encoding="utf-8"?><testsuites><testsuite name="pytest" tests="{cases}">')
+        for n in range(cases):
+            f.write(f'<testcase classname="tests.test_mod_{n // 50}" name="test_f_{n // 50}_{n % 50}" '
+                    f'file="tests/test_mod_{n // 50}.py" line="{n % 50}" time="0.001">')
+            if n < failing:
+                fail = failures[n]
+                f.write(f'<failure message={quoteattr(fail["message"])} type="{fail["failure_type"]}">'
+                        f'{escape(fail["stacktrace"])}</failure>')
+            f.write("</testcase>")
+        f.write("</testsuite></testsuites>")
+    return path
+
+@contextlib.contextmanager
+def fake_services(llm_latency: float = 0.0) -> Iterator[Dict[str, Any]]:
+    """Point the LLM client and the GitHub client at in-process stubs for the duration."""
+    llm_server, llm_url = llm_stub.start_in_thread(latency=llm_latency)
+    gh_server, gh_url = github_stub.start_in_thread()
+    saved = (llm.LLM_BACKEND, llm.HF_API_URL, llm.HF_API_KEY, llm._client, ai_mod.HF_API_URL, ai_mod.HF_API_KEY,
+             github.GITHUB_TOKEN, github._client)
+    llm.LLM_BACKEND = "hf"
+    llm.HF_API_URL = ai_mod.HF_API_URL = llm_url
+    llm.HF_API_KEY = ai_mod.HF_API_KEY = "bench"
+    llm._client = None
+    github.GITHUB_TOKEN = "bench"
+    github._client = github.GitHubClient("bench", base_url=gh_url)
+    try:
+        yield {"llm": llm_server, "github": gh_server}
+    finally:
+        (llm.LLM_BACKEND, llm.HF_API_URL, llm.HF_API_KEY, llm._client, ai_mod.HF_API_URL, ai_mod.HF_API_KEY,
+         github.GITHUB_TOKEN, github._client) = saved
+        llm_server.shutdown()
+        gh_server.shutdown()
+
+def sign(payload: bytes) -> str:
+    if not github.WEBHOOK_SECRET:
+        return ""
+    return "sha256=" + hmac.new(github.WEBHOOK_SECRET.encode(), payload, hashlib.sha256).hexdigest()
+
+# The app reads Django settings under the CELERY namespace, so these (not task_always_eager)
+# are the keys it resolves; setting the short names is shadowed by CELERY_TASK_ALWAYS_EAGER.
+EAGER_KEYS = ("CELERY_TASK_ALWAYS_EAGER", "CELERY_TASK_EAGER_PROPAGATES")
+
+@contextlib.contextmanager
+def eager_celery(app) -> Iterator[None]:
+    # Tasks (chords included) run inline, so a benchmark needs no broker or workers.
+    saved = {key: app.conf.get(key) for key in EAGER_KEYS}
+    app.conf.update({key: True for key in EAGER_KEYS})
+    try:
+        if not app.conf.task_always_eager:
+            raise RuntimeError("Celery eager mode did not take effect; tasks would go to the broker")
+        yield
+    finally:
+        app.conf.update(saved)
+
+def _max_rss_kb() -> int:
+    # ru_maxrss is in KB on Linux; children covers git/pip/pytest subprocesses.
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def measure(fn: Callable[[], Any], repeat: int = 3, setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    """Wall time of `repeat` calls (setup runs untimed before each), then one more call under
+    tracemalloc for the peak Python heap, which would otherwise skew the timings."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarize(times, peak // 1024)
+
+def summarize(times: List[float], peak_kb: int = 0) -> Dict[str, Any]:
+    times = sorted(times)
+    return {
+        "runs": len(times),
+        "min": round(times[0], 4),
+        "median": round(statistics.median(times), 4),
+        "max": round(times[-1], 4),
+        "peak_kb": peak_kb,
+        "max_rss_kb": _max_rss_kb(),
+    }
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float = 0.25, floor: float = 0.01) -> List[str]:
+    """Benchmarks whose median time or peak heap grew more than `tolerance` over the baseline.
+    Time differences under `floor` seconds are noise."""
+    regressions = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if cur["median"] - base["median"] > max(floor, base["median"] * tolerance):
+            regressions.append(f"{name}: median {base['median']:.4f}s -> {cur['median']:.4f}s")
+        if base.get("peak_kb") and cur["peak_kb"] > base["peak_kb"] * (1 + tolerance) + 64:
+            regressions.append(f"{name}: peak heap {base['peak_kb']} KB -> {cur['peak_kb']} KB")
+    return regressions
+
+def load_report(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
@@ -0,0 +1,71 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import IO
+
+# Content-addressed, gzip-compressed blob store on disk (BLOB_ROOT). Large
+# artifacts such as JUnit reports and full console output live here instead of
+# in Postgres TEXT columns; rows only keep the key.
+
+CHUNK = 1024 * 1024
+
+def _path(root: str, key: str) -> str:
+    return os.path.join(root, key[:2], f"{key}.gz")
+
+def put_file(root: str, src: str) -> str:
+    """Compress src into the store, streaming; returns the blob key (sha256 of the raw bytes)."""
+    os.makedirs(root, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=".upload-")
+    try:
+        with open(src, "rb") as fin, os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+            while True:
+                chunk = fin.read(CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                gz.write(chunk)
+        key = h.hexdigest()
+        dest = _path(root, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, dest)
+        return key
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def put_text(root: str, text: str) -> str:
+    fd, tmp = tempfile.mkstemp(prefix=".text-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        return put_file(root, tmp)
+    finally:
+        os.remove(tmp)
+
+def exists(root: str, key: str) -> bool:
+    return bool(key) and os.path.exists(_path(root, key))
+
+def open_blob(root: str, key: str) -> IO[bytes]:
+    return gzip.open(_path(root, key), "rb")
+
+def copy_to(root: str, key: str, dest: str) -> None:
+    with open_blob(root, key) as src, open(dest, "wb") as out:
+        shutil.copyfileobj(src, out, CHUNK)
+
+def read_tail(root: str, key: str, limit: int) -> str:
+    """Last `limit` bytes, decompressing in chunks so memory stays bounded."""
+    tail = b""
+    with open_blob(root, key) as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            tail = (tail + chunk)[-limit:]
+    return tail.decode("utf-8", errors="ignore")
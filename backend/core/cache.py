@@ -0,0 +1,156 @@
+import ast
+import hashlib
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import Project, GenerationCacheEntry, TestResultCacheEntry, CacheStats
+
+# Bump when the generators change in a way that should invalidate cached output.
+GENERATOR_VERSION = "1"
+
+def blob_sha(content: str) -> str:
+    # Same id git gives the blob, so it lines up with `git ls-files -s`.
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def _key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def record(project: Project, cache: str, hits: int, misses: int) -> None:
+    if not hits and not misses:
+        return
+    stats, _ = CacheStats.objects.get_or_create(project=project, cache=cache, day=timezone.localdate())
+    CacheStats.objects.filter(id=stats.id).update(hits=F("hits") + hits, misses=F("misses") + misses)
+
+def hit_rates(project: Project) -> Dict[str, Dict[str, float]]:
+    rows = CacheStats.objects.filter(project=project).values("cache").annotate(h=Sum("hits"), m=Sum("misses"))
+    out: Dict[str, Dict[str, float]] = {}
+    for r in rows:
+        total = (r["h"] or 0) + (r["m"] or 0)
+        out[r["cache"]] = {"hits": r["h"] or 0, "misses": r["m"] or 0, "rate": (r["h"] or 0) / total if total else 0.0}
+    return out
+
+class GenerationCache:
+    """Lookup/store hook for ai.generate_tests_for_repo, scoped to one project."""
+
+    def __init__(self, project: Project, generator: str, prompt_template: str):
+        self.project = project
+        self.generator = generator
+        self.prompt_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, path: str, code: str, symbols: Optional[List[str]], prompt: str = "") -> str:
+        # prompt: the rendered prompt, which also carries the import path and index context
+        syms = ",".join(sorted(symbols)) if symbols is not None else "*"
+        return _key(blob_sha(code), path, syms, GENERATOR_VERSION, self.generator, self.prompt_hash,
+                    hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+    def get(self, path: str, code: str, symbols: Optional[List[str]], prompt: str = "") -> Optional[Tuple[str, str]]:
+        key = self.key(path, code, symbols, prompt)
+        entry = GenerationCacheEntry.objects.filter(key=key).only("id", "content", "rationale").first()
+        if entry is None:
+            self.misses += 1
+            return None
+        GenerationCacheEntry.objects.filter(id=entry.id).update(hits=F("hits") + 1, last_used_at=timezone.now())
+        self.hits += 1
+        return entry.content, entry.rationale
+
+    def put(self, path: str, code: str, symbols: Optional[List[str]], content: str, rationale: str,
+            prompt: str = "") -> None:
+        GenerationCacheEntry.objects.update_or_create(
+            key=self.key(path, code, symbols, prompt),
+            defaults={"project": self.project, "source_path": path, "blob_sha": blob_sha(code),
+                      "content": content, "rationale": rationale},
+        )
+
+    def flush_stats(self) -> None:
+        record(self.project, "generation", self.hits, self.misses)
+
+def invalidate_generated(project: Project, source_path: str, content: str) -> int:
+    """Drop cached generations of source_path with this content (e.g. a file that failed pre-flight)."""
+    deleted, _ = GenerationCacheEntry.objects.filter(project=project, source_path=source_path, content=content).delete()
+    return deleted
+
+# --- test result cache -------------------------------------------------------
+
+def is_test_file(rel: str) -> bool:
+    name = os.path.basename(rel)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+def _imports(code: str) -> Set[str]:
+    try:
+        tree = ast.parse(code)
+    except Exception:
+        return set()
+    names: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+            names.update(f"{node.module}.{a.name}" for a in node.names)
+    return names
+
+def _module_files(files: Iterable[str]) -> Dict[str, str]:
+    # dotted module name -> file, for both flat and src/ layouts
+    modules: Dict[str, str] = {}
+    for rel in files:
+        parts = rel[:-3].split(os.sep)
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        for start in range(len(parts)):
+            modules.setdefault(".".join(parts[start:]), rel)
+    return modules
+
+def import_closure(start: str, read_file, modules: Dict[str, str]) -> Set[str]:
+    seen: Set[str] = set()
+    todo = [start]
+    while todo:
+        rel = todo.pop()
+        if rel in seen:
+            continue
+        seen.add(rel)
+        for name in _imports(read_file(rel)):
+            # `import a.b.c` depends on a/__init__, a/b/__init__ and a/b/c
+            pieces = name.split(".")
+            for i in range(1, len(pieces) + 1):
+                dep = modules.get(".".join(pieces[:i]))
+                if dep and dep not in seen:
+                    todo.append(dep)
+    return seen
+
+def fingerprint_tests(files: List[str], read_file, env_key: str) -> Dict[str, str]:
+    """Cache key per test file: its own blob, every local module it (transitively) imports,
+    all conftest.py files and the environment."""
+    modules = _module_files(files)
+    blobs = {rel: blob_sha(read_file(rel)) for rel in files}
+    conftests = sorted(blobs[rel] for rel in files if os.path.basename(rel) == "conftest.py")
+    out: Dict[str, str] = {}
+    for rel in files:
+        if not is_test_file(rel):
+            continue
+        deps = sorted(f"{d}:{blobs[d]}" for d in import_closure(rel, read_file, modules))
+        out[rel] = _key(GENERATOR_VERSION, env_key, *conftests, *deps)
+    return out
+
+def cached_passes(project: Project, fingerprints: Dict[str, str]) -> Dict[str, int]:
+    by_key = {v: k for k, v in fingerprints.items()}
+    rows = TestResultCacheEntry.objects.filter(project=project, key__in=list(by_key)).values_list("id", "key", "passed")
+    hits = {by_key[key]: passed for _, key, passed in rows}
+    if rows:
+        TestResultCacheEntry.objects.filter(id__in=[r[0] for r in rows]).update(hits=F("hits") + 1, last_used_at=timezone.now())
+    record(project, "test_result", len(hits), len(fingerprints) - len(hits))
+    return hits
+
+def store_passes(project: Project, fingerprints: Dict[str, str], outcomes: Dict[str, Dict[str, int]]) -> int:
+    stored = 0
+    for rel, counts in outcomes.items():
+        if counts["failed"] or rel not in fingerprints:
+            continue
+        TestResultCacheEntry.objects.update_or_create(
+            key=fingerprints[rel], defaults={"project": project, "test_path": rel, "passed": counts["passed"]}
+        )
+        stored += 1
+    return stored
@@ -0,0 +1,33 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from .models import StageCheckpoint
+
+# Stage checkpoints. A stage that completes stores what it added to the pipeline
+# context (plus, for generated tests, a blob with the files) under a key derived
+# from its inputs: the checked-out commit, the settings that shape its output and
+# the keys/artifacts of the stages it consumes. A retry or re-run of the same head
+# finds the checkpoint and resumes instead of redoing the work.
+
+# Bump when a stage's result shape changes.
+CHECKPOINT_VERSION = "1"
+# Stages a "rerun tests" request recomputes; triage and patch key on the new test run.
+TEST_STAGES = ("execute",)
+
+def key(stage: str, *inputs: Any) -> str:
+    payload = json.dumps([CHECKPOINT_VERSION, stage, *inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def forced(ctx: Dict[str, Any], stage: str) -> bool:
+    return ctx.get("rerun") == "tests" and stage in TEST_STAGES
+
+def load(ctx: Dict[str, Any], stage: str, stage_key: str) -> Optional[StageCheckpoint]:
+    if forced(ctx, stage):
+        return None
+    return StageCheckpoint.objects.filter(pr_id=ctx["pr_id"], stage=stage, key=stage_key).first()
+
+def save(ctx: Dict[str, Any], job_id: Optional[int], stage: str, stage_key: str, result: Dict[str, Any],
+         blob: str = "") -> StageCheckpoint:
+    cp, _ = StageCheckpoint.objects.update_or_create(
+        pr_id=ctx["pr_id"], stage=stage, key=stage_key, defaults={"job_id": job_id, "result": result, "blob": blob})
+    return cp
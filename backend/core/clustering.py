@@ -0,0 +1,146 @@
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Failure clustering in two passes:
+#  1. exact: every failure gets a fingerprint from its exception type, the files
+#     of its top stack frames and its normalized message, so volatile details
+#     (addresses, numbers, tmp paths, parametrize ids) do not split clusters;
+#  2. near-duplicate: fingerprints with the same exception type whose normalized
+#     text has a high MinHash similarity (found through LSH banding) are merged.
+# Both passes are linear in the number of failures (pass 2 in the number of
+# distinct fingerprints), so tens of thousands of failures per run are fine.
+
+TOP_FRAMES = 3
+NUM_PERM = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.7 Jaccard almost always share a band
+MERGE_THRESHOLD = 0.8
+# One-permutation MinHash: each shingle is hashed once; its low bits pick one of NUM_PERM bins and
+# the rest is the value, each bin keeping its minimum. Empty bins borrow the next non-empty bin's
+# value (rotation densification), so a signature costs one pass over the shingles instead of
+# NUM_PERM passes.
+_BIN_BITS = (NUM_PERM - 1).bit_length()
+_ROTATION = 1 << 58  # offset per borrowed step, larger than any bin value
+
+_NORMALIZERS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "0xADDR"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "UUID"),
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?"), "TIMESTAMP"),
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\w.-]*[/\\])+([\w.-]+)"), r"\1"),  # keep only the basename
+    (re.compile(r"\[[^\]\n]*\]"), "[P]"),  # parametrize ids
+    (re.compile(r"'[^'\n]{0,200}'|\"[^\"\n]{0,200}\""), "'S'"),
+    (re.compile(r"\b\d+(\.\d+)?\b"), "N"),
+    (re.compile(r"\s+"), " "),
+]
+FRAME_RE = re.compile(r"^(\S+\.py):\d+:", re.MULTILINE)
+EXC_LINE_RE = re.compile(r"^E\s+([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt|Warning|Failed))\b", re.MULTILINE)
+EXC_MSG_RE = re.compile(r"^([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt|Warning|Failed))\b")
+
+def normalize(text: str) -> str:
+    for pattern, repl in _NORMALIZERS:
+        text = pattern.sub(repl, text)
+    return text.strip()
+
+def exception_type(failure: Dict[str, Any]) -> str:
+    for source, pattern in ((failure.get("message", ""), EXC_MSG_RE), (failure.get("stacktrace", ""), EXC_LINE_RE)):
+        m = pattern.search(source or "")
+        if m:
+            return m.group(1).split(".")[-1]
+    trace = failure.get("stacktrace", "") or ""
+    tail = trace.rstrip().rsplit(":", 1)
+    if len(tail) == 2 and re.fullmatch(r"\s*[A-Za-z_]\w*", tail[1]):
+        return tail[1].strip()
+    return failure.get("failure_type", "") or "failure"
+
+def top_frames(stacktrace: str, n: int = TOP_FRAMES) -> List[str]:
+    # Innermost frames are last in pytest's output; only file basenames, no line numbers.
+    frames = [f.replace("\\", "/").rsplit("/", 1)[-1] for f in FRAME_RE.findall(stacktrace or "")]
+    return frames[-n:]
+
+def fingerprint(failure: Dict[str, Any]) -> Tuple[str, str, str]:
+    """(fingerprint, exception type, normalized signature text)."""
+    exc = exception_type(failure)
+    frames = top_frames(failure.get("stacktrace", ""))
+    message = normalize((failure.get("message", "") or "").splitlines()[0] if failure.get("message") else "")
+    signature = f"{exc} | {' > '.join(frames)} | {message}"[:512]
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest(), exc, signature
+
+def _shingles(text: str) -> set:
+    words = text.split()
+    if len(words) < 3:
+        return {" ".join(words)} if words else {""}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+def minhash(text: str) -> List[int]:
+    bins: List[Optional[int]] = [None] * NUM_PERM
+    for s in _shingles(text):
+        h = int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        b, v = h & (NUM_PERM - 1), h >> _BIN_BITS
+        if bins[b] is None or v < bins[b]:
+            bins[b] = v
+    sig: List[int] = []
+    for i in range(NUM_PERM):
+        step = 0
+        while bins[(i + step) % NUM_PERM] is None:
+            step += 1
+        sig.append(bins[(i + step) % NUM_PERM] + step * _ROTATION)
+    return sig
+
+def _similarity(a: List[int], b: List[int]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+def cluster(failures: List[Dict[str, Any]], threshold: float = MERGE_THRESHOLD) -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, Dict[str, Any]] = {}
+    for f in failures:
+        fp, exc, signature = fingerprint(f)
+        g = groups.get(fp)
+        if g is None:
+            g = groups[fp] = {"exception": exc, "signature": signature, "items": [],
+                              "text": normalize(f"{f.get('message', '')}\n{(f.get('stacktrace') or '')[-800:]}")}
+        g["items"].append(f)
+
+    # LSH: only fingerprints sharing a band bucket (and an exception type) are compared.
+    parent = {fp: fp for fp in groups}
+
+    def find(x: str) -> str:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    # Fingerprints with identical normalized text share one signature.
+    by_text: Dict[str, List[int]] = {}
+    signatures = {fp: by_text[g["text"]] if g["text"] in by_text else by_text.setdefault(g["text"], minhash(g["text"]))
+                  for fp, g in groups.items()}
+    rows = NUM_PERM // BANDS
+    for band in range(BANDS):
+        buckets: Dict[Tuple[str, Tuple[int, ...]], List[str]] = {}
+        for fp, sig in signatures.items():
+            key = (groups[fp]["exception"], tuple(sig[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(fp)
+        for members in buckets.values():
+            head = members[0]
+            for other in members[1:]:
+                ra, rb = find(head), find(other)
+                if ra != rb and _similarity(signatures[head], signatures[other]) >= threshold:
+                    # Larger group keeps its fingerprint so ids stay stable as clusters grow.
+                    if len(groups[ra]["items"]) < len(groups[rb]["items"]):
+                        ra, rb = rb, ra
+                    parent[rb] = ra
+
+    clusters: Dict[str, Dict[str, Any]] = {}
+    for fp, g in groups.items():
+        root = find(fp)
+        c = clusters.get(root)
+        if c is None:
+            head = groups[root]
+            c = clusters[root] = {
+                "summary": (head["items"][0].get("message", "") or head["signature"])[:280],
+                "signature": head["signature"],
+                "exception": head["exception"],
+                "count": 0,
+                "items": [],
+            }
+        c["count"] += len(g["items"])
+        c["items"].extend(g["items"])
+    return clusters
@@ -0,0 +1,91 @@
+import ast
+import re
+from typing import Dict, List, Tuple
+from . import sandbox
+
+HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+OLD_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+")
+
+def merge_base(workdir: str, default_branch: str) -> str:
+    for ref in (f"origin/{default_branch}", default_branch):
+        code, out = sandbox.run_cmd(f"git merge-base HEAD {ref}", cwd=workdir, timeout=120)
+        if code == 0 and out.strip():
+            return out.strip().splitlines()[-1]
+    return ""
+
+def parse_unified_diff(diff: str) -> Dict[str, List[Tuple[int, int]]]:
+    """Map each changed file to the line ranges touched on the new side."""
+    hunks: Dict[str, List[Tuple[int, int]]] = {}
+    current = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            target = line[4:].strip()
+            current = target[2:] if target.startswith("b/") else None
+            if current is not None:
+                hunks.setdefault(current, [])
+            continue
+        m = HUNK_RE.match(line)
+        if m and current is not None:
+            start = int(m.group(1))
+            count = int(m.group(2)) if m.group(2) is not None else 1
+            # Pure deletions have count 0; keep the line they sit next to.
+            hunks[current].append((start, start + max(count, 1) - 1))
+    return hunks
+
+def changed_hunks(workdir: str, base: str) -> Dict[str, List[Tuple[int, int]]]:
+    code, out = sandbox.run_cmd(
+        f"git diff --unified=0 --no-color --diff-filter=AMR {base} HEAD -- '*.py'", cwd=workdir, timeout=300
+    )
+    if code != 0:
+        return {}
+    return parse_unified_diff(out)
+
+def changed_files(workdir: str, default_branch: str) -> List[str] | None:
+    """Files added/modified/renamed relative to the merge base, or None if there is no usable base."""
+    base = merge_base(workdir, default_branch)
+    if not base:
+        return None
+    code, out = sandbox.run_cmd(f"git diff --name-only --no-color --diff-filter=AMR {base} HEAD", cwd=workdir, timeout=300)
+    if code != 0:
+        return None
+    return [line.strip() for line in out.splitlines() if line.strip()]
+
+def _overlaps(node: ast.AST, ranges: List[Tuple[int, int]]) -> bool:
+    decorators = getattr(node, "decorator_list", [])
+    start = min([node.lineno] + [d.lineno for d in decorators])
+    end = getattr(node, "end_lineno", None) or node.lineno
+    return any(a <= end and b >= start for a, b in ranges)
+
+def changed_symbols(code: str, ranges: List[Tuple[int, int]]) -> List[str]:
+    """Qualified names of the top-level functions/classes (and methods) the ranges touch."""
+    try:
+        tree = ast.parse(code)
+    except Exception:
+        return []
+    symbols: List[str] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and _overlaps(node, ranges):
+            symbols.append(node.name)
+        elif isinstance(node, ast.ClassDef) and _overlaps(node, ranges):
+            methods = [
+                f"{node.name}.{child.name}" for child in node.body
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and _overlaps(child, ranges)
+            ]
+            symbols.extend(methods or [node.name])
+    return symbols
+
+def changed_symbols_by_file(workdir: str, default_branch: str, read_file, index=None) -> Dict[str, List[str]] | None:
+    """Changed symbols per file relative to the merge base, or None if there is no usable base.
+    With a core.index.ProjectIndex the indexed line ranges are used instead of re-parsing."""
+    base = merge_base(workdir, default_branch)
+    if not base:
+        return None
+    result: Dict[str, List[str]] = {}
+    for rel, ranges in changed_hunks(workdir, base).items():
+        if index is not None and rel in index:
+            symbols = index.changed_symbols(rel, ranges)
+        else:
+            symbols = changed_symbols(read_file(rel), ranges)
+        if symbols:
+            result[rel] = symbols
+    return result
@@ -0,0 +1,184 @@
+import functools
+import hashlib
+import os
+import re
+import shutil
+from typing import List, Optional, Tuple
+from . import sandbox
+
+# Content-addressed virtualenv cache.
+#
+# Layout under <root>:
+#   <key>/venv        the environment, built in place (venv scripts embed their path)
+#   <key>/.complete   written last; entries without it are half-built and get rebuilt
+#   <key>/.size       bytes used, recorded at build time for eviction
+#   <key>/.last_used  mtime is bumped on every hit (LRU)
+#   <key>.lock        flock guarding build/evict of <key>
+#
+# Workspaces get a copy (reflinked where the filesystem supports it), never
+# hardlinks: PR code runs in that env and must not be able to write into the
+# shared entry. Requirement sets with editable or local-path entries install
+# the PR's own tree, so they are never cached.
+
+# "-e ...", "--editable ...", "./pkg", "../x", "/abs/path", "file:..." and "name @ file:...".
+LOCAL_REQUIREMENT_RE = re.compile(r"^\s*(-e\b|--editable\b|\.|/|file:)|@\s*file:")
+
+@functools.lru_cache(maxsize=1)
+def python_version() -> str:
+    _, out = sandbox.run_cmd("python -c 'import sys; print(sys.version)'", timeout=60)
+    return out.strip()
+
+def requirement_files(workdir: str, rel: str = "requirements.txt", seen: Optional[set] = None) -> List[str]:
+    # requirements.txt plus anything it pulls in via -r / -c, in a stable order
+    seen = seen if seen is not None else set()
+    path = os.path.normpath(os.path.join(workdir, rel))
+    if path in seen or not os.path.exists(path):
+        return []
+    seen.add(path)
+    files = [path]
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            parts = line.strip().split(maxsplit=1)
+            if len(parts) == 2 and parts[0] in ("-r", "--requirement", "-c", "--constraint"):
+                nested = os.path.join(os.path.dirname(os.path.relpath(path, workdir)), parts[1])
+                files.extend(requirement_files(workdir, nested, seen))
+    return files
+
+def has_local_requirements(workdir: str) -> bool:
+    for path in requirement_files(workdir):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            if any(LOCAL_REQUIREMENT_RE.search(line) for line in f if not line.lstrip().startswith("#")):
+                return True
+    return False
+
+def env_key(workdir: str) -> str:
+    h = hashlib.sha256()
+    h.update(python_version().encode())
+    h.update("\0".join(sandbox.TOOL_PINS).encode())
+    for path in requirement_files(workdir):
+        h.update(os.path.relpath(path, workdir).encode())
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:32]
+
+def _lock_path(root: str, key: str) -> str:
+    return os.path.join(root, f"{key}.lock")
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def _touch(path: str) -> None:
+    with open(path, "a"):
+        pass
+    os.utime(path, None)
+
+def _build(entry: str, workdir: str, seed: str = "") -> bool:
+    shutil.rmtree(entry, ignore_errors=True)
+    os.makedirs(entry)
+    venv = os.path.join(entry, "venv")
+    if seed and os.path.isdir(seed):
+        # A pre-warmed env (pip upgraded, tools installed) from the sandbox pool.
+        shutil.move(seed, venv)
+        rewrite_paths(venv, seed)
+    elif not sandbox.create_venv(venv):
+        shutil.rmtree(entry, ignore_errors=True)
+        return False
+    sandbox.install_requirements(workdir, venv)
+    with open(os.path.join(entry, ".size"), "w") as f:
+        f.write(str(dir_size(venv)))
+    _touch(os.path.join(entry, ".last_used"))
+    _touch(os.path.join(entry, ".complete"))
+    return True
+
+def rewrite_paths(venv: str, old_path: str) -> None:
+    # Rewrite the few text files in bin/ that embed the env's original location
+    # (shebangs, activate scripts) so a copied or moved env is self-contained.
+    old, new = old_path.encode(), venv.encode()
+    bindir = os.path.join(venv, "bin")
+    for name in os.listdir(bindir):
+        path = os.path.join(bindir, name)
+        if os.path.islink(path) or not os.path.isfile(path) or os.path.getsize(path) > 1_000_000:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        if old not in data:
+            continue
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data.replace(old, new))
+        shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+
+def _copy_into(src: str, dest: str) -> None:
+    # Copy the tree (copy-on-write clone where supported), then fix the paths baked into bin/.
+    shutil.rmtree(dest, ignore_errors=True)
+    code, out = sandbox.run_cmd(f"cp -a --reflink=auto {src} {dest}", timeout=600)
+    if code != 0:
+        shutil.rmtree(dest, ignore_errors=True)
+        shutil.copytree(src, dest, symlinks=True)
+    rewrite_paths(dest, src)
+
+def evict(root: str, max_bytes: int, keep: str = "") -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    entries: List[Tuple[float, int, str]] = []
+    for key in os.listdir(root):
+        entry = os.path.join(root, key)
+        if not os.path.isdir(entry):
+            continue
+        try:
+            with open(os.path.join(entry, ".size")) as f:
+                size = int(f.read().strip() or 0)
+            used = os.path.getmtime(os.path.join(entry, ".last_used"))
+        except (OSError, ValueError):
+            size, used = dir_size(entry), 0.0
+        entries.append((used, size, key))
+    total = sum(size for _, size, _ in entries)
+    evicted: List[str] = []
+    for used, size, key in sorted(entries):
+        if key == keep:
+            continue
+        if total <= max_bytes:
+            break
+        with sandbox.file_lock(_lock_path(root, key), blocking=False) as got:
+            # Someone is building or linking this entry right now; leave it.
+            if not got:
+                continue
+            shutil.rmtree(os.path.join(root, key), ignore_errors=True)
+        total -= size
+        evicted.append(key)
+    return evicted
+
+def materialize(root: str, workdir: str, max_bytes: int, seed: str = "") -> Tuple[str, bool]:
+    """Put a ready-to-use .venv into workdir; returns (venv path, cache hit).
+    On a miss, seed (an existing base env) is moved into the cache instead of building one."""
+    dest = os.path.join(workdir, ".venv")
+    if has_local_requirements(workdir):
+        # Not cacheable: build straight into the workspace.
+        shutil.rmtree(dest, ignore_errors=True)
+        if seed and os.path.isdir(seed):
+            shutil.move(seed, dest)
+            rewrite_paths(dest, seed)
+        elif not sandbox.create_venv(dest):
+            return "", False
+        sandbox.install_requirements(workdir, dest)
+        return dest, False
+    key = env_key(workdir)
+    entry = os.path.join(root, key)
+    hit = True
+    with sandbox.file_lock(_lock_path(root, key)):
+        if not os.path.exists(os.path.join(entry, ".complete")):
+            hit = False
+            if not _build(entry, workdir, seed):
+                return "", False
+        _touch(os.path.join(entry, ".last_used"))
+        _copy_into(os.path.join(entry, "venv"), dest)
+    evict(root, max_bytes, keep=key)
+    return dest, hit
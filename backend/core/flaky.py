@@ -0,0 +1,123 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+from django.utils import timezone
+from .models import Project, TestFlakiness
+from . import junit, sandbox
+
+# Flaky tests. After the main run only the failed tests are rerun, N rounds with
+# the tests split across parallel pytest processes; a test that passes on any
+# rerun is flaky, one that fails every time is a real failure. Every run's
+# outcomes are folded into a per-project history, and tests whose history keeps
+# flipping are run in isolation (one process each) instead of in the shared run.
+
+RERUN_PREFIX = ".qa-rerun-"
+# Where the run's stored report is unpacked for the rerun stage.
+REPORT_COPY = ".qa-rerun-report.xml"
+# Isolated reports match sharding.merge_junit's "report-*.xml", so they merge into report.xml.
+ISOLATED_PREFIX = "report-isolated-"
+# Outcomes kept per test, oldest first.
+HISTORY_LENGTH = 64
+PASS, FAIL, FLAKY = "P", "F", "K"
+RERUN_TIMEOUT = 900
+# pytest's exit codes for an unknown node id and for nothing collected: an isolated test that no longer exists.
+MISSING_CODES = (4, 5)
+
+def outcomes(report: str) -> Dict[str, str]:
+    """node id -> outcome for every test case in a JUnit report."""
+    return {junit.node_id(case): case["outcome"] for case in junit.iter_testcases(report)}
+
+def failed_ids(results: Dict[str, str]) -> List[str]:
+    # Collection errors are reported per module, not per test, and are not rerun.
+    return sorted(n for n, outcome in results.items() if outcome in ("failed", "error") and "::" in n)
+
+def _pytest(workdir: str, venv: str, args_name: str, report: str, node_ids: List[str]) -> Tuple[int, str]:
+    args_file = os.path.join(workdir, args_name)
+    with open(args_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(node_ids))
+    pytest_bin = os.path.join(venv, "bin", "pytest")
+    return sandbox.run_cmd(
+        f"{pytest_bin} @{args_file} -q -p no:cacheprovider --disable-warnings -o junit_family=xunit1 --junitxml={report}",
+        cwd=workdir, timeout=RERUN_TIMEOUT, limited=True,
+    )
+
+def rerun(workdir: str, venv: str, node_ids: List[str], times: int, workers: int) -> Dict[str, List[str]]:
+    """Rerun node_ids `times` rounds; every (round, chunk) is its own pytest process and they all
+    run concurrently, up to `workers` at a time. Returns node id -> outcome per round."""
+    chunks = [node_ids[i::workers] for i in range(max(1, min(workers, len(node_ids))))]
+    runs = [(r, i, chunk) for r in range(times) for i, chunk in enumerate(chunks)]
+
+    def one(run: Tuple[int, int, List[str]]) -> Dict[str, str]:
+        r, i, chunk = run
+        report = f"{RERUN_PREFIX}{r}-{i}.xml"
+        _pytest(workdir, venv, f"{RERUN_PREFIX}{r}-{i}.txt", report, chunk)
+        return outcomes(os.path.join(workdir, report))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(runs)))) as pool:
+        results = list(pool.map(one, runs))
+    seen: Dict[str, List[str]] = {n: [] for n in node_ids}
+    for (_, _, chunk), result in zip(runs, results):
+        for n in chunk:
+            # A test missing from the report did not get to run (crash or timeout): count it as failed.
+            seen[n].append(result.get(n, "failed"))
+    return seen
+
+def classify(reruns: Dict[str, List[str]]) -> Set[str]:
+    """The flaky ones: failed in the main run, passed at least once when rerun."""
+    return {n for n, results in reruns.items() if "passed" in results}
+
+def run_isolated(workdir: str, venv: str, node_ids: List[str], workers: int) -> Tuple[int, str]:
+    """Run each test in its own pytest process; returns (worst exit code, combined output)."""
+    def one(item: Tuple[int, str]) -> Tuple[int, str]:
+        i, n = item
+        code, out = _pytest(workdir, venv, f"{RERUN_PREFIX}isolated-{i}.txt", f"{ISOLATED_PREFIX}{i}.xml", [n])
+        return (0 if code in MISSING_CODES else code), out
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(node_ids)))) as pool:
+        results = list(pool.map(one, enumerate(node_ids)))
+    code = max((c for c, _ in results), default=0)
+    out = "\n".join(f"===== isolated {n} =====\n{o}" for n, (_, o) in zip(node_ids, results))
+    return code, out
+
+def score(history: str) -> float:
+    """Share of the recorded runs in which the test was flaky or flipped between pass and fail."""
+    if not history:
+        return 0.0
+    flips = sum(1 for a, b in zip(history, history[1:]) if a != b and FLAKY not in (a, b))
+    return round((history.count(FLAKY) + flips) / len(history), 4)
+
+def record_history(project: Project, results: Dict[str, str], flaky: Set[str]) -> None:
+    """Fold one run's outcomes (node id -> outcome; flaky failures marked by `flaky`) into the history."""
+    symbols: Dict[str, str] = {}
+    for n, outcome in results.items():
+        # Keys are stored truncated, so look them up truncated too.
+        if outcome == "passed":
+            symbols[n[:512]] = PASS
+        elif outcome in ("failed", "error"):
+            symbols[n[:512]] = FLAKY if n in flaky else FAIL
+    if not symbols:
+        return
+    existing = {r.key: r for r in TestFlakiness.objects.filter(project=project, key__in=list(symbols))}
+    now = timezone.now()
+    to_update, to_create = [], []
+    for key, symbol in symbols.items():
+        row = existing.get(key)
+        if row is None:
+            row = TestFlakiness(project=project, key=key)
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        row.history = (row.history + symbol)[-HISTORY_LENGTH:]
+        row.runs += 1
+        row.failures += symbol != PASS
+        row.flaky += symbol == FLAKY
+        row.score = score(row.history)
+        row.updated_at = now
+    TestFlakiness.objects.bulk_update(to_update, ["history", "runs", "failures", "flaky", "score", "updated_at"],
+                                      batch_size=500)
+    TestFlakiness.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+
+def known_flaky(project: Project, threshold: float, limit: int) -> List[str]:
+    """Node ids of the project's tests flaky enough to run in isolation, flakiest first."""
+    return list(TestFlakiness.objects.filter(project=project, score__gte=threshold, flaky__gt=0)
+                .order_by("-score").values_list("key", flat=True)[:limit])
@@ -2,11 +2,25 @@ import hashlib
 import hmac
 import json
 import os
-from typing import Any, Dict, Optional
-from github import Github
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+# Check runs need a GitHub App installation token; with a plain token only the comment is kept.
+GITHUB_CHECKS_ENABLED = os.getenv("GITHUB_CHECKS_ENABLED", "0") == "1"
+# Keep this many requests of the hourly quota in reserve; below it callers wait for the reset.
+GITHUB_RATE_RESERVE = int(os.getenv("GITHUB_RATE_RESERVE", "50"))
+# GitHub asks for at least a second between content-creating requests.
+GITHUB_WRITE_INTERVAL = float(os.getenv("GITHUB_WRITE_INTERVAL", "1.0"))
+GITHUB_MAX_WAIT = int(os.getenv("GITHUB_MAX_WAIT", "900"))
+
+# Hidden marker identifying the sticky summary comment on a PR.
+SUMMARY_MARKER = "<!-- qagnite:summary -->"
 
 def verify_signature(payload: bytes, signature_header: str) -> bool:
     if not WEBHOOK_SECRET:
@@ -14,23 +28,170 @@ def verify_signature(payload: bytes, signature_header: str) -> bool:
     signature = hmac.new(WEBHOOK_SECRET.encode(), payload, hashlib.sha256).hexdigest()
     return hmac.compare_digest(f"sha256={signature}", signature_header or "")
 
-def get_client() -> Optional[Github]:
+class GitHubClient:
+    """Pooled REST client: conditional GETs, rate-limit aware waiting, spaced writes."""
+
+    def __init__(self, token: str, base_url: str = GITHUB_API_URL, reserve: int = GITHUB_RATE_RESERVE,
+                 write_interval: float = GITHUB_WRITE_INTERVAL, max_wait: int = GITHUB_MAX_WAIT):
+        self.base_url = base_url.rstrip("/")
+        self.reserve = reserve
+        self.write_interval = write_interval
+        self.max_wait = max_wait
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        })
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.last_write = 0.0
+        # url -> (etag, parsed body); 304 answers do not count against the quota.
+        self.etags: Dict[str, Tuple[str, Any]] = {}
+        self.requests_sent = 0
+        self.not_modified = 0
+
+    def _wait_for_quota(self) -> None:
+        with self.lock:
+            if self.remaining is None or self.remaining > self.reserve:
+                return
+            wait = self.reset_at - time.time()
+        if wait > 0:
+            time.sleep(min(wait, self.max_wait))
+
+    def _observe(self, resp: requests.Response) -> None:
+        remaining = resp.headers.get("X-RateLimit-Remaining")
+        reset = resp.headers.get("X-RateLimit-Reset")
+        with self.lock:
+            if remaining is not None and remaining.isdigit():
+                self.remaining = int(remaining)
+            if reset is not None and reset.isdigit():
+                self.reset_at = float(reset)
+
+    def _retry_delay(self, resp: requests.Response, attempt: int) -> Optional[float]:
+        # Primary limit: 403/429 with no quota left. Secondary limit: Retry-After.
+        if resp.status_code not in (403, 429) and resp.status_code < 500:
+            return None
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        if resp.headers.get("X-RateLimit-Remaining") == "0":
+            return max(1.0, self.reset_at - time.time())
+        if resp.status_code >= 500 or resp.status_code == 429:
+            return min(60.0, 2.0 ** attempt)
+        return None
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None,
+                retries: int = 3) -> Tuple[int, Any]:
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        writing = method != "GET"
+        for attempt in range(retries + 1):
+            self._wait_for_quota()
+            headers = {}
+            cached = self.etags.get(url) if not writing else None
+            if cached:
+                headers["If-None-Match"] = cached[0]
+            if writing:
+                self.write_lock.acquire()
+                pause = self.last_write + self.write_interval - time.monotonic()
+                if pause > 0:
+                    time.sleep(pause)
+            try:
+                resp = self.session.request(method, url, json=body, headers=headers, timeout=30)
+            except requests.RequestException:
+                resp = None
+            finally:
+                if writing:
+                    self.last_write = time.monotonic()
+                    self.write_lock.release()
+            self.requests_sent += 1
+            if resp is None:
+                if attempt == retries:
+                    return 0, None
+                time.sleep(min(60.0, 2.0 ** attempt))
+                continue
+            self._observe(resp)
+            if resp.status_code == 304 and cached:
+                self.not_modified += 1
+                return 200, cached[1]
+            delay = self._retry_delay(resp, attempt)
+            if delay is not None and attempt < retries and delay <= self.max_wait:
+                time.sleep(delay)
+                continue
+            data = resp.json() if resp.content and "json" in resp.headers.get("Content-Type", "") else None
+            if not writing and resp.status_code == 200 and resp.headers.get("ETag"):
+                self.etags[url] = (resp.headers["ETag"], data)
+            return resp.status_code, data
+        return 0, None
+
+    def find_comment(self, repo_full_name: str, pr_number: int, marker: str = SUMMARY_MARKER) -> Optional[int]:
+        page = 1
+        while True:
+            status, data = self.request("GET", f"/repos/{repo_full_name}/issues/{pr_number}/comments?per_page=100&page={page}")
+            if status != 200 or not data:
+                return None
+            for comment in data:
+                if marker in (comment.get("body") or ""):
+                    return comment["id"]
+            if len(data) < 100:
+                return None
+            page += 1
+
+    def upsert_comment(self, repo_full_name: str, pr_number: int, body: str,
+                       comment_id: Optional[int] = None, marker: str = SUMMARY_MARKER) -> Optional[int]:
+        """Edit the PR's marked comment in place (creating it once). Returns the comment id."""
+        body = f"{marker}\n{body}"
+        if comment_id is None:
+            comment_id = self.find_comment(repo_full_name, pr_number, marker)
+        if comment_id is not None:
+            status, data = self.request("PATCH", f"/repos/{repo_full_name}/issues/comments/{comment_id}", {"body": body})
+            if status == 200:
+                return comment_id
+            if status not in (404, 410):
+                return None
+        status, data = self.request("POST", f"/repos/{repo_full_name}/issues/{pr_number}/comments", {"body": body})
+        return data["id"] if status == 201 and data else None
+
+    def upsert_check_run(self, repo_full_name: str, head_sha: str, name: str, summary: str,
+                         conclusion: Optional[str] = None, check_run_id: Optional[int] = None) -> Optional[int]:
+        payload: Dict[str, Any] = {"name": name, "output": {"title": name, "summary": summary[:65000]}}
+        if conclusion:
+            payload.update(status="completed", conclusion=conclusion)
+        else:
+            payload["status"] = "in_progress"
+        if check_run_id is not None:
+            status, data = self.request("PATCH", f"/repos/{repo_full_name}/check-runs/{check_run_id}", payload)
+        else:
+            status, data = self.request("POST", f"/repos/{repo_full_name}/check-runs", {**payload, "head_sha": head_sha})
+        return data["id"] if status in (200, 201) and data else None
+
+_client: Optional[GitHubClient] = None
+_client_lock = threading.Lock()
+
+def get_client() -> Optional[GitHubClient]:
+    global _client
     if not GITHUB_TOKEN:
         return None
-    return Github(GITHUB_TOKEN)
+    with _client_lock:
+        if _client is None:
+            _client = GitHubClient(GITHUB_TOKEN)
+    return _client
 
-def post_pr_comment(repo_full_name: str, pr_number: int, body: str) -> None:
+def post_pr_comment(repo_full_name: str, pr_number: int, body: str, comment_id: Optional[int] = None) -> Optional[int]:
+    # Sticky: the summary comment is edited on every run instead of adding a new one.
     client = get_client()
     if not client:
-        return
-    repo = client.get_repo(repo_full_name)
-    pr = repo.get_pull(pr_number)
-    pr.create_issue_comment(body)
-
-def create_check_run(repo_full_name: str, head_sha: str, name: str, summary: str, conclusion: Optional[str] = None) -> None:
-    # Simplified: use PR comment for visibility
-    if conclusion:
-        summary = f"[{name}] {conclusion.upper()}\n\n{summary}"
-    # Without GitHub App auth, we fallback to comment on PR list (requires PR number). Caller can post separately.
-    # No-op for now or handled by post_pr_comment.
-    return
+        return None
+    return client.upsert_comment(repo_full_name, pr_number, body, comment_id)
+
+def create_check_run(repo_full_name: str, head_sha: str, name: str, summary: str, conclusion: Optional[str] = None,
+                     check_run_id: Optional[int] = None) -> Optional[int]:
+    client = get_client()
+    if not client or not GITHUB_CHECKS_ENABLED or not head_sha:
+        return None
+    return client.upsert_check_run(repo_full_name, head_sha, name, summary, conclusion, check_run_id)
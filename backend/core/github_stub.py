@@ -0,0 +1,118 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+# Minimal fake of the GitHub REST endpoints the pipeline uses (issue comments and
+# check runs), with ETags and rate-limit headers, for local runs and tests.
+
+COMMENTS_RE = re.compile(r"^/repos/([^/]+/[^/]+)/issues/(\d+)/comments$")
+COMMENT_RE = re.compile(r"^/repos/([^/]+/[^/]+)/issues/comments/(\d+)$")
+CHECKS_RE = re.compile(r"^/repos/([^/]+/[^/]+)/check-runs$")
+CHECK_RE = re.compile(r"^/repos/([^/]+/[^/]+)/check-runs/(\d+)$")
+
+def make_server(host: str = "127.0.0.1", port: int = 0, rate_limit: int = 5000,
+                reset_in: int = 3600) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, data: Any = None, headers: Dict[str, str] | None = None, count: bool = True):
+            srv = self.server
+            with srv.lock:
+                if count:
+                    srv.remaining = max(0, srv.remaining - 1)
+                remaining = srv.remaining
+            payload = json.dumps(data).encode() if data is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("X-RateLimit-Limit", str(rate_limit))
+            self.send_header("X-RateLimit-Remaining", str(remaining))
+            self.send_header("X-RateLimit-Reset", str(int(srv.reset_at)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _limited(self) -> bool:
+            srv = self.server
+            with srv.lock:
+                srv.requests_seen.append((self.command, self.path.split("?")[0]))
+                if time.time() >= srv.reset_at:
+                    srv.remaining, srv.reset_at = rate_limit, time.time() + reset_in
+                exhausted = srv.remaining <= 0
+            if exhausted:
+                self._send(403, {"message": "API rate limit exceeded"}, count=False)
+            return exhausted
+
+        def do_GET(self):
+            if self._limited():
+                return
+            m = COMMENTS_RE.match(self.path.split("?")[0])
+            if not m:
+                return self._send(404, {"message": "Not Found"})
+            srv = self.server
+            with srv.lock:
+                items = [c for c in srv.comments.values() if c["_issue"] == (m.group(1), int(m.group(2)))]
+            data = [{k: v for k, v in c.items() if not k.startswith("_")} for c in items]
+            etag = '"%s"' % hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                # Conditional hits are free on GitHub.
+                return self._send(304, headers={"ETag": etag}, count=False)
+            self._send(200, data, {"ETag": etag})
+
+        def do_POST(self):
+            if self._limited():
+                return
+            path, body, srv = self.path.split("?")[0], self._body(), self.server
+            m = COMMENTS_RE.match(path)
+            if m:
+                with srv.lock:
+                    srv.next_id += 1
+                    comment = {"id": srv.next_id, "body": body.get("body", ""), "_issue": (m.group(1), int(m.group(2)))}
+                    srv.comments[srv.next_id] = comment
+                return self._send(201, {"id": comment["id"], "body": comment["body"]})
+            if CHECKS_RE.match(path):
+                with srv.lock:
+                    srv.next_id += 1
+                    srv.check_runs[srv.next_id] = dict(body, id=srv.next_id)
+                return self._send(201, srv.check_runs[srv.next_id])
+            self._send(404, {"message": "Not Found"})
+
+        def do_PATCH(self):
+            if self._limited():
+                return
+            path, body, srv = self.path.split("?")[0], self._body(), self.server
+            m = COMMENT_RE.match(path) or CHECK_RE.match(path)
+            store = srv.comments if m and m.re is COMMENT_RE else srv.check_runs
+            if not m or int(m.group(2)) not in store:
+                return self._send(404, {"message": "Not Found"})
+            with srv.lock:
+                store[int(m.group(2))].update(body)
+                data = {k: v for k, v in store[int(m.group(2))].items() if not k.startswith("_")}
+            self._send(200, data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.remaining = rate_limit
+    server.reset_at = time.time() + reset_in
+    server.comments = {}
+    server.check_runs = {}
+    server.next_id = 1000
+    server.requests_seen = []
+    return server
+
+def start_in_thread(**kwargs) -> Tuple[ThreadingHTTPServer, str]:
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
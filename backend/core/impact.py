@@ -0,0 +1,220 @@
+import glob
+import json
+import os
+import sqlite3
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from django.db.models import Q
+from django.utils import timezone
+from .models import Project, CoverageMap
+from . import sandbox
+from . import blobs
+from . import diff as diff_mod
+from . import cache as cache_mod
+
+# Test impact analysis. A run on the default branch records which lines every test
+# executes (pytest-cov dynamic contexts) into a per-project coverage map; a PR then
+# only runs the tests whose recorded lines its diff touches, plus test files that
+# are new, changed or unknown to the map. Changes the map cannot see through
+# (config, dependencies, non-Python files) run the full suite.
+
+# Any change to these runs everything.
+FULL_RUN_FILES = {"setup.py", "setup.cfg", "pyproject.toml", "tox.ini", "pytest.ini", "conftest.py", ".coveragerc",
+                  "noxfile.py", "Pipfile", "Pipfile.lock", "poetry.lock", "uv.lock", "MANIFEST.in"}
+# Non-Python files that cannot change test outcomes.
+INERT_SUFFIXES = (".md", ".rst", ".png", ".jpg", ".svg")
+INERT_DIRS = ("docs", ".github")
+# Coverage data/report files written into the workdir.
+MAP_DATA_FILE = ".qa-coverage-map"
+REPORT_GLOB = ".qa-cov-*.json"
+# Context of lines run outside any test (module bodies executed at import time).
+IMPORT_CONTEXT = -1
+# Longest wait after repeated failed map builds.
+MAX_BUILD_BACKOFF = 24 * 3600
+
+def needs_full_run(rel: str) -> bool:
+    name = os.path.basename(rel)
+    if name in FULL_RUN_FILES or (name.startswith("requirements") and name.endswith((".txt", ".in"))):
+        return True
+    if rel.endswith(".py"):
+        return False
+    return not (name.endswith(INERT_SUFFIXES) or rel.split(os.sep)[0] in INERT_DIRS)
+
+def cov_sources(files: Iterable[str]) -> List[str]:
+    # Top-level packages/modules/dirs of the checkout; `--cov=.` would also measure
+    # the venv inside the workspace.
+    tops = set()
+    for rel in files:
+        first = rel.split(os.sep)[0]
+        tops.add(first[:-3] if first.endswith(".py") else first)
+    return sorted(tops)
+
+def coverage_args(sources: List[str], report: str = "", contexts: bool = False) -> str:
+    args = " ".join(f"--cov={s}" for s in sources) or "--cov=."
+    args += " --cov-context=test" if contexts else ""
+    return f"{args} --cov-report=json:{report}" if report else f"{args} --cov-report="
+
+def report_path(tag: str) -> str:
+    return f".qa-cov-{tag}.json"
+
+# --- building maps -----------------------------------------------------------
+
+def _numbits_to_lines(numbits: bytes) -> List[int]:
+    # coverage.py's numbits: bit i of byte j marks line j * 8 + i
+    return [j * 8 + i for j, byte in enumerate(numbits) for i in range(8) if byte & (1 << i)]
+
+def _ranges(lines: Iterable[int]) -> List[List[int]]:
+    out: List[List[int]] = []
+    for n in sorted(set(lines)):
+        if out and out[-1][1] == n - 1:
+            out[-1][1] = n
+        else:
+            out.append([n, n])
+    return out
+
+def read_contexts(data_file: str, workdir: str) -> Dict[str, Any]:
+    """Turn a coverage data file recorded with --cov-context=test into
+    {"tests": [node ids], "files": {rel: {test index: [[start, end], ...]}}}."""
+    conn = sqlite3.connect(f"file:{data_file}?mode=ro", uri=True)
+    try:
+        paths = dict(conn.execute("SELECT id, path FROM file"))
+        contexts = dict(conn.execute("SELECT id, context FROM context"))
+        tests: List[str] = []
+        index: Dict[str, int] = {}
+        for ctx_id, ctx in contexts.items():
+            node_id = ctx.rsplit("|", 1)[0]  # "<node id>|setup/run/teardown"
+            if node_id and node_id not in index:
+                index[node_id] = len(tests)
+                tests.append(node_id)
+        lines: Dict[str, Dict[int, Set[int]]] = {}
+        for file_id, ctx_id, numbits in conn.execute("SELECT file_id, context_id, numbits FROM line_bits"):
+            rel = os.path.relpath(paths[file_id], workdir)
+            node_id = contexts.get(ctx_id, "").rsplit("|", 1)[0]
+            test = index[node_id] if node_id else IMPORT_CONTEXT
+            lines.setdefault(rel, {}).setdefault(test, set()).update(_numbits_to_lines(numbits))
+    finally:
+        conn.close()
+    return {"tests": tests, "files": {rel: {str(t): _ranges(ls) for t, ls in by_test.items()}
+                                      for rel, by_test in lines.items()}}
+
+def store(project: Project, blob_root: str, base_sha: str, data: Dict[str, Any]) -> CoverageMap:
+    key = blobs.put_text(blob_root, json.dumps(data, separators=(",", ":")))
+    return CoverageMap.objects.create(project=project, base_sha=base_sha, blob=key,
+                                      tests=len(data["tests"]), files=len(data["files"]))
+
+def claim_build(project_id: int, lease_ttl: int) -> bool:
+    """Reserve the project's next map build. False while one is pending (requests within lease_ttl)
+    or while a failed build is backing off."""
+    now = timezone.now()
+    return bool(Project.objects.filter(id=project_id)
+                .filter(Q(coverage_map_requested_at__isnull=True)
+                        | Q(coverage_map_requested_at__lt=now - timedelta(seconds=lease_ttl)))
+                .filter(Q(coverage_map_retry_at__isnull=True) | Q(coverage_map_retry_at__lte=now))
+                .update(coverage_map_requested_at=now))
+
+def build_finished(project_id: int, ok: bool, backoff: int) -> None:
+    """Release the reservation; a failure doubles the wait before the next build (from backoff seconds)."""
+    if ok:
+        Project.objects.filter(id=project_id).update(coverage_map_requested_at=None, coverage_map_failures=0,
+                                                     coverage_map_retry_at=None)
+        return
+    failures = (Project.objects.filter(id=project_id).values_list("coverage_map_failures", flat=True).first() or 0) + 1
+    wait = min(backoff * 2 ** (failures - 1), MAX_BUILD_BACKOFF)
+    Project.objects.filter(id=project_id).update(coverage_map_requested_at=None, coverage_map_failures=failures,
+                                                 coverage_map_retry_at=timezone.now() + timedelta(seconds=wait))
+
+def latest(project: Project) -> Optional[CoverageMap]:
+    return CoverageMap.objects.filter(project=project).order_by("-id").first()
+
+def load(blob_root: str, cmap: CoverageMap) -> Optional[Dict[str, Any]]:
+    if not blobs.exists(blob_root, cmap.blob):
+        return None
+    with blobs.open_blob(blob_root, cmap.blob) as f:
+        return json.load(f)
+
+# --- selecting tests ---------------------------------------------------------
+
+def parse_base_side(diff: str) -> Tuple[Dict[str, List[Tuple[int, int]]], Set[str]]:
+    """Old-side line ranges per file of a --no-renames unified diff, plus every path it mentions
+    (binary files have no hunks). Pure insertions touch the lines on either side of the insertion point."""
+    ranges: Dict[str, List[Tuple[int, int]]] = {}
+    paths: Set[str] = set()
+    current = None
+    in_header = False
+    for line in diff.splitlines():
+        if line.startswith("diff --git a/"):
+            paths.add(line[len("diff --git a/"):].split(" b/", 1)[0])
+            current, in_header = None, True
+            continue
+        if in_header and line.startswith("--- "):
+            # Only in the file header: a removed "-- ..." line looks the same.
+            source = line[4:].strip()
+            current = source[2:] if source.startswith("a/") else None
+            if current is not None:
+                ranges.setdefault(current, [])
+            continue
+        m = diff_mod.OLD_HUNK_RE.match(line)
+        if m:
+            in_header = False
+        if m and current is not None:
+            start = int(m.group(1))
+            count = int(m.group(2)) if m.group(2) is not None else 1
+            ranges[current].append((start, start + count - 1) if count else (start, start + 1))
+    return ranges, paths
+
+def _touched(spans: List[List[int]], ranges: List[Tuple[int, int]]) -> bool:
+    return any(a <= e and b >= s for s, e in spans for a, b in ranges)
+
+def select(workdir: str, base_sha: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """{"full": reason} when everything must run, else {"full": "", "tests": node ids whose
+    lines the diff touches, "files": test files to run whole (new or changed)}."""
+    headers: List[str] = []
+
+    def keep(line: str) -> None:
+        # Only headers and hunk markers; the changed lines themselves can be huge.
+        if line.startswith(("diff --git ", "--- ", "+++ ", "@@ ")):
+            headers.append(line)
+
+    code, _ = sandbox.run_stream(f"git diff --unified=0 --no-color --no-renames {base_sha} HEAD", cwd=workdir,
+                                 timeout=300, on_line=keep)
+    if code != 0:
+        return {"full": f"map base {base_sha[:12]} is not in this checkout"}
+    ranges, paths = parse_base_side("\n".join(headers))
+    for rel in sorted(paths):
+        if needs_full_run(rel):
+            return {"full": f"{rel} changed"}
+    tests = data["tests"]
+    selected: Set[str] = set()
+    for rel, rs in ranges.items():
+        by_test = data["files"].get(rel, {})
+        if _touched(by_test.get(str(IMPORT_CONTEXT), []), rs):
+            # Module-level code: every test that ran anything in this file.
+            selected.update(tests[int(t)] for t in by_test if int(t) != IMPORT_CONTEXT)
+            continue
+        selected.update(tests[int(t)] for t, spans in by_test.items()
+                        if int(t) != IMPORT_CONTEXT and _touched(spans, rs))
+    return {"full": "", "tests": selected, "files": {rel for rel in paths if cache_mod.is_test_file(rel)}}
+
+def known_files(data: Dict[str, Any]) -> Set[str]:
+    return {node_id.split("::")[0] for node_id in data["tests"]}
+
+# --- coverage of a run -------------------------------------------------------
+
+def percent_covered(workdir: str) -> float:
+    """Line coverage of the run, merging the JSON reports of all its pytest processes."""
+    executed: Dict[str, Set[int]] = {}
+    statements: Dict[str, Set[int]] = {}
+    for path in glob.glob(os.path.join(workdir, REPORT_GLOB)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for rel, info in report.get("files", {}).items():
+            ran = set(info.get("executed_lines", []))
+            executed.setdefault(rel, set()).update(ran)
+            statements.setdefault(rel, set()).update(ran, info.get("missing_lines", []))
+    total = sum(len(s) for s in statements.values())
+    if not total:
+        return 0.0
+    return round(100.0 * sum(len(s) for s in executed.values()) / total, 2)
@@ -0,0 +1,265 @@
+import ast
+import hashlib
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from django.db.models import F
+from django.utils import timezone
+from .models import Project, SymbolIndexEntry
+from . import sandbox
+from . import cache as cache_mod
+
+# Per-project symbol index. Every Python blob is parsed once into its top-level
+# symbols (with signatures and line ranges) and its raw imports; entries are keyed
+# on the blob, so a push only parses the files it changed. The in-memory
+# ProjectIndex built from them resolves package-correct module names and the local
+# import graph (and its reverse, for the tests affected by a change).
+
+# Bump when parse() output changes shape.
+INDEX_VERSION = "1"
+
+def _signature(node: ast.AST) -> str:
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+def _required_params(node: ast.AST) -> List[str]:
+    args = node.args.posonlyargs + node.args.args
+    names = [a.arg for a in args[:len(args) - len(node.args.defaults)]]
+    return [n for n in names if n not in ("self", "cls")]
+
+def _symbol(node: ast.AST, name: str, kind: str) -> Dict[str, Any]:
+    decorators = getattr(node, "decorator_list", [])
+    sym = {
+        "name": name,
+        "kind": kind,
+        "start": min([node.lineno] + [d.lineno for d in decorators]),
+        "end": getattr(node, "end_lineno", None) or node.lineno,
+    }
+    if kind == "class":
+        bases = ", ".join(ast.unparse(b) for b in node.bases)
+        sym["signature"] = f"class {node.name}({bases})" if bases else f"class {node.name}"
+    else:
+        sym["signature"] = _signature(node)
+        sym["params"] = _required_params(node)
+    return sym
+
+def parse(code: str) -> Dict[str, Any]:
+    """Top-level functions, classes and their methods, plus every import as [level, module, names]."""
+    try:
+        tree = ast.parse(code)
+    except Exception:
+        return {"symbols": [], "imports": [], "error": True}
+    symbols: List[Dict[str, Any]] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(_symbol(node, node.name, "function"))
+        elif isinstance(node, ast.ClassDef):
+            symbols.append(_symbol(node, node.name, "class"))
+            symbols.extend(_symbol(child, f"{node.name}.{child.name}", "method") for child in node.body
+                           if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)))
+    imports: List[List[Any]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend([0, a.name, []] for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append([node.level, node.module or "", [a.name for a in node.names]])
+    return {"symbols": symbols, "imports": imports, "error": False}
+
+def entry_key(blob: str) -> str:
+    return hashlib.sha256(f"{INDEX_VERSION}\0{blob}".encode()).hexdigest()
+
+def tracked_blobs(workdir: str) -> Dict[str, str]:
+    # Blob ids straight from the git index, so unchanged files are never read.
+    code, out = sandbox.run_cmd("git ls-files -s -- '*.py'", cwd=workdir, timeout=120)
+    blobs: Dict[str, str] = {}
+    if code != 0:
+        return blobs
+    for line in out.splitlines():
+        meta, _, rel = line.partition("\t")
+        parts = meta.split()
+        if len(parts) == 3 and rel:
+            blobs[os.path.normpath(rel)] = parts[1]
+    return blobs
+
+def module_name(rel: str, packages: Set[str]) -> str:
+    """Dotted import path of rel: its directory chain up to the first one that is not a package."""
+    parts = rel[:-3].split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    dirs = rel.split(os.sep)[:-1]
+    keep = len(parts)
+    for i in range(len(dirs), 0, -1):
+        if os.sep.join(dirs[:i]) not in packages:
+            keep = len(parts) - i
+            break
+    return ".".join(parts[-keep:]) if keep else os.path.basename(rel)[:-3]
+
+def _outline(sym: Dict[str, Any]) -> str:
+    return f"    {sym['signature']}" if sym["kind"] == "method" else sym["signature"]
+
+class ProjectIndex:
+    """Parsed view of one checkout: rel -> parse() output, plus module and import maps."""
+
+    def __init__(self, entries: Dict[str, Dict[str, Any]]):
+        self.entries = entries
+        packages = {os.path.dirname(rel) for rel in entries if os.path.basename(rel) == "__init__.py"}
+        self.modules = {rel: module_name(rel, packages) for rel in entries}
+        self._by_module: Dict[str, str] = {}
+        for rel, mod in self.modules.items():
+            self._by_module.setdefault(mod, rel)
+        # Lenient fallback (flat and src/ layouts, tests importing by basename).
+        self._by_suffix = cache_mod._module_files(entries)
+        self.imports = {rel: self._resolve(rel) for rel in entries}
+        self._dependents: Dict[str, Set[str]] = {rel: set() for rel in entries}
+        for rel, deps in self.imports.items():
+            for dep in deps:
+                self._dependents[dep].add(rel)
+
+    def __contains__(self, rel: str) -> bool:
+        return rel in self.entries
+
+    def symbols(self, rel: str) -> List[Dict[str, Any]]:
+        return self.entries.get(rel, {}).get("symbols", [])
+
+    def lookup(self, dotted: str) -> Optional[str]:
+        return self._by_module.get(dotted) or self._by_suffix.get(dotted)
+
+    def _targets(self, rel: str) -> Iterable[Tuple[str, List[str]]]:
+        # (absolute module, imported names) for every import of rel
+        package = self.modules[rel].split(".")
+        if os.path.basename(rel) != "__init__.py":
+            package = package[:-1]
+        for level, module, names in self.entries[rel].get("imports", []):
+            if level:
+                base = package[:len(package) - (level - 1)] if level - 1 <= len(package) else []
+                module = ".".join(base + ([module] if module else []))
+            if module:
+                yield module, names
+
+    def _resolve(self, rel: str) -> Set[str]:
+        deps: Set[str] = set()
+        for module, names in self._targets(rel):
+            # `import a.b.c` runs a/__init__, a/b/__init__ and a/b/c; `from a import b` may name a submodule.
+            pieces = module.split(".")
+            candidates = [".".join(pieces[:i]) for i in range(1, len(pieces) + 1)]
+            candidates += [f"{module}.{n}" for n in names if n != "*"]
+            for name in candidates:
+                dep = self.lookup(name)
+                if dep and dep != rel:
+                    deps.add(dep)
+        return deps
+
+    def imported_symbols(self, rel: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Local symbols rel pulls in with `from x import name`, as (file, symbol)."""
+        found = []
+        for module, names in self._targets(rel):
+            dep = self.lookup(module)
+            if not dep:
+                continue
+            by_name = {s["name"]: s for s in self.symbols(dep)}
+            for n in names:
+                if n in by_name:
+                    found.append((dep, by_name[n]))
+                    if by_name[n]["kind"] == "class":
+                        found.extend((dep, s) for s in self.symbols(dep) if s["name"].startswith(f"{n}."))
+        return found
+
+    def changed_symbols(self, rel: str, ranges: List[Tuple[int, int]]) -> List[str]:
+        """Same rules as diff.changed_symbols, from the stored line ranges."""
+        def touched(s: Dict[str, Any]) -> bool:
+            return any(a <= s["end"] and b >= s["start"] for a, b in ranges)
+        out: List[str] = []
+        syms = self.symbols(rel)
+        for s in syms:
+            if s["kind"] == "function" and touched(s):
+                out.append(s["name"])
+            elif s["kind"] == "class" and touched(s):
+                methods = [m["name"] for m in syms if m["kind"] == "method"
+                           and m["name"].startswith(f"{s['name']}.") and touched(m)]
+                out.extend(methods or [s["name"]])
+        return out
+
+    def dependents(self, rels: Iterable[str]) -> Set[str]:
+        """rels plus every file that (transitively) imports one of them."""
+        seen: Set[str] = set()
+        todo = [r for r in rels if r in self._dependents]
+        while todo:
+            rel = todo.pop()
+            if rel in seen:
+                continue
+            seen.add(rel)
+            todo.extend(self._dependents[rel] - seen)
+        return seen
+
+    def affected_tests(self, changed: Iterable[str]) -> List[str]:
+        """Test files that import a changed file, directly or not, or sit under a changed conftest.py."""
+        changed = list(changed)
+        affected = {rel for rel in self.dependents(changed) if cache_mod.is_test_file(rel)}
+        for rel in changed:
+            if os.path.basename(rel) == "conftest.py":
+                scope = os.path.dirname(rel)
+                affected.update(t for t in self.entries if cache_mod.is_test_file(t)
+                                and (not scope or t.startswith(scope + os.sep)))
+        return sorted(affected)
+
+    def context(self, rel: str, code: str, only: Optional[List[str]] = None, budget: int = 8000) -> str:
+        """Prompt context for rel: the source of the targeted symbols (the whole file when it fits and
+        nothing is targeted), then signatures of the rest of the module and of what it imports."""
+        lines = code.splitlines()
+        syms = self.symbols(rel)
+        if not only and len(code) <= budget:
+            parts = [code]
+            shown = {s["name"] for s in syms}
+        else:
+            wanted = {o.split(".")[0] for o in only} if only else {s["name"] for s in syms if "." not in s["name"]}
+            targets = [s for s in syms if "." not in s["name"] and s["name"] in wanted]
+            parts = ["\n".join(lines[s["start"] - 1:s["end"]]) for s in targets]
+            shown = {s["name"] for s in syms if s["name"].split(".")[0] in wanted}
+        outline = [_outline(s) for s in syms if s["name"] not in shown]
+        if outline:
+            parts.append(f"# Other definitions in {self.modules.get(rel, rel)}:\n" + "\n".join(outline))
+        imported: Dict[str, List[str]] = {}
+        for dep, s in self.imported_symbols(rel):
+            imported.setdefault(self.modules[dep], []).append(_outline(s))
+        for module, sigs in imported.items():
+            parts.append(f"# From {module}:\n" + "\n".join(sigs))
+        text = ""
+        for part in parts:
+            if text and len(text) + len(part) + 2 > budget:
+                break
+            text = f"{text}\n\n{part}" if text else part
+        return text[:budget]
+
+def build(project: Project, workdir: str, files: List[str], read_file) -> Tuple[ProjectIndex, int, int]:
+    """Index files, parsing only blobs the project has not seen. Returns (index, hits, misses)."""
+    known = tracked_blobs(workdir)
+    blobs: Dict[str, str] = {}
+    for rel in files:
+        blob = known.get(rel)
+        if blob is None:
+            try:
+                blob = cache_mod.blob_sha(read_file(rel))
+            except (OSError, UnicodeDecodeError):
+                continue
+        blobs[rel] = blob
+    keys = {rel: entry_key(blob) for rel, blob in blobs.items()}
+    rows = {key: (pk, symbols, imports) for pk, key, symbols, imports in SymbolIndexEntry.objects
+            .filter(project=project, key__in=set(keys.values())).values_list("id", "key", "symbols", "imports")}
+    if rows:
+        SymbolIndexEntry.objects.filter(id__in=[r[0] for r in rows.values()]).update(
+            hits=F("hits") + 1, last_used_at=timezone.now())
+    entries: Dict[str, Dict[str, Any]] = {}
+    fresh: Dict[str, SymbolIndexEntry] = {}
+    for rel, key in keys.items():
+        if key in rows:
+            _, symbols, imports = rows[key]
+            entries[rel] = {"symbols": symbols, "imports": imports}
+            continue
+        parsed = entries[rel] = parse(read_file(rel))
+        fresh.setdefault(key, SymbolIndexEntry(project=project, key=key, blob_sha=blobs[rel],
+                                               symbols=parsed["symbols"], imports=parsed["imports"]))
+    # Files that do not parse are indexed (empty) too, so they are not re-parsed every run.
+    SymbolIndexEntry.objects.bulk_create(list(fresh.values()), batch_size=500, ignore_conflicts=True)
+    hits = sum(1 for key in keys.values() if key in rows)
+    cache_mod.record(project, "index", hits, len(keys) - hits)
+    return ProjectIndex(entries), hits, len(keys) - hits
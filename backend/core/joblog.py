@@ -0,0 +1,73 @@
+import datetime
+import threading
+import time
+from typing import Any, Dict, List
+from django.db import transaction
+from django.db.models import Max
+from .models import Job, JobLogChunk
+
+# Job logs are stored as append-only chunks instead of rewriting Job.logs, so
+# writing a log is O(chunk) and readers can tail with a cursor. The cursor is a
+# per-job sequence, not the row id: shards write concurrently, and ids can commit
+# out of order, so a reader past id N could skip a chunk committed later with a
+# smaller id. Sequences are assigned under the job's row lock, held to commit,
+# so they become visible in order.
+
+def stamp(msg: str) -> str:
+    return f"{datetime.datetime.utcnow().isoformat()}Z {msg}\n"
+
+def append(job: Job, text: str) -> None:
+    if text:
+        with transaction.atomic():
+            Job.objects.select_for_update().filter(id=job.id).values_list("id", flat=True).first()
+            last = JobLogChunk.objects.filter(job_id=job.id).aggregate(m=Max("seq"))["m"] or 0
+            JobLogChunk.objects.create(job_id=job.id, seq=last + 1, text=text)
+
+class JobLogWriter:
+    """Buffers lines and flushes them as one chunk per `max_lines`/`max_chars`/`interval`.
+    Safe to share between the threads streaming pytest shards."""
+
+    def __init__(self, job: Job, max_lines: int = 200, max_chars: int = 64 * 1024, interval: float = 2.0):
+        self.job = job
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.interval = interval
+        self.buffer: List[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(self, line: str) -> None:
+        if not line.endswith("\n"):
+            line += "\n"
+        with self.lock:
+            self.buffer.append(line)
+            self.size += len(line)
+            if (len(self.buffer) >= self.max_lines or self.size >= self.max_chars
+                    or time.monotonic() - self.last_flush >= self.interval):
+                self._flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.buffer:
+            append(self.job, "".join(self.buffer))
+            self.buffer = []
+            self.size = 0
+        self.last_flush = time.monotonic()
+
+    def __enter__(self) -> "JobLogWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
+
+def read_after(job_id: int, after: int = 0, limit: int = 200) -> List[Dict[str, Any]]:
+    rows = JobLogChunk.objects.filter(job_id=job_id, seq__gt=after).order_by("seq").values("seq", "text")[:limit]
+    return list(rows)
+
+def full_text(job: Job) -> str:
+    # Jobs from before chunked logging still carry their text in Job.logs.
+    return job.logs + "".join(job.log_chunks.order_by("seq").values_list("text", flat=True))
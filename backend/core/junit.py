@@ -0,0 +1,146 @@
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, List, Tuple
+from xml.sax.saxutils import quoteattr
+from .models import Failure, TestRun
+
+# Incremental JUnit handling: reports are walked with iterparse and every
+# element is cleared once consumed, so memory stays flat however big the report.
+
+TRACE_LOCATION_RE = re.compile(r"^(\S+\.py):(\d+):", re.MULTILINE)
+
+def _release(parent: ET.Element | None, elem: ET.Element) -> None:
+    # Drop the consumed testcase entirely so the suite does not accumulate children.
+    elem.clear()
+    if parent is not None:
+        try:
+            parent.remove(elem)
+        except ValueError:
+            pass
+
+def _outcome(elem: ET.Element) -> Tuple[str, ET.Element | None]:
+    for tag, outcome in (("failure", "failed"), ("error", "error"), ("skipped", "skipped")):
+        child = elem.find(tag)
+        if child is not None:
+            return outcome, child
+    return "passed", None
+
+def node_id(case: Dict[str, Any]) -> str:
+    # Best-effort pytest node id from classname/name (or the xunit1 file attribute).
+    classname, name = case["classname"], case["name"]
+    path = case["file"]
+    if path and not classname:
+        # Collection errors: the "name" is the module itself.
+        return path
+    if path and path.endswith(".py"):
+        module = path[:-3].replace(os.sep, ".")
+        rest = classname[len(module) + 1:] if classname.startswith(module + ".") else ""
+        return "::".join([path] + ([*rest.split(".")] if rest else []) + [name])
+    return f"{classname}::{name}" if classname else name
+
+def iter_testcases(path: str) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    suite = None
+    try:
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                if elem.tag == "testsuite":
+                    suite = elem
+                continue
+            if elem.tag != "testcase":
+                continue
+            outcome, detail = _outcome(elem)
+            stacktrace = (detail.text or "") if detail is not None else ""
+            file = elem.get("file", "")
+            # pytest writes a 0-based line number
+            line = int(elem.get("line")) + 1 if elem.get("line") else 0
+            if not file and stacktrace:
+                # xunit2 omits file/line; the last frame of the traceback is the best location.
+                hits = TRACE_LOCATION_RE.findall(stacktrace)
+                if hits:
+                    file, line = hits[-1][0], int(hits[-1][1])
+            yield {
+                "classname": elem.get("classname", ""),
+                "name": elem.get("name", ""),
+                "file": file,
+                "line": line,
+                "time": float(elem.get("time") or 0),
+                "outcome": outcome,
+                "message": detail.get("message", "") if detail is not None else "",
+                "type": detail.get("type", "") if detail is not None else "",
+                "stacktrace": stacktrace,
+            }
+            _release(suite, elem)
+    except ET.ParseError:
+        return
+
+def ingest(path: str, test_run: TestRun, batch_size: int = 500) -> Tuple[Dict[str, int], List[Tuple[str, float]]]:
+    """Stream a report into Failure rows. Returns outcome totals and (junit key, seconds) per case."""
+    totals = {"passed": 0, "failed": 0, "errors": 0, "skipped": 0}
+    durations: List[Tuple[str, float]] = []
+    pending: List[Failure] = []
+    for case in iter_testcases(path):
+        durations.append((f"{case['classname']}::{case['name']}", case["time"]))
+        outcome = case["outcome"]
+        totals["errors" if outcome == "error" else outcome] += 1
+        if outcome not in ("failed", "error"):
+            continue
+        pending.append(Failure(
+            test_run=test_run,
+            test_name=node_id(case)[:512],
+            file=case["file"][:512],
+            line=case["line"],
+            message=case["message"],
+            stacktrace=case["stacktrace"],
+            failure_type=(case["type"] or outcome)[:128],
+            duration=case["time"],
+        ))
+        if len(pending) >= batch_size:
+            Failure.objects.bulk_create(pending)
+            pending = []
+    if pending:
+        Failure.objects.bulk_create(pending)
+    return totals, durations
+
+def file_outcomes(path: str, test_files) -> Dict[str, Dict[str, int]]:
+    """Per test file counts of passed/failed (failures+errors)."""
+    by_module = {rel[:-3].replace(os.sep, "."): rel for rel in test_files}
+    out: Dict[str, Dict[str, int]] = {}
+    for case in iter_testcases(path):
+        classname = case["classname"]
+        rel = next((r for m, r in by_module.items() if classname == m or classname.startswith(m + ".")), None)
+        if rel is None:
+            continue
+        counts = out.setdefault(rel, {"passed": 0, "failed": 0})
+        if case["outcome"] in ("failed", "error"):
+            counts["failed"] += 1
+        elif case["outcome"] == "passed":
+            counts["passed"] += 1
+    return out
+
+def merge(paths: List[str], dest: str) -> None:
+    """Concatenate reports into one <testsuites>, copying one testcase at a time."""
+    with open(dest, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>')
+        for path in paths:
+            suite = None
+            try:
+                for event, elem in ET.iterparse(path, events=("start", "end")):
+                    if elem.tag == "testsuite" and event == "start":
+                        suite = elem
+                        attrs = "".join(f" {k}={quoteattr(v)}" for k, v in elem.attrib.items())
+                        out.write(f"<testsuite{attrs}>")
+                    elif elem.tag == "testsuite":
+                        out.write("</testsuite>")
+                        suite = None
+                    elif elem.tag == "testcase" and event == "end":
+                        elem.tail = None
+                        out.write(ET.tostring(elem, encoding="unicode"))
+                        _release(suite, elem)
+            except ET.ParseError:
+                # Truncated shard report (e.g. killed worker): keep what was read.
+                if suite is not None:
+                    out.write("</testsuite>")
+        out.write("</testsuites>\n")
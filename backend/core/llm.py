@@ -0,0 +1,322 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from . import tracing
+
+HF_API_URL = os.getenv("HF_INFERENCE_API_URL")
+HF_API_KEY = os.getenv("HF_API_KEY")
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "120"))
+# Prompts shorter than LLM_BATCH_MAX_CHARS are sent LLM_BATCH_SIZE at a time as
+# {"inputs": [...]}, which HF text-generation endpoints accept. 1 disables batching.
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "4"))
+LLM_BATCH_MAX_CHARS = int(os.getenv("LLM_BATCH_MAX_CHARS", "4000"))
+# Generated tokens allowed per prompt (0 = the server's default).
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+
+# "hf" (remote endpoint above) or "local"; empty picks local when LOCAL_LLM_URL is set.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "")
+# CPU-local model server speaking the llama.cpp server API (POST /completion, streamed),
+# e.g. `llama-server -m model.gguf --parallel 4 --cont-batching`.
+LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "")
+# Requests kept in flight per worker process; match the server's --parallel slots.
+LOCAL_LLM_SLOTS = int(os.getenv("LOCAL_LLM_SLOTS", "4"))
+# Seconds from submission (queueing included) a local prompt may take; past it the request
+# is dropped and the file falls back to the heuristic generator. 0 disables.
+LLM_SLO_SECONDS = float(os.getenv("LLM_SLO_SECONDS", "60"))
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Truncated(Exception):
+    """The completion stopped at the token budget (or the context window) instead of finishing."""
+
+def _generated(item: Dict[str, Any]) -> Optional[str]:
+    # Output cut at max_new_tokens is an incomplete file: treated like a failed call, never cached.
+    if (item.get("details") or {}).get("finish_reason") == "length":
+        return None
+    return item.get("generated_text", "")
+
+def _texts(data: Any) -> List[Optional[str]]:
+    # Normalize the shapes HF endpoints return into one text per input (None if truncated).
+    if isinstance(data, dict):
+        return [_generated(data)]
+    if isinstance(data, list):
+        out: List[Optional[str]] = []
+        for item in data:
+            if isinstance(item, list):
+                out.append(_generated(item[0]) if item else "")
+            elif isinstance(item, dict):
+                out.append(_generated(item))
+            else:
+                out.append(str(item))
+        return out
+    return [str(data)]
+
+class LLMClient:
+    # Remote HF text-generation endpoint.
+    label = "HF model"
+
+    def __init__(self, url: str, api_key: str, concurrency: int = LLM_CONCURRENCY,
+                 rate: float = LLM_RATE_PER_SEC, burst: int = LLM_BURST, max_retries: int = LLM_MAX_RETRIES,
+                 timeout: int = LLM_TIMEOUT, batch_size: int = LLM_BATCH_SIZE,
+                 batch_max_chars: int = LLM_BATCH_MAX_CHARS, max_tokens: int = LLM_MAX_TOKENS):
+        self.url = url
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.batch_max_chars = batch_max_chars
+        self.max_tokens = max_tokens
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self.requests_sent = 0
+
+    def _post(self, inputs: Any) -> Optional[requests.Response]:
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with tracing.span("llm.request", batch=len(inputs) if isinstance(inputs, list) else 1,
+                              attempt=attempt) as sp:
+                body: dict = {"inputs": inputs}
+                if self.max_tokens > 0:
+                    body["parameters"] = {"max_new_tokens": self.max_tokens, "details": True}
+                try:
+                    resp = self.session.post(self.url, json=body, timeout=self.timeout)
+                except requests.RequestException:
+                    resp = None
+                if resp is not None:
+                    sp.update(exit_code=resp.status_code, bytes=len(resp.content))
+            self.requests_sent += 1
+            if resp is not None and resp.status_code not in RETRY_STATUSES:
+                return resp
+            if attempt == self.max_retries:
+                return resp
+            delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+            retry_after = resp.headers.get("Retry-After") if resp is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+        return None
+
+    def generate(self, prompt: str) -> Optional[str]:
+        resp = self._post(prompt)
+        if resp is None or resp.status_code != 200:
+            return None
+        try:
+            texts = _texts(resp.json())
+            return texts[0] if texts else ""
+        except Exception:
+            # Some endpoints return raw text
+            return resp.text
+
+    def _generate_batch(self, prompts: List[str]) -> List[Optional[str]]:
+        if len(prompts) == 1:
+            return [self.generate(prompts[0])]
+        resp = self._post(prompts)
+        if resp is not None and resp.status_code == 200:
+            try:
+                texts = _texts(resp.json())
+                if len(texts) == len(prompts):
+                    return list(texts)
+            except Exception:
+                pass
+        # Endpoint does not batch (or answered oddly); fall back to one request each.
+        return [self.generate(p) for p in prompts]
+
+    def generate_many(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate for all prompts concurrently, preserving order."""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for i, p in enumerate(prompts):
+            if len(p) > self.batch_max_chars or self.batch_size == 1:
+                batches.append([i])
+                continue
+            current.append(i)
+            if len(current) == self.batch_size:
+                batches.append(current)
+                current = []
+        if current:
+            batches.append(current)
+
+        results: List[Optional[str]] = [None] * len(prompts)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self._generate_batch, [prompts[i] for i in b]): b for b in batches}
+            for fut, idxs in futures.items():
+                for i, text in zip(idxs, fut.result()):
+                    results[i] = text
+        return results
+
+class LocalLLMClient:
+    """CPU-local model server (llama.cpp `llama-server`, or anything serving its /completion API).
+
+    Prompts from every caller in the process go into one queue drained by `slots`
+    threads. A slot takes the next prompt as soon as its current one finishes, so
+    the server's continuous batch stays full across files (and the PRs sharing the
+    worker) instead of waiting for fixed-size batches. Output is streamed, which lets
+    a request be cut at its token budget or its latency SLO; a dropped request
+    returns None, like a failed remote call."""
+    label = "local model"
+
+    def __init__(self, url: str, slots: int = LOCAL_LLM_SLOTS, max_tokens: int = LLM_MAX_TOKENS,
+                 slo: float = LLM_SLO_SECONDS, timeout: int = LLM_TIMEOUT):
+        self.url = url.rstrip("/") + "/completion"
+        self.slots = max(1, slots)
+        self.max_tokens = max_tokens
+        self.slo = slo
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.slots)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.queue: "queue.Queue[Tuple[str, float, Future]]" = queue.Queue()
+        self.workers: List[threading.Thread] = []
+        self.lock = threading.Lock()
+        self.requests_sent = 0
+        self.slo_missed = 0
+        self.truncated = 0
+
+    def stream(self, prompt: str, read_timeout: Optional[float] = None) -> Iterator[str]:
+        """Yield the completion piece by piece (about a token each) as the server produces it.
+        Raises Truncated if the server reports stopping at the token budget, or the stream ends
+        without its final chunk."""
+        body = {"prompt": prompt, "stream": True, "cache_prompt": True}
+        if self.max_tokens > 0:
+            body["n_predict"] = self.max_tokens
+        with self.session.post(self.url, json=body, stream=True,
+                               timeout=(5, read_timeout or self.timeout)) as resp:
+            resp.raise_for_status()
+            tokens = 0
+            for line in resp.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                chunk = json.loads(line[len(b"data: "):])
+                if chunk.get("content"):
+                    tokens += 1
+                    yield chunk["content"]
+                if chunk.get("stop"):
+                    if chunk.get("stopped_limit") or chunk.get("truncated"):
+                        raise Truncated(f"stopped at {tokens} tokens")
+                    return
+                # The server enforces n_predict and flags it on the stop chunk; this only guards against
+                # one that ignores it (pieces are roughly, not exactly, tokens).
+                if 0 < self.max_tokens < tokens:
+                    raise Truncated(f"went past the {self.max_tokens} token budget")
+            raise Truncated("stream ended before the final chunk")
+
+    def _complete(self, prompt: str, deadline: float) -> Optional[str]:
+        if time.monotonic() >= deadline:
+            # Spent its SLO waiting for a slot.
+            self.slo_missed += 1
+            return None
+        parts: List[str] = []
+        with tracing.span("llm.request", backend="local") as sp:
+            started = time.monotonic()
+            pieces = self.stream(prompt, min(self.timeout, deadline - started))
+            try:
+                for piece in pieces:
+                    if not parts:
+                        sp["ttft"] = round(time.monotonic() - started, 3)
+                    parts.append(piece)
+                    if time.monotonic() > deadline:
+                        # Closing the stream makes the server stop generating for this slot.
+                        sp["slo_missed"] = True
+                        self.slo_missed += 1
+                        return None
+            except Truncated:
+                sp["truncated"] = True
+                self.truncated += 1
+                return None
+            except (requests.RequestException, ValueError) as exc:
+                sp["error"] = type(exc).__name__
+                return None
+            finally:
+                pieces.close()
+                self.requests_sent += 1
+                sp["tokens"] = len(parts)
+        return "".join(parts)
+
+    def _slot(self) -> None:
+        while True:
+            prompt, deadline, fut = self.queue.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(self._complete(prompt, deadline))
+            except Exception as exc:
+                fut.set_exception(exc)
+
+    def submit(self, prompt: str) -> "Future[Optional[str]]":
+        with self.lock:
+            while len(self.workers) < self.slots:
+                worker = threading.Thread(target=self._slot, name=f"llm-slot-{len(self.workers)}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        fut: "Future[Optional[str]]" = Future()
+        self.queue.put((prompt, time.monotonic() + self.slo if self.slo > 0 else float("inf"), fut))
+        return fut
+
+    def generate(self, prompt: str) -> Optional[str]:
+        return self.submit(prompt).result()
+
+    def generate_many(self, prompts: List[str]) -> List[Optional[str]]:
+        """Queue all prompts at once and wait for them, preserving order."""
+        futures = [self.submit(p) for p in prompts]
+        return [f.result() for f in futures]
+
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+def backend() -> str:
+    return LLM_BACKEND or ("local" if LOCAL_LLM_URL else "hf")
+
+def backend_id() -> Optional[str]:
+    """What would generate the tests ("<backend>:<url>:<token budget>"), or None when no backend is configured."""
+    if backend() == "local":
+        return f"local:{LOCAL_LLM_URL}:{LLM_MAX_TOKENS}" if LOCAL_LLM_URL else None
+    return f"hf:{HF_API_URL}:{LLM_MAX_TOKENS}" if HF_API_URL and HF_API_KEY else None
+
+def get_client() -> Optional[Any]:
+    """The process-wide LLMClient or LocalLLMClient, per LLM_BACKEND."""
+    global _client
+    if backend_id() is None:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = LocalLLMClient(LOCAL_LLM_URL) if backend() == "local" else LLMClient(HF_API_URL, HF_API_KEY)
+    return _client
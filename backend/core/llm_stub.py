@@ -0,0 +1,74 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+# Offline stand-in for an HF text-generation endpoint, for benchmarks and local runs.
+# POST /completion answers like a llama.cpp server instead, streaming the text as
+# server-sent events one word at a time over the request's latency.
+
+STUB_TEST = """import pytest
+
+def test_stub_generated():
+    assert True
+"""
+
+def make_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.2,
+                error_rate: float = 0.0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            inputs = body.get("inputs", "")
+            self.server.requests_seen += 1
+            if random.random() < error_rate:
+                self.send_response(random.choice([429, 503]))
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            if self.path.rstrip("/").endswith("/completion"):
+                self._stream(body)
+                return
+            time.sleep(latency)
+            if isinstance(inputs, list):
+                data = [[{"generated_text": STUB_TEST}] for _ in inputs]
+            else:
+                data = [{"generated_text": STUB_TEST}]
+            payload = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _stream(self, body):
+            words = STUB_TEST.split(" ")
+            budget = body.get("n_predict", -1)
+            limited = 0 < budget < len(words)
+            if limited:
+                words = words[:budget]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, word in enumerate(words):
+                time.sleep(latency / len(words))
+                piece = word if i == len(words) - 1 else word + " "
+                self.wfile.write(f"data: {json.dumps({'content': piece, 'stop': False})}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(f"data: {json.dumps({'content': '', 'stop': True, 'stopped_limit': limited})}\n\n".encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.requests_seen = 0
+    return server
+
+def start_in_thread(**kwargs) -> Tuple[ThreadingHTTPServer, str]:
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/"
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from core.github_stub import make_server
+
+class Command(BaseCommand):
+    help = "Serve a fake GitHub REST API for comments and check runs (point GITHUB_API_URL at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument("--rate-limit", type=int, default=5000, help="requests per window")
+        parser.add_argument("--reset-in", type=int, default=3600, help="seconds per rate-limit window")
+
+    def handle(self, *args, **opts):
+        server = make_server(opts["host"], opts["port"], opts["rate_limit"], opts["reset_in"])
+        self.stdout.write(f"GitHub stub listening on http://{opts['host']}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
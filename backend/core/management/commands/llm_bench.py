@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from core.llm import LLMClient, LocalLLMClient
+from core.llm_stub import start_in_thread
+
+class Command(BaseCommand):
+    help = "Measure LLM client throughput against the local stub (or --url)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="", help="endpoint to hit; defaults to an in-process stub")
+        parser.add_argument("--prompts", type=int, default=100)
+        parser.add_argument("--prompt-chars", type=int, default=1500)
+        parser.add_argument("--latency", type=float, default=0.2)
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--rate", type=float, default=0, help="requests/s, 0 = unlimited")
+        parser.add_argument("--batch-size", type=int, default=4)
+        parser.add_argument("--slots", type=int, default=4, help="in-flight requests for the local backend")
+        parser.add_argument("--slo", type=float, default=0, help="local backend latency SLO in seconds, 0 = none")
+
+    def handle(self, *args, **opts):
+        url = opts["url"]
+        if not url:
+            _, url = start_in_thread(latency=opts["latency"], error_rate=opts["error_rate"])
+        prompts = [("x" * opts["prompt_chars"]) + str(i) for i in range(opts["prompts"])]
+        configs = [
+            ("sequential", dict(concurrency=1, batch_size=1)),
+            ("pooled", dict(concurrency=opts["concurrency"], batch_size=opts["batch_size"])),
+        ]
+        clients = [(name, LLMClient(url, "bench", rate=opts["rate"], burst=max(1, opts["concurrency"]), **cfg))
+                   for name, cfg in configs]
+        clients.append(("local", LocalLLMClient(url, slots=opts["slots"], slo=opts["slo"])))
+        for name, client in clients:
+            t0 = time.perf_counter()
+            out = client.generate_many(prompts)
+            dt = time.perf_counter() - t0
+            ok = sum(1 for o in out if o)
+            self.stdout.write(
+                f"{name:<11} {len(prompts)} prompts in {dt:.2f}s ({len(prompts) / dt:.1f}/s), "
+                f"{client.requests_sent} requests, {ok} ok"
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from core.llm_stub import make_server
+
+class Command(BaseCommand):
+    help = "Serve a fake HF inference endpoint (point HF_INFERENCE_API_URL or LOCAL_LLM_URL at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with 429/503")
+
+    def handle(self, *args, **opts):
+        server = make_server(opts["host"], opts["port"], opts["latency"], opts["error_rate"])
+        self.stdout.write(f"LLM stub listening on http://{opts['host']}:{server.server_address[1]}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
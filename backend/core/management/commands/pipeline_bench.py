@@ -0,0 +1,193 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from core import bench
+from core import sandbox
+from core import junit
+from core import index as index_mod
+from core import ai as ai_mod
+from core.models import Project, PullRequest, Job, TestRun, Failure, Span, WebhookDelivery
+from core.views import gh_webhook
+from core.tasks import orchestrate_pr
+
+STAGES = ("files", "generate", "cluster", "junit", "webhook", "pipeline")
+
+class Command(BaseCommand):
+    help = ("Benchmark pipeline stages (and optionally a full orchestrate_pr run) on a synthetic repo "
+            "served from local git, with the LLM and GitHub stubbed in-process.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stages", default="files,generate,cluster,junit,webhook",
+                            help=f"comma separated, from {', '.join(STAGES)}")
+        parser.add_argument("--files", type=int, default=50, help="modules in the synthetic repo")
+        parser.add_argument("--functions", type=int, default=10, help="functions (and tests) per module")
+        parser.add_argument("--failing", type=int, default=5, help="failing tests in the synthetic repo")
+        parser.add_argument("--changed", type=int, default=5, help="modules the synthetic PR changes")
+        parser.add_argument("--failures", type=int, default=2000, help="failures to cluster")
+        parser.add_argument("--junit-cases", type=int, default=5000)
+        parser.add_argument("--junit-failing", type=int, default=500)
+        parser.add_argument("--webhooks", type=int, default=100, help="deliveries per webhook round")
+        parser.add_argument("--llm-latency", type=float, default=0.0)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", default="", help="write the results to this file")
+        parser.add_argument("--baseline", default="", help="fail on regressions against this --json output")
+        parser.add_argument("--tolerance", type=float, default=0.25)
+
+    def handle(self, *args, **opts):
+        stages = [s for s in opts["stages"].split(",") if s]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise CommandError(f"unknown stages: {', '.join(sorted(unknown))}")
+        root = tempfile.mkdtemp(prefix="qa-bench-")
+        results = {}
+        try:
+            t0 = time.perf_counter()
+            bare, head = bench.make_repo(os.path.join(root, "git"), opts["files"], opts["functions"], opts["failing"],
+                                         opts["changed"], opts["seed"])
+            self.stdout.write(f"synthetic repo: {opts['files']} modules x {opts['functions']} functions "
+                              f"in {time.perf_counter() - t0:.2f}s")
+            workdir = bench.checkout(bare, os.path.join(root, "checkout"))
+            with bench.fake_services(opts["llm_latency"]):
+                for stage in stages:
+                    results.update(getattr(self, f"bench_{stage}")(root, workdir, head, opts))
+        finally:
+            Project.objects.filter(repo_full_name=bench.BENCH_REPO).delete()
+            WebhookDelivery.objects.filter(delivery_id__startswith="bench-").delete()
+            shutil.rmtree(root, ignore_errors=True)
+
+        for name, r in results.items():
+            self.stdout.write(f"{name:<22} median {r['median']:.4f}s  min {r['min']:.4f}s  max {r['max']:.4f}s  "
+                              f"peak heap {r['peak_kb']} KB  max RSS {r['max_rss_kb']} KB")
+        if opts["json"]:
+            with open(opts["json"], "w", encoding="utf-8") as f:
+                json.dump({"options": {k: opts[k] for k in ("files", "functions", "failing", "changed", "failures",
+                                                            "junit_cases", "junit_failing", "webhooks", "seed")},
+                           "results": results}, f, indent=2)
+        if opts["baseline"]:
+            regressions = bench.compare(results, bench.load_report(opts["baseline"]), opts["tolerance"])
+            if regressions:
+                raise CommandError("performance regressions:\n" + "\n".join(regressions))
+            self.stdout.write(f"no regressions against {opts['baseline']}")
+
+    def _project(self, head: str):
+        project, _ = Project.objects.get_or_create(repo_full_name=bench.BENCH_REPO)
+        pr, _ = PullRequest.objects.update_or_create(project=project, number=bench.BENCH_PR,
+                                                     defaults={"title": "bench", "head_sha": head, "head_ref": "pr"})
+        return project, pr
+
+    def bench_files(self, root, workdir, head, opts):
+        return {"list_py_files": bench.measure(lambda: sandbox.list_py_files(workdir), opts["repeat"])}
+
+    def bench_generate(self, root, workdir, head, opts):
+        files = sandbox.list_py_files(workdir)
+        read = lambda rel: sandbox.read_file(workdir, rel)
+        idx = index_mod.ProjectIndex({rel: index_mod.parse(read(rel)) for rel in files})
+        return {
+            "index.parse": bench.measure(
+                lambda: index_mod.ProjectIndex({rel: index_mod.parse(read(rel)) for rel in files}), opts["repeat"]),
+            "generate_tests_for_repo": bench.measure(
+                lambda: ai_mod.generate_tests_for_repo(files, read, index=idx), opts["repeat"]),
+        }
+
+    def bench_cluster(self, root, workdir, head, opts):
+        failures = bench.synthetic_failures(opts["failures"], opts["seed"])
+        return {"cluster_failures": bench.measure(lambda: ai_mod.cluster_failures(failures), opts["repeat"])}
+
+    def bench_junit(self, root, workdir, head, opts):
+        path = bench.write_junit(os.path.join(root, "junit.xml"), opts["junit_cases"], opts["junit_failing"],
+                                 opts["seed"])
+        _, pr = self._project(head)
+        run = TestRun.objects.create(pr=pr)
+        return {
+            "junit.iter_testcases": bench.measure(lambda: sum(1 for _ in junit.iter_testcases(path)), opts["repeat"]),
+            "junit.ingest": bench.measure(lambda: junit.ingest(path, run), opts["repeat"],
+                                          setup=lambda: Failure.objects.filter(test_run=run).delete()),
+        }
+
+    def bench_webhook(self, root, workdir, head, opts):
+        # Verify, store and ingest deliveries that do not start a pipeline ("edited" PRs),
+        # then the same deliveries again (the duplicate path).
+        self._project(head)
+        body = json.dumps({"action": "edited", "number": bench.BENCH_PR,
+                           "repository": {"full_name": bench.BENCH_REPO, "default_branch": "main"},
+                           "pull_request": {"title": "bench", "head": {"sha": head, "ref": "pr"}}}).encode()
+        factory = RequestFactory()
+        ids = []
+
+        def fresh():
+            ids[:] = [f"bench-{uuid.uuid4().hex}" for _ in range(opts["webhooks"])]
+
+        def deliver():
+            for delivery_id in ids:
+                request = factory.post("/webhook/gh/", body, content_type="application/json",
+                                       HTTP_X_GITHUB_EVENT="pull_request", HTTP_X_GITHUB_DELIVERY=delivery_id,
+                                       HTTP_X_HUB_SIGNATURE_256=bench.sign(body))
+                gh_webhook(request)
+
+        with self._eager():
+            return {
+                "webhook.deliver": bench.measure(deliver, opts["repeat"], setup=fresh),
+                "webhook.duplicate": bench.measure(deliver, opts["repeat"]),
+            }
+
+    def bench_pipeline(self, root, workdir, head, opts):
+        # The whole chain run eagerly in this process against the file:// repo; per-stage times
+        # come from the spans the stages record. Every run re-executes: stage checkpoints are
+        # cleared first (repeats share the PR and head, so they would otherwise just resume).
+        # Cold runs also drop the generation, analysis and test-result caches; warm runs keep them.
+        project, pr = self._project(head)
+        stage_times = {}
+        mode = {"name": "cold"}
+
+        def run():
+            started = timezone.now()
+            job = Job.objects.create(pr=pr, job_type="orchestrate", status="queued", head_sha=head)
+            orchestrate_pr.apply((pr.id,), {"job_id": job.id})
+            status = Job.objects.get(id=job.id).status
+            if status != "success":
+                raise CommandError(f"pipeline run {job.id} ended {status}")
+            for stage, duration in (Span.objects.filter(job__pr=pr, job__created_at__gte=started, name="stage")
+                                    .values_list("stage", "duration")):
+                stage_times.setdefault(f"pipeline.{mode['name']}.{stage}", []).append(duration)
+            return job.id
+
+        def warm():
+            mode["name"] = "warm"
+            pr.checkpoints.all().delete()
+
+        def cold():
+            warm()
+            mode["name"] = "cold"
+            project.generation_cache.all().delete()
+            project.analysis_cache.all().delete()
+            project.test_result_cache.all().delete()
+
+        ws = os.path.join(root, "workspaces")
+        with self._eager(), override_settings(
+                GIT_BASE_URL=f"file://{os.path.join(root, 'git')}", WORKSPACE_ROOT=ws,
+                REPO_MIRROR_DIR=os.path.join(ws, "mirrors"), SANDBOX_POOL_DIR=os.path.join(ws, "pool"),
+                SANDBOX_POOL_SIZE=0, VENV_CACHE_DIR=os.path.join(ws, "venv-cache"),
+                BLOB_ROOT=os.path.join(ws, "blobs"), TEST_IMPACT_ENABLED=False):
+            # Smoke check, untimed: the chain must run inline and reach success before anything is measured.
+            cold()
+            job_id = run()
+            self.stdout.write(f"pipeline smoke run {job_id}: success")
+            stage_times.clear()
+            results = {
+                "orchestrate_pr.cold": bench.measure(run, opts["repeat"], setup=cold),
+                "orchestrate_pr.warm": bench.measure(run, opts["repeat"], setup=warm),
+            }
+        for name, times in sorted(stage_times.items()):
+            results[name] = bench.summarize(times)
+        return results
+
+    def _eager(self):
+        return bench.eager_celery(current_app)
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('source_path', models.CharField(max_length=512)),
+                ('blob_sha', models.CharField(max_length=40)),
+                ('content', models.TextField()),
+                ('rationale', models.TextField(blank=True, default='')),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_cache', to='core.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TestResultCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('test_path', models.CharField(max_length=512)),
+                ('passed', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_result_cache', to='core.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CacheStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache', models.CharField(max_length=64)),
+                ('day', models.DateField(default=django.utils.timezone.localdate)),
+                ('hits', models.IntegerField(default=0)),
+                ('misses', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cache_stats', to='core.project')),
+            ],
+            options={
+                'unique_together': {('project', 'cache', 'day')},
+            },
+        ),
+    ]
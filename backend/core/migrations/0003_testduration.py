@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_generationcacheentry_testresultcacheentry_cachestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestDuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=512)),
+                ('duration', models.FloatField(default=0.0)),
+                ('runs', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_durations', to='core.project')),
+            ],
+            options={
+                'unique_together': {('project', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_testduration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='failure',
+            name='duration',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='junit_blob',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='output_blob',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
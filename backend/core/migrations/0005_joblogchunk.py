@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_failure_duration_testrun_junit_blob_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLogChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_chunks', to='core.job')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job', 'id'], name='core_joblog_job_id_80a3e8_idx')],
+            },
+        ),
+    ]
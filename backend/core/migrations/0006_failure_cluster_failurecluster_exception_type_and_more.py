@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_joblogchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='failure',
+            name='cluster',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='failures', to='core.failurecluster'),
+        ),
+        migrations.AddField(
+            model_name='failurecluster',
+            name='exception_type',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AddField(
+            model_name='failurecluster',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='failurecluster',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='failure_clusters', to='core.project'),
+        ),
+        migrations.AlterField(
+            model_name='failurecluster',
+            name='signature',
+            field=models.CharField(max_length=512),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_webhookdelivery_job_head_sha_job_task_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pullrequest',
+            name='summary_comment_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
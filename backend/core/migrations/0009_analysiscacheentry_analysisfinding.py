@@ -0,0 +1,44 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_pullrequest_summary_comment_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('tool', models.CharField(max_length=32)),
+                ('path', models.CharField(max_length=512)),
+                ('findings', models.JSONField(default=list)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_cache', to='core.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalysisFinding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool', models.CharField(max_length=32)),
+                ('path', models.CharField(max_length=512)),
+                ('line', models.IntegerField(default=0)),
+                ('column', models.IntegerField(default=0)),
+                ('rule', models.CharField(blank=True, default='', max_length=255)),
+                ('severity', models.CharField(default='low', max_length=16)),
+                ('message', models.TextField(blank=True, default='')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='core.job')),
+                ('pr', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='core.pullrequest')),
+            ],
+        ),
+    ]
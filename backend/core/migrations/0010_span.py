@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-16 20:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_analysiscacheentry_analysisfinding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Span',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=32)),
+                ('name', models.CharField(max_length=64)),
+                ('started_at', models.DateTimeField()),
+                ('duration', models.FloatField()),
+                ('exit_code', models.IntegerField(blank=True, null=True)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('cache', models.CharField(blank=True, default='', max_length=8)),
+                ('attrs', models.JSONField(default=dict)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='spans', to='core.job')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='spans', to='core.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'stage', 'started_at'], name='core_span_name_6f2a69_idx'), models.Index(fields=['project', 'name', 'started_at'], name='core_span_project_72b686_idx')],
+            },
+        ),
+    ]
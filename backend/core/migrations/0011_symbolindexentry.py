@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-16 21:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_span'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymbolIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('blob_sha', models.CharField(max_length=40)),
+                ('symbols', models.JSONField(default=list)),
+                ('imports', models.JSONField(default=list)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symbol_index', to='core.project')),
+            ],
+            options={
+                'unique_together': {('project', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-16 21:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_symbolindexentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrun',
+            name='selection',
+            field=models.CharField(blank=True, default='full', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='CoverageMap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_sha', models.CharField(max_length=64)),
+                ('blob', models.CharField(max_length=64)),
+                ('tests', models.IntegerField(default=0)),
+                ('files', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coverage_maps', to='core.project')),
+            ],
+        ),
+    ]
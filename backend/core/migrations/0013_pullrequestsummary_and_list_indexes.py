@@ -0,0 +1,68 @@
+# Generated by Django 5.0.7 on 2026-10-16 21:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    PullRequest = apps.get_model("core", "PullRequest")
+    PullRequestSummary = apps.get_model("core", "PullRequestSummary")
+    TestRun = apps.get_model("core", "TestRun")
+    for pr_id in PullRequest.objects.values_list("id", flat=True).iterator():
+        runs = list(TestRun.objects.filter(pr_id=pr_id).order_by("-started_at")
+                    .values("id", "started_at", "passed", "failed", "errors", "coverage")[:30])
+        if not runs:
+            continue
+        points = []
+        for r in reversed(runs):
+            total = r["passed"] + r["failed"] + r["errors"]
+            points.append({"id": r["id"], "at": r["started_at"].isoformat(), "passed": r["passed"],
+                           "failed": r["failed"], "errors": r["errors"],
+                           "pass_rate": round(r["passed"] / total, 4) if total else 0.0})
+        latest = runs[0]
+        PullRequestSummary.objects.create(
+            pr_id=pr_id, runs=TestRun.objects.filter(pr_id=pr_id).count(), latest_run_id=latest["id"],
+            latest_status="success" if latest["failed"] == 0 and latest["errors"] == 0 else "failure",
+            passed=latest["passed"], failed=latest["failed"], errors=latest["errors"], coverage=latest["coverage"],
+            pass_rate=points[-1]["pass_rate"], trend=points,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_coveragemap_testrun_selection'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pullrequest',
+            index=models.Index(fields=['-updated_at'], name='core_pullre_updated_a54441_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['pr', '-created_at'], name='core_job_pr_id_d49631_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrun',
+            index=models.Index(fields=['pr', '-started_at'], name='core_testru_pr_id_a9807b_idx'),
+        ),
+        migrations.CreateModel(
+            name='PullRequestSummary',
+            fields=[
+                ('pr', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='core.pullrequest')),
+                ('runs', models.IntegerField(default=0)),
+                ('latest_status', models.CharField(blank=True, default='', max_length=16)),
+                ('passed', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('coverage', models.FloatField(default=0.0)),
+                ('pass_rate', models.FloatField(default=0.0)),
+                ('trend', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('latest_run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.testrun')),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.7 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_pullrequestsummary_and_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='max_concurrency',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='weight',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='pullrequest',
+            name='draft',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pullrequest',
+            name='labels',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['job_type', 'status'], name='core_job_job_typ_61d35d_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-16 23:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=64)),
+                ('result', models.JSONField(default=dict)),
+                ('blob', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='checkpoints', to='core.job')),
+                ('pr', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='core.pullrequest')),
+            ],
+            options={
+                'unique_together': {('pr', 'stage', 'key')},
+            },
+        ),
+    ]
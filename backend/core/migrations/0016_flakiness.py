@@ -0,0 +1,48 @@
+# Generated by Django 5.0.7 on 2026-10-16 23:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_stagecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrun',
+            name='flaky',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='failure',
+            name='flaky',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='failurecluster',
+            name='flaky',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='TestFlakiness',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=512)),
+                ('history', models.CharField(blank=True, default='', max_length=64)),
+                ('runs', models.IntegerField(default=0)),
+                ('failures', models.IntegerField(default=0)),
+                ('flaky', models.IntegerField(default=0)),
+                ('score', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_flakiness', to='core.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', '-score'], name='core_testfl_project_873259_idx')],
+                'unique_together': {('project', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_flakiness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='coverage_map_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='coverage_map_failures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='coverage_map_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:40
+
+from django.db import migrations, models
+
+
+def backfill_seq(apps, schema_editor):
+    # Existing chunks keep their id order as their per-job sequence.
+    JobLogChunk = apps.get_model("core", "JobLogChunk")
+    job_ids = JobLogChunk.objects.values_list("job_id", flat=True).distinct()
+    for job_id in job_ids.iterator():
+        ids = JobLogChunk.objects.filter(job_id=job_id).order_by("id").values_list("id", flat=True)
+        for seq, chunk_id in enumerate(ids, start=1):
+            JobLogChunk.objects.filter(id=chunk_id).update(seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_project_coverage_map_builds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='joblogchunk',
+            name='seq',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_seq, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='joblogchunk',
+            name='core_joblog_job_id_80a3e8_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='joblogchunk',
+            unique_together={('job', 'seq')},
+        ),
+    ]
@@ -0,0 +1,108 @@
+import os
+import re
+from typing import List, Tuple
+from . import sandbox
+
+# Persistent bare mirrors, one per Project, under <root>/<org>__<repo>.git.
+# Branches are kept in sync with incremental fetches; PR heads are fetched on
+# demand into refs/pull/<n>/head. Workspaces are then created locally from the
+# mirror, so a synchronize push only transfers the new objects.
+
+CHECKOUT_MODES = ("shared", "reference", "worktree")
+
+def mirror_path(root: str, repo_full_name: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._-]", "__", repo_full_name)
+    return os.path.join(root, f"{safe}.git")
+
+def _git(args: str, cwd: str | None = None, timeout: int = 600) -> Tuple[int, str]:
+    return sandbox.run_cmd(f"git {args}", cwd=cwd, timeout=timeout)
+
+def update_mirror(repo_url: str, token: str, path: str, pr_number: int | None, default_branch: str = "") -> Tuple[int, str]:
+    """Create or incrementally refresh the mirror, including the PR head (if pr_number is given)."""
+    url = sandbox.auth_url(repo_url, token)
+    with sandbox.file_lock(f"{path}.lock"):
+        if not os.path.exists(os.path.join(path, "HEAD")):
+            code, out = _git(f"init -q --bare {path}")
+            if code != 0:
+                return code, out
+        if default_branch:
+            _git(f"symbolic-ref HEAD refs/heads/{default_branch}", cwd=path)
+        # Drop registrations of worktrees whose workspace has been deleted.
+        _git("worktree prune", cwd=path)
+        # The token is only ever passed on the command line, never stored in config.
+        pr_refspec = f" '+refs/pull/{pr_number}/head:refs/pull/{pr_number}/head'" if pr_number else ""
+        code, out = _git(
+            f"fetch --prune --no-tags {url} '+refs/heads/*:refs/heads/*'{pr_refspec}",
+            cwd=path,
+            timeout=1800,
+        )
+    return code, out
+
+def _sparse(workdir: str, sparse_paths: List[str]) -> None:
+    if sparse_paths:
+        _git("sparse-checkout init --cone", cwd=workdir)
+        _git("sparse-checkout set " + " ".join(sparse_paths), cwd=workdir)
+
+def checkout_pr(path: str, pr_number: int, workdir: str, mode: str = "shared",
+                depth: int = 0, sparse_paths: List[str] | None = None) -> Tuple[int, str]:
+    """Materialize the PR head from the mirror into the (empty) workdir.
+
+    shared     clone with objects borrowed through alternates (fastest, default)
+    reference  like shared, but dissociated so the workspace survives mirror gc
+    worktree   a detached worktree of the mirror itself
+    depth > 0 makes a shallow copy instead (alternates are not used then).
+    """
+    if mode not in CHECKOUT_MODES:
+        return 2, f"unknown checkout mode {mode!r}"
+    sparse_paths = sparse_paths or []
+    pr_ref = f"refs/pull/{pr_number}/head"
+    branch = f"pr-{pr_number}"
+
+    if mode == "worktree" and not depth:
+        with sandbox.file_lock(f"{path}.lock"):
+            code, out = _git(f"worktree add --detach --no-checkout {workdir} {pr_ref}", cwd=path)
+        if code != 0:
+            return code, out
+        _sparse(workdir, sparse_paths)
+        # Branches would be shared with every other worktree of the mirror; stay detached.
+        code, out = _git(f"checkout -q --detach {pr_ref}", cwd=workdir)
+        return code, out if code != 0 else "checked out from mirror (worktree)"
+
+    if depth:
+        clone_opts = f"--depth {depth} file://{path}"
+    elif mode == "reference":
+        clone_opts = f"--reference {path} --dissociate {path}"
+    else:
+        clone_opts = f"--shared {path}"
+    code, out = _git(f"clone -q --no-checkout {clone_opts} .", cwd=workdir)
+    if code != 0:
+        return code, out
+    depth_opt = f"--depth {depth} " if depth else ""
+    code, out = _git(f"fetch -q {depth_opt}origin {pr_ref}:{branch}", cwd=workdir)
+    if code != 0:
+        return code, out
+    _sparse(workdir, sparse_paths)
+    code, out = _git(f"checkout -q {branch}", cwd=workdir)
+    return code, out if code != 0 else f"checked out from mirror ({'shallow' if depth else mode})"
+
+def clone_pr(root: str, repo_full_name: str, repo_url: str, pr_number: int, token: str, workdir: str,
+             default_branch: str = "", mode: str = "shared", depth: int = 0,
+             sparse_paths: List[str] | None = None) -> Tuple[int, str]:
+    path = mirror_path(root, repo_full_name)
+    code, out = update_mirror(repo_url, token, path, pr_number, default_branch)
+    if code != 0:
+        return code, out
+    return checkout_pr(path, pr_number, workdir, mode=mode, depth=depth, sparse_paths=sparse_paths)
+
+def checkout_commit(root: str, repo_full_name: str, repo_url: str, token: str, workdir: str, rev: str,
+                    default_branch: str = "") -> Tuple[int, str]:
+    """Refresh the branches and check out rev (a branch or commit) detached in a shared clone."""
+    path = mirror_path(root, repo_full_name)
+    code, out = update_mirror(repo_url, token, path, None, default_branch)
+    if code != 0:
+        return code, out
+    code, out = _git(f"clone -q --no-checkout --shared {path} .", cwd=workdir)
+    if code != 0:
+        return code, out
+    code, out = _git(f"checkout -q --detach {rev}", cwd=workdir)
+    return code, out if code != 0 else f"checked out {rev} from mirror"
@@ -5,6 +5,14 @@ from django.contrib.postgres.fields import JSONField  # type: ignore
 class Project(models.Model):
     repo_full_name = models.CharField(max_length=255, unique=True)  # e.g., org/repo
     default_branch = models.CharField(max_length=128, default="main")
+    # Scheduling (see core.scheduler): running pipelines allowed (0 = PIPELINE_PROJECT_CONCURRENCY)
+    # and the project's share of pipeline slots relative to other busy projects.
+    max_concurrency = models.IntegerField(default=0)
+    weight = models.FloatField(default=1.0)
+    # Coverage map builds (see core.impact): one pending per project, failed ones back off.
+    coverage_map_requested_at = models.DateTimeField(null=True, blank=True)
+    coverage_map_failures = models.IntegerField(default=0)
+    coverage_map_retry_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
@@ -18,25 +26,41 @@ class PullRequest(models.Model):
     head_ref = models.CharField(max_length=255, blank=True, default="")
     author = models.CharField(max_length=255, blank=True, default="")
     status = models.CharField(max_length=64, default="pending")  # pending/running/success/failure
+    draft = models.BooleanField(default=False)
+    labels = models.JSONField(default=list)
+    # The sticky summary comment, edited on every run.
+    summary_comment_id = models.BigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("project", "number")
+        indexes = [models.Index(fields=["-updated_at"])]
 
     def __str__(self):
         return f"{self.project.repo_full_name}#{self.number}"
 
 class Job(models.Model):
     pr = models.ForeignKey(PullRequest, on_delete=models.CASCADE, related_name="jobs")
-    job_type = models.CharField(max_length=64)  # analysis/generate/execute/triage/patch/report
-    status = models.CharField(max_length=32, default="queued")
+    job_type = models.CharField(max_length=64)  # analysis/generate/preflight/execute/rerun/triage/patch/report
+    status = models.CharField(max_length=32, default="queued")  # queued/running/success/failure/cancelled
     payload = models.JSONField(default=dict)
     logs = models.TextField(blank=True, default="")
+    # Head the pipeline was started for (orchestrate jobs) and the Celery task
+    # running the job, so stale runs can be revoked when the PR is pushed again.
+    head_sha = models.CharField(max_length=64, blank=True, default="")
+    task_id = models.CharField(max_length=64, blank=True, default="")
+    # Orchestrate jobs wait "queued" until the scheduler hands them to a worker (dispatched_at).
+    priority = models.IntegerField(default=0)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     started_at = models.DateTimeField(null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["pr", "status"]), models.Index(fields=["pr", "-created_at"]),
+                   models.Index(fields=["job_type", "status"])]
+
 class GeneratedTest(models.Model):
     pr = models.ForeignKey(PullRequest, on_delete=models.CASCADE, related_name="generated_tests")
     path = models.CharField(max_length=512)
@@ -51,9 +75,38 @@ class TestRun(models.Model):
     passed = models.IntegerField(default=0)
     failed = models.IntegerField(default=0)
     errors = models.IntegerField(default=0)
-    coverage = models.FloatField(default=0.0)
+    coverage = models.FloatField(default=0.0)  # line coverage (%) of the tests that ran
+    # "full", or "impact" when only the tests affected by the PR ran
+    selection = models.CharField(max_length=16, blank=True, default="full")
+    # Failures that passed when rerun; not counted in failed/errors.
+    flaky = models.IntegerField(default=0)
     junit_xml = models.TextField(blank=True, default="")
-    raw_output = models.TextField(blank=True, default="")
+    raw_output = models.TextField(blank=True, default="")  # tail only when output_blob is set
+    junit_blob = models.CharField(max_length=64, blank=True, default="")  # keys into BLOB_ROOT
+    output_blob = models.CharField(max_length=64, blank=True, default="")
+
+    class Meta:
+        indexes = [models.Index(fields=["pr", "-started_at"])]
+
+# TestRun columns for listings; raw_output and junit_xml are only loaded on demand.
+TEST_RUN_LIST_FIELDS = ("id", "pr_id", "started_at", "finished_at", "passed", "failed", "errors", "flaky", "coverage",
+                        "selection", "junit_blob", "output_blob")
+
+class PullRequestSummary(models.Model):
+    # Aggregates of a PR's test runs, maintained on write (see core.summary) so list
+    # and detail pages never scan the runs.
+    pr = models.OneToOneField(PullRequest, on_delete=models.CASCADE, primary_key=True, related_name="summary")
+    runs = models.IntegerField(default=0)
+    latest_run = models.ForeignKey(TestRun, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    latest_status = models.CharField(max_length=16, blank=True, default="")  # success/failure of the latest run
+    passed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    coverage = models.FloatField(default=0.0)
+    pass_rate = models.FloatField(default=0.0)
+    # Latest runs, oldest first: [{"id", "at", "passed", "failed", "errors", "pass_rate"}]
+    trend = models.JSONField(default=list)
+    updated_at = models.DateTimeField(default=timezone.now)
 
 class Failure(models.Model):
     test_run = models.ForeignKey(TestRun, on_delete=models.CASCADE, related_name="failures")
@@ -63,12 +116,20 @@ class Failure(models.Model):
     message = models.TextField(blank=True, default="")
     stacktrace = models.TextField(blank=True, default="")
     failure_type = models.CharField(max_length=128, blank=True, default="failure")
+    duration = models.FloatField(default=0.0)
+    flaky = models.BooleanField(default=False)  # passed on at least one rerun
+    cluster = models.ForeignKey("FailureCluster", on_delete=models.SET_NULL, null=True, blank=True, related_name="failures")
 
 class FailureCluster(models.Model):
     pr = models.ForeignKey(PullRequest, on_delete=models.CASCADE, related_name="failure_clusters")
-    signature = models.CharField(max_length=128)
+    # Denormalized so the same fingerprint can be followed across a project's PRs.
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="failure_clusters", null=True, blank=True)
+    fingerprint = models.CharField(max_length=40, blank=True, default="", db_index=True)
+    exception_type = models.CharField(max_length=128, blank=True, default="")
+    signature = models.CharField(max_length=512)
     summary = models.TextField()
     count = models.IntegerField(default=1)
+    flaky = models.BooleanField(default=False)  # clusters of flaky failures are kept apart from real ones
 
 class PatchSuggestion(models.Model):
     pr = models.ForeignKey(PullRequest, on_delete=models.CASCADE, related_name="patches")
@@ -77,3 +138,157 @@ class PatchSuggestion(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     applied = models.BooleanField(default=False)
     pr_url = models.URLField(blank=True, default="")
+
+class AnalysisFinding(models.Model):
+    pr = models.ForeignKey(PullRequest, on_delete=models.CASCADE, related_name="findings")
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="findings")
+    tool = models.CharField(max_length=32)  # bandit/flake8/semgrep
+    path = models.CharField(max_length=512)
+    line = models.IntegerField(default=0)
+    column = models.IntegerField(default=0)
+    rule = models.CharField(max_length=255, blank=True, default="")
+    severity = models.CharField(max_length=16, default="low")  # low/medium/high
+    message = models.TextField(blank=True, default="")
+
+class AnalysisCacheEntry(models.Model):
+    # One tool's findings for one file, keyed on the tool version, its config files and the file blob.
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="analysis_cache")
+    key = models.CharField(max_length=64, unique=True)
+    tool = models.CharField(max_length=32)
+    path = models.CharField(max_length=512)
+    findings = models.JSONField(default=list)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+class GenerationCacheEntry(models.Model):
+    # Generated test content keyed on (source blob, changed symbols, generator, prompt).
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="generation_cache")
+    key = models.CharField(max_length=64, unique=True)
+    source_path = models.CharField(max_length=512)
+    blob_sha = models.CharField(max_length=40)
+    content = models.TextField()
+    rationale = models.TextField(blank=True, default="")
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+class SymbolIndexEntry(models.Model):
+    # Parsed top-level symbols and imports of one Python blob (see core.index).
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="symbol_index")
+    key = models.CharField(max_length=64)  # index version + blob sha
+    blob_sha = models.CharField(max_length=40)
+    symbols = models.JSONField(default=list)
+    imports = models.JSONField(default=list)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("project", "key")
+
+class TestResultCacheEntry(models.Model):
+    # A test file that fully passed, keyed on its blob, its local import closure and the env.
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="test_result_cache")
+    key = models.CharField(max_length=64, unique=True)
+    test_path = models.CharField(max_length=512)
+    passed = models.IntegerField(default=0)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+class CacheStats(models.Model):
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="cache_stats")
+    cache = models.CharField(max_length=64)  # generation/test_result/...
+    day = models.DateField(default=timezone.localdate)
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("project", "cache", "day")
+
+class TestDuration(models.Model):
+    # Moving average runtime per test, used to balance pytest shards.
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="test_durations")
+    key = models.CharField(max_length=512)  # "<junit classname>::<name>"
+    duration = models.FloatField(default=0.0)
+    runs = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("project", "key")
+
+class TestFlakiness(models.Model):
+    # Pass/fail history per test across a project's runs (see core.flaky).
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="test_flakiness")
+    key = models.CharField(max_length=512)  # pytest node id
+    history = models.CharField(max_length=64, blank=True, default="")  # latest outcomes, oldest first: P/F/K
+    runs = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    flaky = models.IntegerField(default=0)  # runs where it failed, then passed on rerun
+    score = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("project", "key")
+        indexes = [models.Index(fields=["project", "-score"])]
+
+class CoverageMap(models.Model):
+    # Lines each test executed on a default-branch commit (see core.impact); the map itself is a blob.
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="coverage_maps")
+    base_sha = models.CharField(max_length=64)
+    blob = models.CharField(max_length=64)  # keys into BLOB_ROOT
+    tests = models.IntegerField(default=0)
+    files = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+class StageCheckpoint(models.Model):
+    # Output of a completed stage for one set of inputs (see core.checkpoint); a re-run resumes from these.
+    pr = models.ForeignKey(PullRequest, on_delete=models.CASCADE, related_name="checkpoints")
+    job = models.ForeignKey(Job, on_delete=models.SET_NULL, null=True, blank=True, related_name="checkpoints")
+    stage = models.CharField(max_length=32)
+    key = models.CharField(max_length=64)
+    result = models.JSONField(default=dict)  # what the stage added to the pipeline context
+    blob = models.CharField(max_length=64, blank=True, default="")  # keys into BLOB_ROOT
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("pr", "stage", "key")
+
+class JobLogChunk(models.Model):
+    # Append-only job log; seq (per job, assigned in commit order by core.joblog) is the tail cursor.
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="log_chunks")
+    seq = models.IntegerField(default=0)
+    text = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("job", "seq")
+
+class WebhookDelivery(models.Model):
+    # One row per X-GitHub-Delivery id; redeliveries hit the unique constraint.
+    delivery_id = models.CharField(max_length=64, unique=True)
+    event = models.CharField(max_length=64)
+    payload = models.TextField()
+    status = models.CharField(max_length=32, default="received")  # received/processed/ignored/coalesced
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+class Span(models.Model):
+    # One timed step of a pipeline stage (see core.tracing); name "stage" is the stage itself.
+    job = models.ForeignKey(Job, on_delete=models.SET_NULL, null=True, blank=True, related_name="spans")
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, related_name="spans")
+    stage = models.CharField(max_length=32)  # clone/analysis/generate/env/execute/triage/patch/pipeline
+    name = models.CharField(max_length=64)  # stage/cmd/llm.request/orm.*/cache.*/...
+    started_at = models.DateTimeField()
+    duration = models.FloatField()
+    exit_code = models.IntegerField(null=True, blank=True)
+    bytes = models.BigIntegerField(default=0)
+    cache = models.CharField(max_length=8, blank=True, default="")  # hit/miss
+    attrs = models.JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "stage", "started_at"]),
+            models.Index(fields=["project", "name", "started_at"]),
+        ]
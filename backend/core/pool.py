@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+from . import sandbox
+from . import envcache
+
+# Warm sandbox pool.
+#
+# Layout under <root> (a directory on the shared WORKSPACE_ROOT volume):
+#   base/<key>/venv       base env (pip upgraded, TOOL_PINS installed), built once per key
+#   building/ws_*         workspaces being provisioned
+#   ready/ws_*/venv       provisioned workspaces; leasing is an atomic rename out of here
+#   ready/ws_*/.origin    the base env the copy was taken from (its scripts still say so)
+#   leased/job_<id>/repo  the checkout for orchestrate job <id> (the pipeline's workdir)
+#   leased/job_<id>/venv  the pre-warmed env, until the env stage adopts it
+#   leased/job_<id>/.lease
+#
+# Leases are released when the pipeline reports; anything a crashed or cancelled
+# run leaves behind is reclaimed by gc().
+
+class QuotaExceeded(RuntimeError):
+    pass
+
+def _dirs(root: str, sub: str) -> List[str]:
+    path = os.path.join(root, sub)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.startswith(("ws_", "job_")))
+
+def base_key() -> str:
+    h = hashlib.sha256(envcache.python_version().encode())
+    h.update("\0".join(sandbox.TOOL_PINS).encode())
+    return h.hexdigest()[:16]
+
+def ensure_base(root: str) -> str:
+    entry = os.path.join(root, "base", base_key())
+    venv = os.path.join(entry, "venv")
+    with sandbox.file_lock(entry + ".lock"):
+        if not os.path.exists(os.path.join(entry, ".complete")):
+            shutil.rmtree(entry, ignore_errors=True)
+            os.makedirs(entry)
+            if not sandbox.create_venv(venv):
+                shutil.rmtree(entry, ignore_errors=True)
+                return ""
+            pip = os.path.join(venv, "bin", "pip")
+            sandbox.run_cmd(f"{pip} install {' '.join(sandbox.TOOL_PINS)}", timeout=600)
+            with open(os.path.join(entry, ".complete"), "w"):
+                pass
+    return venv
+
+def provision(root: str) -> Optional[str]:
+    """Build one ready workspace (a private copy of the base env); returns its path."""
+    base = ensure_base(root)
+    if not base:
+        return None
+    os.makedirs(os.path.join(root, "building"), exist_ok=True)
+    os.makedirs(os.path.join(root, "ready"), exist_ok=True)
+    ws = tempfile.mkdtemp(prefix="ws_", dir=os.path.join(root, "building"))
+    venv = os.path.join(ws, "venv")
+    # A real copy, not hardlinks: requirements get installed into it later.
+    code, _ = sandbox.run_cmd(f"cp -a {base} {venv}", timeout=600)
+    if code != 0:
+        shutil.rmtree(ws, ignore_errors=True)
+        return None
+    # bin/ scripts still point at the base env; they are fixed once the lease settles the location.
+    with open(os.path.join(ws, ".origin"), "w") as f:
+        f.write(base)
+    ready = os.path.join(root, "ready", os.path.basename(ws))
+    os.rename(ws, ready)
+    return ready
+
+def refill(root: str, size: int, budget_bytes: int = 0) -> int:
+    made = 0
+    while len(_dirs(root, "ready")) < size:
+        if budget_bytes and usage(root) >= budget_bytes:
+            break
+        if provision(root) is None:
+            break
+        made += 1
+    return made
+
+def lease(root: str, job_id: int) -> str:
+    """Claim a ready workspace for an orchestrate job (or an empty one if the pool is dry).
+    Returns the checkout directory."""
+    os.makedirs(os.path.join(root, "leased"), exist_ok=True)
+    dest = os.path.join(root, "leased", f"job_{job_id}")
+    shutil.rmtree(dest, ignore_errors=True)
+    for ws in _dirs(root, "ready"):
+        try:
+            os.rename(ws, dest)
+        except OSError:
+            continue  # another worker got it first
+        with open(os.path.join(dest, ".origin")) as f:
+            envcache.rewrite_paths(os.path.join(dest, "venv"), f.read().strip())
+        break
+    else:
+        os.makedirs(dest)
+    os.makedirs(os.path.join(dest, "repo"))
+    with open(os.path.join(dest, ".lease"), "w") as f:
+        json.dump({"job_id": job_id, "leased_at": time.time()}, f)
+    return os.path.join(dest, "repo")
+
+def spare_venv(workdir: str) -> str:
+    """The pre-warmed env that came with the lease, if it has not been used yet."""
+    venv = os.path.join(os.path.dirname(workdir), "venv")
+    return venv if os.path.isdir(venv) else ""
+
+def adopt_venv(workdir: str) -> str:
+    # Move the pooled env to workdir/.venv, where the stages expect it.
+    seed = spare_venv(workdir)
+    if not seed:
+        return ""
+    dest = os.path.join(workdir, ".venv")
+    shutil.rmtree(dest, ignore_errors=True)
+    os.rename(seed, dest)
+    envcache.rewrite_paths(dest, seed)
+    return dest
+
+def release(root: str, job_id: int) -> None:
+    shutil.rmtree(os.path.join(root, "leased", f"job_{job_id}"), ignore_errors=True)
+
+def check_quota(workdir: str, max_bytes: int) -> int:
+    if not max_bytes:
+        return 0
+    used = envcache.dir_size(os.path.dirname(workdir))
+    if used > max_bytes:
+        raise QuotaExceeded(f"workspace uses {used} bytes (limit {max_bytes})")
+    return used
+
+def usage(root: str) -> int:
+    return sum(envcache.dir_size(d) for sub in ("ready", "leased", "building") for d in _dirs(root, sub))
+
+def gc(root: str, is_active: Callable[[List[int]], Dict[int, bool]], ttl: float,
+       legacy_root: str = "") -> List[str]:
+    """Reclaim leases of jobs that are no longer active, stale builds and mkdtemp workspaces
+    (repo_*) older than ttl left in legacy_root. is_active maps job ids to liveness; a lease's
+    age never reclaims it while its job runs (jobs of lost workers are failed by the reaper)."""
+    now = time.time()
+    removed: List[str] = []
+    leases: Dict[int, str] = {}
+    for path in _dirs(root, "leased"):
+        try:
+            with open(os.path.join(path, ".lease")) as f:
+                meta = json.load(f)
+            job_id, leased_at = int(meta["job_id"]), float(meta["leased_at"])
+        except (OSError, ValueError, KeyError):
+            # Not written yet, or damaged; ctime is bumped by the rename in lease().
+            job_id, leased_at = 0, os.path.getctime(path)
+        if job_id:
+            leases[job_id] = path
+        elif now - leased_at >= 60:
+            removed.append(path)
+    alive = is_active(list(leases)) if leases else {}
+    removed.extend(path for job_id, path in leases.items() if not alive.get(job_id))
+    removed.extend(p for p in _dirs(root, "building") if now - os.path.getmtime(p) >= 3600)
+    if legacy_root and os.path.isdir(legacy_root):
+        for name in os.listdir(legacy_root):
+            path = os.path.join(legacy_root, name)
+            if name.startswith("repo_") and os.path.isdir(path) and now - os.path.getmtime(path) >= ttl:
+                removed.append(path)
+    for path in removed:
+        shutil.rmtree(path, ignore_errors=True)
+    return removed
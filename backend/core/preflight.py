@@ -0,0 +1,65 @@
+import os
+import shlex
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from . import sandbox
+
+# Pre-flight checks for generated tests, run in the prepared env before the real
+# pytest run: each file is compiled in-process, then imported and collected by
+# `pytest --collect-only` in its own process (in parallel). Files that cannot run
+# are regenerated or quarantined by the caller, so one broken file does not sink
+# the whole run after minutes of setup.
+
+# Quarantined files move under this dot directory, which pytest does not recurse into.
+QUARANTINE_DIR = ".qa-quarantine"
+# pytest's exit code when a file has no tests.
+NO_TESTS_COLLECTED = 5
+COLLECT_TIMEOUT = 120
+
+def compile_error(workdir: str, rel: str) -> Optional[str]:
+    try:
+        source = sandbox.read_file(workdir, rel)
+    except (OSError, UnicodeDecodeError) as exc:
+        return f"unreadable: {exc}"
+    try:
+        compile(source, rel, "exec")
+    except SyntaxError as exc:
+        return f"SyntaxError: {exc.msg} (line {exc.lineno})"
+    except ValueError as exc:  # e.g. null bytes
+        return f"ValueError: {exc}"
+    return None
+
+def _reason(out: str) -> str:
+    # pytest prints the exception of a failed collection as "E   ..." lines; keep the last one.
+    lines = [line.strip() for line in out.splitlines() if line.strip()]
+    errors = [line[1:].strip() for line in lines if line.startswith("E ")]
+    return (errors[-1] if errors else (lines[-1] if lines else "collection failed"))[:500]
+
+def collect_error(workdir: str, venv: str, rel: str) -> Optional[str]:
+    pytest_bin = os.path.join(venv, "bin", "pytest")
+    code, out = sandbox.run_cmd(f"{pytest_bin} --collect-only -q -p no:cacheprovider {shlex.quote(rel)}",
+                                cwd=workdir, timeout=COLLECT_TIMEOUT, limited=True)
+    if code == 0:
+        return None
+    if code == NO_TESTS_COLLECTED:
+        return "no tests collected"
+    return _reason(out)
+
+def check(workdir: str, venv: str, files: List[str], workers: int) -> Dict[str, str]:
+    """rel -> reason for every file that cannot run."""
+    if not files:
+        return {}
+
+    def one(rel: str) -> Optional[str]:
+        return compile_error(workdir, rel) or collect_error(workdir, venv, rel)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+        reasons = list(pool.map(one, files))
+    return {rel: reason for rel, reason in zip(files, reasons) if reason}
+
+def quarantine(workdir: str, rel: str) -> str:
+    dest = os.path.join(QUARANTINE_DIR, rel)
+    os.makedirs(os.path.dirname(os.path.join(workdir, dest)), exist_ok=True)
+    shutil.move(os.path.join(workdir, rel), os.path.join(workdir, dest))
+    return dest
@@ -1,29 +1,263 @@
+import fcntl
 import os
+import selectors
 import shutil
+import signal
 import subprocess
 import tempfile
-from typing import Dict, Tuple
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Tuple
+from . import tracing
 
-def run_cmd(cmd: str, cwd: str | None = None, env: dict | None = None, timeout: int = 600) -> Tuple[int, str]:
-    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd, env=env)
+# Never treated as project source (envs, VCS metadata, vendored/build output, quarantined generated tests).
+SKIP_DIRS = {".git", ".venv", "venv", ".tox", ".nox", "node_modules", "site-packages",
+             "vendor", "third_party", "build", "dist", "__pycache__", ".qa-quarantine"}
+
+# Test tooling installed into every PR env; part of the env cache key.
+TOOL_PINS = ["pytest==8.3.2", "pytest-cov==5.0.0", "hypothesis==6.112.2"]
+
+# Output of a command is read incrementally: only the first OUTPUT_HEAD_BYTES and
+# the last OUTPUT_TAIL_BYTES stay in memory, everything else goes to an optional
+# spill file (itself capped at SPILL_MAX_BYTES, keeping its head and latest tail).
+OUTPUT_HEAD_BYTES = int(os.getenv("SANDBOX_OUTPUT_HEAD_BYTES", str(256 * 1024)))
+OUTPUT_TAIL_BYTES = int(os.getenv("SANDBOX_OUTPUT_TAIL_BYTES", str(1024 * 1024)))
+SPILL_MAX_BYTES = int(os.getenv("SANDBOX_SPILL_MAX_BYTES", str(256 * 1024 * 1024)))
+MAX_LINE_BYTES = 64 * 1024
+# Limits for commands that run the project's own code (pytest runs and collection, passed
+# limited=True): CPU seconds and memory (RLIMIT_AS via ulimit, or memory.max when
+# SANDBOX_CGROUP_ROOT points at a writable cgroup v2 directory). 0 disables. git, pip and
+# the analyzers run unlimited; RLIMIT_AS in particular breaks tools that reserve address space.
+CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "7200"))
+MEMORY_BYTES = int(os.getenv("SANDBOX_MEMORY_BYTES", str(8 * 1024 ** 3)))
+CPU_CORES = float(os.getenv("SANDBOX_CPU_CORES", "0"))
+CGROUP_ROOT = os.getenv("SANDBOX_CGROUP_ROOT", "")
+KILL_GRACE = 5.0
+# Where a test run's full console output is spilled inside the workdir.
+OUTPUT_LOG = ".qa-output.log"
+# Stop an unsharded run after this many failures (0 = run everything; failed tests are rerun for flakiness).
+PYTEST_MAXFAIL = int(os.getenv("PYTEST_MAXFAIL", "0"))
+
+class SpillFile:
+    """Writes up to half of max_bytes as-is, then rotates two tail segments; close() stitches them."""
+
+    def __init__(self, path: str, max_bytes: int = SPILL_MAX_BYTES):
+        self.path = path
+        self.head_limit = max_bytes // 2
+        self.segment_limit = max(1, max_bytes // 4)
+        self.head = open(path, "wb")
+        self.written = 0
+        self.segments = [f"{path}.t0", f"{path}.t1"]
+        self.current = -1
+        self.segment = None
+        self.segment_size = 0
+        self.dropped = 0
+
+    def write(self, data: bytes) -> None:
+        if self.written < self.head_limit:
+            part = data[:self.head_limit - self.written]
+            self.head.write(part)
+            self.written += len(part)
+            data = data[len(part):]
+        while data:
+            if self.segment is None or self.segment_size >= self.segment_limit:
+                if self.segment is not None:
+                    self.segment.close()
+                self.current = (self.current + 1) % 2
+                if os.path.exists(self.segments[self.current]):
+                    self.dropped += os.path.getsize(self.segments[self.current])
+                self.segment = open(self.segments[self.current], "wb")
+                self.segment_size = 0
+            part = data[:self.segment_limit - self.segment_size]
+            self.segment.write(part)
+            self.segment_size += len(part)
+            data = data[len(part):]
+
+    def close(self) -> None:
+        if self.segment is not None:
+            self.segment.close()
+            if self.dropped:
+                self.head.write(f"\n... [{self.dropped} bytes of output dropped] ...\n".encode())
+            for i in (self.current + 1, self.current):
+                path = self.segments[i % 2]
+                if os.path.exists(path):
+                    with open(path, "rb") as seg:
+                        shutil.copyfileobj(seg, self.head)
+                    os.remove(path)
+        self.head.close()
+
+def _limit_prefix(cgroup: str) -> str:
+    # Applied by the shell before exec'ing the command, so no preexec_fn is needed
+    # (which is unsafe with the thread pools pytest shards run from).
+    parts = []
+    if cgroup:
+        parts.append(f"echo $$ > {cgroup}/cgroup.procs")
+    if CPU_SECONDS:
+        parts.append(f"ulimit -t {CPU_SECONDS} 2>/dev/null")
+    if MEMORY_BYTES and not cgroup:
+        parts.append(f"ulimit -v {MEMORY_BYTES // 1024} 2>/dev/null")
+    return "; ".join(parts) + "; " if parts else ""
+
+def _make_cgroup() -> str:
+    if not CGROUP_ROOT or not os.access(CGROUP_ROOT, os.W_OK):
+        return ""
+    path = tempfile.mkdtemp(prefix="qa-", dir=CGROUP_ROOT)
     try:
-        out, _ = p.communicate(timeout=timeout)
-    except subprocess.TimeoutExpired:
-        p.kill()
-        return 124, "Command timed out"
-    return p.returncode, out.decode("utf-8", errors="ignore")
+        if MEMORY_BYTES:
+            with open(os.path.join(path, "memory.max"), "w") as f:
+                f.write(str(MEMORY_BYTES))
+        if CPU_CORES:
+            with open(os.path.join(path, "cpu.max"), "w") as f:
+                f.write(f"{int(CPU_CORES * 100000)} 100000")
+    except OSError:
+        _drop_cgroup(path)
+        return ""
+    return path
+
+def _drop_cgroup(path: str) -> None:
+    if path:
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+def _emit_lines(buf: bytes, on_line: Callable[[str], None]) -> bytes:
+    # Hands complete lines to on_line and returns the unfinished remainder;
+    # a runaway line without newlines is cut at MAX_LINE_BYTES.
+    *lines, rest = buf.split(b"\n")
+    while len(rest) > MAX_LINE_BYTES:
+        lines.append(rest[:MAX_LINE_BYTES])
+        rest = rest[MAX_LINE_BYTES:]
+    for line in lines:
+        on_line(line[:MAX_LINE_BYTES].decode("utf-8", errors="ignore"))
+    return rest
+
+def _kill_group(p: subprocess.Popen) -> None:
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(p.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            p.wait(timeout=KILL_GRACE)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+def run_stream(cmd: str, cwd: str | None = None, env: dict | None = None, timeout: int = 600,
+               on_line: Callable[[str], None] | None = None, spill_path: str | None = None,
+               limited: bool = False) -> Tuple[int, str]:
+    """Run cmd with bounded memory. Returns (exit code, head + tail of the output);
+    every line goes to on_line as it arrives and the whole output to spill_path.
+    limited applies the sandbox CPU/memory limits."""
+    with tracing.span("cmd", cmd=os.path.basename(cmd.split(" ", 1)[0])) as sp:
+        cgroup = _make_cgroup() if limited else ""
+        prefix = _limit_prefix(cgroup) if limited else ""
+        p = subprocess.Popen(prefix + cmd, shell=True, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, cwd=cwd, env=env, start_new_session=True)
+        head = bytearray()
+        tail: Deque[bytes] = deque()
+        tail_size = total = 0
+        partial = b""
+        spill = SpillFile(spill_path) if spill_path else None
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        fd = p.stdout.fileno()
+        try:
+            with selectors.DefaultSelector() as sel:
+                sel.register(fd, selectors.EVENT_READ)
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        timed_out = True
+                        break
+                    if not sel.select(timeout=min(remaining, 1.0)):
+                        continue
+                    data = os.read(fd, 65536)
+                    if not data:
+                        break
+                    total += len(data)
+                    if spill:
+                        spill.write(data)
+                    if on_line:
+                        partial = _emit_lines(partial + data, on_line)
+                    room = OUTPUT_HEAD_BYTES - len(head)
+                    if room > 0:
+                        head.extend(data[:room])
+                        data = data[room:]
+                    if data:
+                        tail.append(data)
+                        tail_size += len(data)
+                        while tail_size - len(tail[0]) >= OUTPUT_TAIL_BYTES:
+                            tail_size -= len(tail.popleft())
+                        if tail_size > OUTPUT_TAIL_BYTES:
+                            tail[0] = tail[0][tail_size - OUTPUT_TAIL_BYTES:]
+                            tail_size = OUTPUT_TAIL_BYTES
+            if on_line and partial:
+                on_line(partial.decode("utf-8", errors="ignore"))
+            if timed_out:
+                _kill_group(p)
+            else:
+                try:
+                    p.wait(timeout=max(1.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    timed_out = True
+                    _kill_group(p)
+        finally:
+            if p.poll() is None:
+                _kill_group(p)
+            p.stdout.close()
+            if spill:
+                spill.close()
+            _drop_cgroup(cgroup)
+        sp.update(bytes=total)
+        if timed_out:
+            sp["exit_code"] = 124
+            return 124, "Command timed out"
+        sp["exit_code"] = p.returncode
+        kept = len(head) + tail_size
+        text = bytes(head)
+        if kept < total:
+            text += f"\n... [{total - kept} bytes omitted] ...\n".encode()
+        text += b"".join(tail)
+        return p.returncode, text.decode("utf-8", errors="ignore")
+
+def run_cmd(cmd: str, cwd: str | None = None, env: dict | None = None, timeout: int = 600,
+            limited: bool = False) -> Tuple[int, str]:
+    return run_stream(cmd, cwd=cwd, env=env, timeout=timeout, limited=limited)
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    # Cross-process lock shared by workers on the same WORKSPACE_ROOT volume.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
 
 def new_workspace(root: str) -> str:
     os.makedirs(root, exist_ok=True)
     return tempfile.mkdtemp(prefix="repo_", dir=root)
 
+def create_venv(venv: str) -> bool:
+    code, out = run_cmd(f"python -m venv {venv}", timeout=300)
+    if code != 0:
+        return False
+    pip = os.path.join(venv, "bin", "pip")
+    run_cmd(f"{pip} install -U pip", timeout=300)
+    return True
+
 def prepare_env(workdir: str) -> str:
     venv = os.path.join(workdir, ".venv")
-    code, out = run_cmd(f"python -m venv .venv", cwd=workdir, timeout=300)
-    if code != 0:
+    if not create_venv(venv):
         return ""
-    pip = os.path.join(venv, "bin", "pip")
-    run_cmd(f"{pip} install -U pip", cwd=workdir, timeout=300)
     return venv
 
 def install_requirements(workdir: str, venv: str) -> None:
@@ -32,12 +266,16 @@ def install_requirements(workdir: str, venv: str) -> None:
     if os.path.exists(req):
         run_cmd(f"{pip} install -r requirements.txt", cwd=workdir, timeout=1200)
     # Ensure pytest-related deps exist
-    run_cmd(f"{pip} install pytest pytest-cov hypothesis", cwd=workdir, timeout=600)
+    run_cmd(f"{pip} install {' '.join(TOOL_PINS)}", cwd=workdir, timeout=600)
 
-def clone_pr(repo_https_url: str, pr_number: int, token: str, workdir: str) -> Tuple[int, str]:
+def auth_url(repo_https_url: str, token: str) -> str:
     # Use token in URL for private repos
-    auth_url = repo_https_url.replace("https://", f"https://{token}@")
-    code, out = run_cmd(f"git clone {auth_url} .", cwd=workdir)
+    if not token or not repo_https_url.startswith("https://"):
+        return repo_https_url
+    return repo_https_url.replace("https://", f"https://{token}@")
+
+def clone_pr(repo_https_url: str, pr_number: int, token: str, workdir: str) -> Tuple[int, str]:
+    code, out = run_cmd(f"git clone {auth_url(repo_https_url, token)} .", cwd=workdir)
     if code != 0:
         return code, out
     # Fetch PR head
@@ -52,10 +290,14 @@ def write_files(workdir: str, files: Dict[str, str]) -> None:
         with open(path, "w", encoding="utf-8") as f:
             f.write(content)
 
-def run_pytest(workdir: str, venv: str) -> Tuple[int, str]:
+def run_pytest(workdir: str, venv: str, extra_args: str = "",
+               on_line: Callable[[str], None] | None = None) -> Tuple[int, str]:
+    # The complete console output is spilled to OUTPUT_LOG in the workdir.
     pytest_bin = os.path.join(venv, "bin", "pytest")
-    code, out = run_cmd(f"{pytest_bin} -q --maxfail=1 --disable-warnings --junitxml=report.xml", cwd=workdir, timeout=1800)
-    return code, out
+    maxfail = f" --maxfail={PYTEST_MAXFAIL}" if PYTEST_MAXFAIL > 0 else ""
+    return run_stream(f"{pytest_bin} -q{maxfail} --disable-warnings -o junit_family=xunit1 --junitxml=report.xml {extra_args}",
+                      cwd=workdir, timeout=1800, on_line=on_line, spill_path=os.path.join(workdir, OUTPUT_LOG),
+                      limited=True)
 
 def read_file(workdir: str, rel: str) -> str:
     with open(os.path.join(workdir, rel), "r", encoding="utf-8") as f:
@@ -63,7 +305,9 @@ def read_file(workdir: str, rel: str) -> str:
 
 def list_py_files(workdir: str) -> list[str]:
     files: list[str] = []
-    for root, _, fs in os.walk(workdir):
+    for root, dirs, fs in os.walk(workdir):
+        # The env stage may be populating .venv concurrently
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.endswith(".egg-info")]
         for name in fs:
             if name.endswith(".py"):
                 rel = os.path.relpath(os.path.join(root, name), workdir)
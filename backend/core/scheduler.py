@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from .models import Project, PullRequest, Job, Span
+from . import tracing
+
+# Fair-share admission of pipelines. Webhooks only queue an orchestrate Job; the
+# scheduler hands queued jobs to workers while their project is under its
+# concurrency cap and there are free slots overall. Free slots go to the project
+# with the fewest running pipelines per unit of weight, and within a project to
+# the highest effective priority (PR state plus time waited), then the oldest.
+
+ACTIVE_STATUSES = ("queued", "running")
+# Base priority of a ready-for-review PR; drafts and labels shift it.
+BASE_PRIORITY = 100
+
+def priority(draft: bool, labels: Iterable[str], draft_penalty: int, label_points: Dict[str, int]) -> int:
+    return BASE_PRIORITY - (draft_penalty if draft else 0) + sum(label_points.get(name, 0) for name in labels)
+
+def effective_priority(base: int, queued_at: datetime, now: datetime, aging_seconds: int) -> float:
+    # Aging: a job gains a point per aging_seconds waited, so low priority work is never starved.
+    waited = max(0.0, (now - queued_at).total_seconds())
+    return base + (waited / aging_seconds if aging_seconds > 0 else 0.0)
+
+def plan(queued: List[Dict[str, Any]], running: Dict[int, int], caps: Dict[int, int], weights: Dict[int, float],
+         slots: Optional[int], now: datetime, aging_seconds: int) -> List[int]:
+    """Pick queued jobs ({"id", "project_id", "priority", "created_at"}) to start, in order.
+    running: project -> pipelines holding a slot; caps: project -> max running (<= 0 = no cap);
+    slots: free slots overall (None = unlimited). No I/O, so it can be exercised on its own."""
+    heads: Dict[int, List[Dict[str, Any]]] = {}
+    for job in queued:
+        job = {**job, "effective": effective_priority(job["priority"], job["created_at"], now, aging_seconds)}
+        heads.setdefault(job["project_id"], []).append(job)
+    for jobs in heads.values():
+        jobs.sort(key=lambda j: (-j["effective"], j["created_at"], j["id"]))
+    load = dict(running)
+    picked: List[int] = []
+    while slots is None or len(picked) < slots:
+        eligible = [p for p, jobs in heads.items()
+                    if jobs and (caps.get(p, 0) <= 0 or load.get(p, 0) < caps[p])]
+        if not eligible:
+            break
+        project = min(eligible, key=lambda p: (load.get(p, 0) / max(weights.get(p, 1.0), 0.01),
+                                               -heads[p][0]["effective"], heads[p][0]["created_at"]))
+        picked.append(heads[project].pop(0)["id"])
+        load[project] = load.get(project, 0) + 1
+    return picked
+
+def _holding(lease_ttl: int):
+    # Admitted pipelines still holding a slot; ones past the lease TTL are presumed dead.
+    return Job.objects.filter(job_type="orchestrate", status__in=ACTIVE_STATUSES, dispatched_at__isnull=False,
+                              dispatched_at__gte=timezone.now() - timedelta(seconds=lease_ttl))
+
+def stale(lease_ttl: int):
+    # Running pipelines past the lease TTL: their worker died without an errback (hard kill, lost node).
+    cutoff = timezone.now() - timedelta(seconds=lease_ttl)
+    return Job.objects.filter(job_type="orchestrate", status="running").filter(
+        Q(dispatched_at__lt=cutoff) | Q(dispatched_at__isnull=True, started_at__lt=cutoff))
+
+def requeue_lost(lease_ttl: int) -> int:
+    """Put pipelines admitted more than lease_ttl ago that never started (their message was lost)
+    back in the queue; otherwise they would hold their project's slot and absorb new pushes forever."""
+    cutoff = timezone.now() - timedelta(seconds=lease_ttl)
+    return Job.objects.filter(job_type="orchestrate", status="queued", dispatched_at__lt=cutoff).update(
+        dispatched_at=None)
+
+def live(lease_ttl: int):
+    """Orchestrate jobs that are queued, or running and not presumed dead."""
+    return Job.objects.filter(job_type="orchestrate", status__in=ACTIVE_STATUSES).exclude(
+        id__in=stale(lease_ttl).values("id"))
+
+def admit(max_total: int, project_default: int, lease_ttl: int, aging_seconds: int) -> List[Job]:
+    """Mark the jobs to start now as dispatched and return them; the caller sends them to the workers.
+    Concurrent callers serialize on the queued rows."""
+    now = timezone.now()
+    with transaction.atomic():
+        queued = list(Job.objects.select_for_update(of=("self",))
+                      .filter(job_type="orchestrate", status="queued", dispatched_at__isnull=True)
+                      .values("id", "pr__project_id", "priority", "created_at"))
+        if not queued:
+            return []
+        running = dict(_holding(lease_ttl).values_list("pr__project_id").annotate(n=Count("id")))
+        slots = max(0, max_total - sum(running.values())) if max_total > 0 else None
+        projects = Project.objects.filter(id__in={j["pr__project_id"] for j in queued}).values_list(
+            "id", "max_concurrency", "weight")
+        caps = {pid: cap or project_default for pid, cap, _ in projects}
+        weights = {pid: weight for pid, _, weight in projects}
+        ids = plan([{**j, "project_id": j["pr__project_id"]} for j in queued], running, caps, weights,
+                   slots, now, aging_seconds)
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(dispatched_at=now)
+    jobs = {j.id: j for j in Job.objects.select_related("pr").filter(id__in=ids)}
+    # Time spent queued is recorded as the "queue" stage, next to the real stages on /latency/ and /metrics.
+    Span.objects.bulk_create([
+        Span(job=job, project_id=job.pr.project_id, stage="queue", name="stage", started_at=job.created_at,
+             duration=(now - job.created_at).total_seconds(), attrs={"priority": job.priority})
+        for job in jobs.values()
+    ])
+    return [jobs[i] for i in ids if i in jobs]
+
+def reprioritize(pr: PullRequest, value: int) -> int:
+    """Apply a new priority to pr's pipelines that are still waiting."""
+    return Job.objects.filter(pr=pr, job_type="orchestrate", status="queued", dispatched_at__isnull=True).update(
+        priority=value)
+
+def queue_stats(lease_ttl: int) -> List[Dict[str, Any]]:
+    """Per project: pipelines waiting, pipelines holding a slot and the oldest wait in seconds."""
+    now = timezone.now()
+    rows: Dict[str, Dict[str, Any]] = {}
+    waiting = (Job.objects.filter(job_type="orchestrate", status="queued", dispatched_at__isnull=True)
+               .values("pr__project__repo_full_name").annotate(n=Count("id"), oldest=Min("created_at")))
+    for row in waiting:
+        rows[row["pr__project__repo_full_name"]] = {
+            "queued": row["n"], "running": 0, "oldest_wait": (now - row["oldest"]).total_seconds()}
+    for name, n in _holding(lease_ttl).values_list("pr__project__repo_full_name").annotate(n=Count("id")):
+        rows.setdefault(name, {"queued": 0, "running": 0, "oldest_wait": 0.0})["running"] = n
+    return [{"project": name, **row} for name, row in sorted(rows.items())]
+
+def metrics_text(lease_ttl: int) -> str:
+    stats = queue_stats(lease_ttl)
+    lines = [
+        "# HELP qa_pipeline_queue_depth Pipelines waiting for a slot.",
+        "# TYPE qa_pipeline_queue_depth gauge",
+    ]
+    lines += [f"qa_pipeline_queue_depth{{{tracing._labels(project=s['project'])}}} {s['queued']}" for s in stats]
+    lines += [
+        "# HELP qa_pipelines_running Admitted pipelines holding a slot.",
+        "# TYPE qa_pipelines_running gauge",
+    ]
+    lines += [f"qa_pipelines_running{{{tracing._labels(project=s['project'])}}} {s['running']}" for s in stats]
+    lines += [
+        "# HELP qa_pipeline_oldest_wait_seconds Wait of the oldest queued pipeline.",
+        "# TYPE qa_pipeline_oldest_wait_seconds gauge",
+    ]
+    lines += [f"qa_pipeline_oldest_wait_seconds{{{tracing._labels(project=s['project'])}}} {s['oldest_wait']:.3f}"
+              for s in stats]
+    return "\n".join(lines) + "\n"
@@ -1,19 +1,45 @@
 from rest_framework import serializers
-from .models import PullRequest, TestRun, Failure
+from .models import PullRequest, PullRequestSummary, TestRun, Failure
+
+# List serializers: no nested collections and no large text fields. Runs and
+# failures have their own paginated endpoints (see core.api).
 
 class FailureSerializer(serializers.ModelSerializer):
     class Meta:
         model = Failure
-        fields = "__all__"
+        fields = ["id", "test_run", "test_name", "file", "line", "message", "failure_type", "duration", "flaky", "cluster"]
 
 class TestRunSerializer(serializers.ModelSerializer):
-    failures = FailureSerializer(many=True, read_only=True)
+    output_url = serializers.SerializerMethodField()
+    junit_url = serializers.SerializerMethodField()
+
     class Meta:
         model = TestRun
-        fields = "__all__"
+        fields = ["id", "pr", "started_at", "finished_at", "passed", "failed", "errors", "flaky", "coverage", "selection",
+                  "output_url", "junit_url"]
+
+    def get_output_url(self, run: TestRun) -> str:
+        return f"/runs/{run.id}/output.txt" if run.output_blob else f"/runs/{run.id}/output/tail/"
+
+    def get_junit_url(self, run: TestRun) -> str:
+        return f"/runs/{run.id}/junit.xml" if run.junit_blob else ""
+
+class PullRequestSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PullRequestSummary
+        fields = ["runs", "latest_run", "latest_status", "passed", "failed", "errors", "coverage", "pass_rate", "trend"]
 
 class PullRequestSerializer(serializers.ModelSerializer):
-    test_runs = TestRunSerializer(many=True, read_only=True)
+    repo = serializers.CharField(source="project.repo_full_name", read_only=True)
+    summary = serializers.SerializerMethodField()
+
     class Meta:
         model = PullRequest
-        fields = "__all__"
+        fields = ["id", "repo", "number", "title", "head_sha", "head_ref", "author", "status", "created_at",
+                  "updated_at", "summary"]
+
+    def get_summary(self, pr: PullRequest):
+        try:
+            return PullRequestSummarySerializer(pr.summary).data
+        except PullRequestSummary.DoesNotExist:
+            return None
@@ -0,0 +1,133 @@
+import glob
+import heapq
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from django.utils import timezone
+from .models import Project, TestDuration
+from . import sandbox
+from . import junit
+from . import impact
+
+# Used for tests with no recorded duration yet.
+DEFAULT_DURATION = 1.0
+# Weight of the newest observation in the per-test moving average.
+DURATION_ALPHA = 0.3
+
+def collect(workdir: str, venv: str, extra_args: str = "") -> Tuple[List[str], List[str]]:
+    """Collected node ids, plus files that failed to collect (so they still get reported)."""
+    pytest_bin = os.path.join(venv, "bin", "pytest")
+    node_ids, broken = [], []
+
+    def parse(line: str) -> None:
+        if line.startswith("ERROR ") and line.split()[1:]:
+            broken.append(line.split()[1])
+        elif "::" in line and not line.startswith(" "):
+            node_ids.append(line.strip())
+
+    # Parsed as it streams: large suites print far more ids than the runner keeps in memory.
+    sandbox.run_stream(f"{pytest_bin} --collect-only -q {extra_args}", cwd=workdir, timeout=600, on_line=parse,
+                       limited=True)
+    return node_ids, broken
+
+def junit_key(node_id: str) -> str:
+    # tests/test_x.py::TestA::test_b[1] -> tests.test_x.TestA::test_b[1], matching
+    # the classname/name pytest writes into JUnit reports.
+    path, *rest = node_id.split("::")
+    module = path[:-3].replace("/", ".") if path.endswith(".py") else path.replace("/", ".")
+    if not rest:
+        return module
+    return "::".join([".".join([module] + rest[:-1]), rest[-1]])
+
+def known_durations(project: Project, node_ids: List[str]) -> Dict[str, float]:
+    keys = {junit_key(n): n for n in node_ids}
+    rows = TestDuration.objects.filter(project=project, key__in=list(keys)).values_list("key", "duration")
+    return {keys[k]: d for k, d in rows}
+
+def plan_shards(node_ids: List[str], durations: Dict[str, float], shards: int) -> List[List[str]]:
+    """Longest-processing-time-first: biggest test into the currently lightest shard."""
+    shards = max(1, min(shards, len(node_ids)))
+    if durations:
+        fallback = sorted(durations.values())[len(durations) // 2]
+    else:
+        fallback = DEFAULT_DURATION
+    weighted = sorted(node_ids, key=lambda n: durations.get(n, fallback), reverse=True)
+    heap: List[Tuple[float, int]] = [(0.0, i) for i in range(shards)]
+    plan: List[List[str]] = [[] for _ in range(shards)]
+    for node in weighted:
+        load, i = heapq.heappop(heap)
+        plan[i].append(node)
+        heapq.heappush(heap, (load + durations.get(node, fallback), i))
+    # Keep collection order inside each shard so module/class fixtures are reused.
+    order = {n: i for i, n in enumerate(node_ids)}
+    return [sorted(p, key=order.__getitem__) for p in plan if p]
+
+def run_shard(workdir: str, venv: str, tag: str, node_ids: List[str], extra_args: str = "",
+              on_line: Optional[Callable[[str], None]] = None, cov_sources: Optional[List[str]] = None) -> Tuple[int, str]:
+    args_file = os.path.join(workdir, f".qa-shard-{tag}.txt")
+    with open(args_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(node_ids))
+    pytest_bin = os.path.join(venv, "bin", "pytest")
+    env = None
+    if cov_sources is not None:
+        # One data file and JSON report per shard; impact.percent_covered merges the reports.
+        extra_args = f"{extra_args} {impact.coverage_args(cov_sources, impact.report_path(tag))}"
+        env = {**os.environ, "COVERAGE_FILE": os.path.join(workdir, f".qa-coverage-{tag}")}
+    # No --maxfail here: every shard reports its full picture.
+    return sandbox.run_stream(
+        f"{pytest_bin} @{args_file} -q --disable-warnings -o junit_family=xunit1 --junitxml=report-{tag}.xml {extra_args}",
+        cwd=workdir, env=env, timeout=1800, on_line=on_line, spill_path=os.path.join(workdir, f".qa-shard-{tag}.log"),
+        limited=True,
+    )
+
+def run_local(workdir: str, venv: str, plan: List[List[str]], prefix: str = "", extra_args: str = "",
+              on_line: Optional[Callable[[str], None]] = None,
+              cov_sources: Optional[List[str]] = None) -> Tuple[int, str]:
+    """Run the shards concurrently, one pytest process each; returns (worst exit code, combined
+    head/tail output). Lines reach on_line tagged with their shard as they are printed."""
+    def shard_lines(tag: str) -> Optional[Callable[[str], None]]:
+        return (lambda line: on_line(f"[{tag}] {line}")) if on_line else None
+
+    with ThreadPoolExecutor(max_workers=max(1, len(plan))) as pool:
+        futures = [pool.submit(run_shard, workdir, venv, f"{prefix}{i}", ids, extra_args, shard_lines(f"{prefix}{i}"),
+                               cov_sources)
+                   for i, ids in enumerate(plan)]
+        results = [f.result() for f in futures]
+    code = max((c for c, _ in results), default=0)
+    out = "\n".join(f"===== shard {prefix}{i} ({len(plan[i])} tests) =====\n{o}" for i, (_, o) in enumerate(results))
+    return code, out
+
+def combine_output(workdir: str, dest: str = sandbox.OUTPUT_LOG) -> str:
+    """Concatenate the shards' spilled output into one file (streamed, not read into memory)."""
+    path = os.path.join(workdir, dest)
+    with open(path, "wb") as out:
+        for src in sorted(glob.glob(os.path.join(workdir, ".qa-shard-*.log"))):
+            tag = os.path.basename(src)[len(".qa-shard-"):-len(".log")]
+            out.write(f"===== shard {tag} =====\n".encode())
+            with open(src, "rb") as f:
+                shutil.copyfileobj(f, out)
+    return path
+
+def merge_junit(workdir: str, pattern: str = "report-*.xml", dest: str = "report.xml") -> None:
+    junit.merge(sorted(glob.glob(os.path.join(workdir, pattern))), os.path.join(workdir, dest))
+
+def record_durations(project: Project, cases: List[Tuple[str, float]]) -> None:
+    """cases: (junit key, seconds). Folds them into the per-test moving average."""
+    if not cases:
+        return
+    latest = dict(cases)
+    existing = {d.key: d for d in TestDuration.objects.filter(project=project, key__in=list(latest))}
+    now = timezone.now()
+    to_update, to_create = [], []
+    for key, seconds in latest.items():
+        row = existing.get(key)
+        if row is None:
+            to_create.append(TestDuration(project=project, key=key, duration=seconds, runs=1, updated_at=now))
+        else:
+            row.duration = DURATION_ALPHA * seconds + (1 - DURATION_ALPHA) * row.duration
+            row.runs += 1
+            row.updated_at = now
+            to_update.append(row)
+    TestDuration.objects.bulk_update(to_update, ["duration", "runs", "updated_at"], batch_size=500)
+    TestDuration.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
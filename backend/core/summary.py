@@ -0,0 +1,56 @@
+from typing import Any, Dict
+from django.db import transaction
+from django.utils import timezone
+from .models import PullRequest, PullRequestSummary, TestRun
+
+# Cached per-PR aggregates. Every finished TestRun is folded in (idempotently), so the
+# dashboard and PR pages read one row instead of aggregating over the runs.
+
+# Runs kept in the pass-rate trend.
+TREND_LENGTH = 30
+
+def pass_rate(passed: int, failed: int, errors: int) -> float:
+    total = passed + failed + errors
+    return round(passed / total, 4) if total else 0.0
+
+def _point(run: TestRun) -> Dict[str, Any]:
+    return {"id": run.id, "at": run.started_at.isoformat(), "passed": run.passed, "failed": run.failed,
+            "errors": run.errors, "pass_rate": pass_rate(run.passed, run.failed, run.errors)}
+
+def record_run(run: TestRun) -> PullRequestSummary:
+    """Fold a finished run into its PR's summary."""
+    with transaction.atomic():
+        PullRequestSummary.objects.get_or_create(pr_id=run.pr_id)
+        summary = PullRequestSummary.objects.select_for_update().get(pr_id=run.pr_id)
+        trend = [p for p in summary.trend if p["id"] != run.id] + [_point(run)]
+        summary.trend = sorted(trend, key=lambda p: p["at"])[-TREND_LENGTH:]
+        # Counted, not incremented: a redelivered stage records the same run again.
+        summary.runs = TestRun.objects.filter(pr_id=run.pr_id).count()
+        if summary.latest_run_id is None or run.id >= summary.latest_run_id:
+            summary.latest_run_id = run.id
+            summary.latest_status = "success" if run.failed == 0 and run.errors == 0 else "failure"
+            summary.passed, summary.failed, summary.errors = run.passed, run.failed, run.errors
+            summary.coverage = run.coverage
+            summary.pass_rate = pass_rate(run.passed, run.failed, run.errors)
+        summary.updated_at = timezone.now()
+        summary.save()
+    return summary
+
+def rebuild(pr: PullRequest) -> PullRequestSummary:
+    """Recompute a PR's summary from its runs (backfill / repair)."""
+    runs = list(TestRun.objects.filter(pr=pr).only("id", "pr_id", "started_at", "passed", "failed", "errors", "coverage")
+                .order_by("-started_at")[:TREND_LENGTH])
+    latest = runs[0] if runs else None
+    summary, _ = PullRequestSummary.objects.update_or_create(pr=pr, defaults={
+        "runs": TestRun.objects.filter(pr=pr).count(),
+        "latest_run": latest,
+        "latest_status": ("success" if latest.failed == 0 and latest.errors == 0 else "failure") if latest else "",
+        "passed": latest.passed if latest else 0,
+        "failed": latest.failed if latest else 0,
+        "errors": latest.errors if latest else 0,
+        "coverage": latest.coverage if latest else 0.0,
+        "pass_rate": pass_rate(latest.passed, latest.failed, latest.errors) if latest else 0.0,
+        "trend": [_point(r) for r in reversed(runs)],
+        "updated_at": timezone.now(),
+    })
+    return summary
@@ -1,152 +1,967 @@
 import os
+import re
 import json
-import datetime
-from celery import shared_task
+import shlex
+import shutil
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from celery import shared_task, chain, chord, group, current_task, current_app
 from django.utils import timezone
 from django.conf import settings
-from .models import PullRequest, Project, Job, GeneratedTest, TestRun, Failure, FailureCluster, PatchSuggestion
-from .github import post_pr_comment
+from .models import PullRequest, Project, Job, GeneratedTest, TestRun, Failure, FailureCluster, PatchSuggestion, WebhookDelivery, AnalysisFinding, Span, CoverageMap
+from .github import post_pr_comment, create_check_run
 from . import sandbox
+from . import analysis
+from . import envcache
+from . import pool
+from . import mirror
+from . import diff as diff_mod
+from . import cache as cache_mod
+from . import sharding
+from . import junit
+from . import blobs
+from . import joblog
+from . import tracing
+from . import index as index_mod
+from . import impact as impact_mod
+from . import summary as summary_mod
+from . import scheduler
+from . import checkpoint
+from . import preflight
+from . import flaky
 from . import ai as ai_mod
 
+class PipelineCancelled(RuntimeError):
+    """Raised at a stage boundary once a newer push superseded the pipeline."""
+
 def log(job: Job, msg: str) -> None:
-    job.logs += f"{datetime.datetime.utcnow().isoformat()}Z {msg}\n"
-    job.save(update_fields=["logs"])
+    joblog.append(job, joblog.stamp(msg))
+
+def start_job(pr: PullRequest, job_type: str) -> Job:
+    task_id = current_task.request.id if current_task else None
+    job = Job.objects.create(pr=pr, job_type=job_type, status="running", started_at=timezone.now(),
+                             task_id=task_id or "")
+    tracing.begin(job.id, pr.project_id, job_type)
+    return job
+
+def finish_job(job: Job, status: str = "success", logs: str | None = None) -> None:
+    if logs:
+        joblog.append(job, logs if logs.endswith("\n") else logs + "\n")
+    job.status = status
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at"])
+    trace = tracing.current()
+    if trace is None or trace["job_id"] != job.id:
+        # The orchestrate job spans the whole pipeline (end-to-end latency).
+        project_id = PullRequest.objects.filter(id=job.pr_id).values_list("project_id", flat=True).first()
+        tracing.begin(job.id, project_id, "pipeline" if job.job_type == "orchestrate" else job.job_type,
+                      job.started_at.timestamp() if job.started_at else None)
+    tracing.end(status)
+
+def resume_job(pr: PullRequest, job_type: str, cp) -> None:
+    # A stage satisfied by a checkpoint still gets its (instant) job, so the PR page shows where it came from.
+    job = start_job(pr, job_type)
+    finish_job(job, logs=f"resumed from the checkpoint of job {cp.job_id} ({cp.created_at:%Y-%m-%d %H:%M:%S})")
+
+def ensure_active(ctx: Dict[str, Any]) -> None:
+    # Cooperative cancellation point, checked at the start of every stage. A reaped pipeline
+    # ("failure") stops too, in case its redelivered stages turn up after the retry was queued.
+    if Job.objects.filter(id=ctx["job_id"], status__in=("cancelled", "failure")).exists():
+        raise PipelineCancelled(f"pipeline {ctx['job_id']} was superseded")
+
+CHECK_NAME = "QAgnite"
+
+def report_to_github(pr: PullRequest, job: Job, summary: str, conclusion: str | None = None) -> None:
+    # One check run per pipeline (if enabled) and one sticky summary comment per PR.
+    check_run_id = create_check_run(pr.project.repo_full_name, job.head_sha or pr.head_sha, CHECK_NAME, summary,
+                                    conclusion, job.payload.get("check_run_id"))
+    if check_run_id and check_run_id != job.payload.get("check_run_id"):
+        job.payload["check_run_id"] = check_run_id
+        job.save(update_fields=["payload"])
+    if conclusion is None:
+        return
+    comment_id = post_pr_comment(pr.project.repo_full_name, pr.number, summary, pr.summary_comment_id)
+    if comment_id and comment_id != pr.summary_comment_id:
+        pr.summary_comment_id = comment_id
+        pr.save(update_fields=["summary_comment_id"])
+
+def merge_ctx(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Chord bodies receive one context per header task; fold them back into one.
+    ctx: Dict[str, Any] = {}
+    for r in results:
+        ctx.update(r or {})
+    return ctx
+
+def build_stages(ctx: Dict[str, Any]):
+    # analysis || ((generate || env) -> preflight -> execute -> rerun -> triage -> patch), then report.
+    # Built once the checkout exists so every header gets the full context.
+    execute_branch = chain(
+        chord(group(stage_generate.si(ctx), stage_prepare_env.si(ctx)), stage_preflight.s()),
+        stage_execute.s(),
+        stage_rerun.s(),
+        stage_triage.s(),
+        stage_patch.s(),
+    )
+    return chord(group(stage_analysis.si(ctx), execute_branch), stage_report.s()).on_error(
+        pipeline_failed.s(ctx["pr_id"], ctx["job_id"])
+    )
+
+ACTIVE_STATUSES = ("queued", "running")
+
+def supersede_runs(pr: PullRequest, head_sha: str) -> List[int]:
+    """Cancel orchestrations of pr for any other head and revoke their tasks. Returns cancelled job ids."""
+    stale = list(Job.objects.filter(pr=pr, job_type="orchestrate", status__in=ACTIVE_STATUSES)
+                 .exclude(head_sha=head_sha).values_list("id", "task_id"))
+    if not stale:
+        return []
+    ids = [job_id for job_id, _ in stale]
+    Job.objects.filter(id__in=ids, status__in=ACTIVE_STATUSES).update(status="cancelled", finished_at=timezone.now())
+    # Queued orchestrations are dropped by the workers; stage tasks already running
+    # are terminated (or, with PIPELINE_CANCEL_TERMINATE=0, stop at the next stage boundary).
+    task_ids = [t for _, t in stale if t]
+    running = list(Job.objects.filter(pr=pr, status="running").exclude(task_id="").exclude(job_type="orchestrate")
+                   .values_list("id", "task_id"))
+    if task_ids:
+        current_app.control.revoke(task_ids)
+    if running:
+        current_app.control.revoke([t for _, t in running], terminate=settings.PIPELINE_CANCEL_TERMINATE)
+        Job.objects.filter(id__in=[j for j, _ in running]).update(status="cancelled", finished_at=timezone.now())
+    for job_id in ids:
+        joblog.append(Job(id=job_id), joblog.stamp(f"superseded by {head_sha[:12]}"))
+    return ids
+
+def pr_state(pull_request: Dict[str, Any]) -> Dict[str, Any]:
+    return {"draft": bool(pull_request.get("draft")),
+            "labels": [label["name"] for label in pull_request.get("labels", []) if label.get("name")]}
+
+def pr_priority(pr: PullRequest) -> int:
+    return scheduler.priority(pr.draft, pr.labels, settings.PIPELINE_DRAFT_PENALTY, settings.PIPELINE_LABEL_PRIORITIES)
+
+@shared_task
+def schedule_pipelines() -> int:
+    """Start the queued pipelines that fit; runs on every new pipeline, when one finishes, and from beat."""
+    jobs = scheduler.admit(settings.PIPELINE_MAX_CONCURRENCY, settings.PIPELINE_PROJECT_CONCURRENCY,
+                           settings.WORKSPACE_LEASE_TTL, settings.PIPELINE_AGING_SECONDS)
+    for job in jobs:
+        result = orchestrate_pr.apply_async((job.pr_id,), {"job_id": job.id})
+        Job.objects.filter(id=job.id).update(task_id=result.id)
+    return len(jobs)
+
+@shared_task
+def ingest_delivery(delivery_id: int) -> None:
+    delivery = WebhookDelivery.objects.get(id=delivery_id)
+    if delivery.processed_at is not None:
+        return
+    data = json.loads(delivery.payload)
+    action = data.get("action")
+    status = "ignored"
+    if delivery.event == "push":
+        # Pushes to the default branch refresh the project's coverage map.
+        project = Project.objects.filter(repo_full_name=data.get("repository", {}).get("full_name", "")).first()
+        if (project and settings.TEST_IMPACT_ENABLED and not data.get("deleted")
+                and data.get("ref") == f"refs/heads/{project.default_branch}"):
+            request_coverage_map(project.id, data["after"])
+            status = "processed"
+    elif action in ("opened", "synchronize", "ready_for_review", "reopened"):
+        repo_full = data["repository"]["full_name"]
+        pr_num = data["number"]
+        title = data["pull_request"]["title"]
+        head_sha = data["pull_request"]["head"]["sha"]
+        head_ref = data["pull_request"]["head"]["ref"]
+        project, _ = Project.objects.get_or_create(
+            repo_full_name=repo_full, defaults={"default_branch": data["repository"]["default_branch"]}
+        )
+        pr, _ = PullRequest.objects.update_or_create(
+            project=project, number=pr_num,
+            defaults={"title": title, "head_sha": head_sha, "head_ref": head_ref, "status": "pending",
+                      **pr_state(data["pull_request"])},
+        )
+        supersede_runs(pr, head_sha)
+        if scheduler.live(settings.WORKSPACE_LEASE_TTL).filter(pr=pr, head_sha=head_sha).exists():
+            # Same head already queued or running (e.g. reopened right after a push).
+            status = "coalesced"
+            scheduler.reprioritize(pr, pr_priority(pr))
+        else:
+            # Queued for the scheduler, which starts it once the project has a free slot.
+            Job.objects.create(pr=pr, job_type="orchestrate", status="queued", head_sha=head_sha,
+                               priority=pr_priority(pr))
+            status = "processed"
+        schedule_pipelines.delay()
+    elif action in ("converted_to_draft", "labeled", "unlabeled"):
+        # Only the priority of a waiting pipeline changes.
+        pr = PullRequest.objects.filter(project__repo_full_name=data["repository"]["full_name"],
+                                        number=data["number"]).first()
+        if pr is not None:
+            for field, value in pr_state(data["pull_request"]).items():
+                setattr(pr, field, value)
+            pr.save(update_fields=["draft", "labels"])
+            scheduler.reprioritize(pr, pr_priority(pr))
+            status = "processed"
+    delivery.status = status
+    delivery.processed_at = timezone.now()
+    delivery.save(update_fields=["status", "processed_at"])
 
 @shared_task
-def orchestrate_pr(pr_id: int) -> None:
-    pr = PullRequest.objects.get(id=pr_id)
+def orchestrate_pr(pr_id: int, job_id: int | None = None) -> None:
+    pr = PullRequest.objects.select_related("project").get(id=pr_id)
+    if job_id is None:
+        job = Job.objects.create(pr=pr, job_type="orchestrate", status="running", head_sha=pr.head_sha,
+                                 started_at=timezone.now())
+    elif not Job.objects.filter(id=job_id, status="queued").update(status="running", started_at=timezone.now()):
+        return  # superseded before a worker picked it up
+    else:
+        job = Job.objects.get(id=job_id)
     pr.status = "running"
     pr.save(update_fields=["status"])
+    attempt = job.payload.get("attempt", 1)
+    report_to_github(pr, job, f"Running for {(job.head_sha or pr.head_sha)[:12]}"
+                              + (f" (attempt {attempt})" if attempt > 1 else ""))
 
-    job = Job.objects.create(pr=pr, job_type="orchestrate", status="running", started_at=timezone.now())
-    try:
-        workdir = sandbox.new_workspace(settings.WORKSPACE_ROOT)
-        log(job, f"workspace: {workdir}")
+    # rerun: "" resumes every stage with a checkpoint for the same inputs, "tests" runs the tests again.
+    ctx = {"pr_id": pr.id, "job_id": job.id, "repo_full_name": pr.project.repo_full_name,
+           "rerun": job.payload.get("rerun", "")}
+    stage_clone.apply_async((ctx,), link=dispatch_stages.s(), link_error=pipeline_failed.s(pr.id, job.id))
+
+@shared_task
+def stage_clone(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    job = Job.objects.get(id=ctx["job_id"])
+    tracing.begin(job.id, pr.project_id, "clone")
+    workdir = pool.lease(settings.SANDBOX_POOL_DIR, job.id)
+    log(job, f"workspace: {workdir}{' (warm)' if pool.spare_venv(workdir) else ''}")
+    if settings.SANDBOX_POOL_SIZE:
+        refill_sandbox_pool.delay()
 
-        # Clone
-        repo_full_name = pr.project.repo_full_name
-        repo_url = f"https://github.com/{repo_full_name}.git"
+    repo_url = f"{settings.GIT_BASE_URL}/{ctx['repo_full_name']}.git"
+    if settings.REPO_MIRROR_ENABLED:
+        code, out = mirror.clone_pr(
+            settings.REPO_MIRROR_DIR, ctx["repo_full_name"], repo_url, pr.number, settings.GITHUB_TOKEN or "", workdir,
+            default_branch=pr.project.default_branch,
+            mode=settings.REPO_CHECKOUT_MODE,
+            depth=settings.REPO_CLONE_DEPTH,
+            sparse_paths=settings.REPO_SPARSE_PATHS,
+        )
+    else:
         code, out = sandbox.clone_pr(repo_url, pr.number, settings.GITHUB_TOKEN or "", workdir)
-        log(job, f"clone code={code}\n{out}")
-        if code != 0:
-            raise RuntimeError("Clone failed")
-
-        # Static analysis
-        analysis_job = Job.objects.create(pr=pr, job_type="analysis", status="running", started_at=timezone.now())
-        run_cmd = lambda c: sandbox.run_cmd(c, cwd=workdir)[1]
-        bandit = sandbox.run_cmd("bandit -r -q .", cwd=workdir)[1]
-        flake = sandbox.run_cmd("flake8 .", cwd=workdir)[1]
-        semgrep = sandbox.run_cmd("semgrep scan --quiet --error --config p/ci", cwd=workdir)[1]
-        analysis_job.logs = f"Bandit:\n{bandit}\n\nFlake8:\n{flake}\n\nSemgrep:\n{semgrep}\n"
-        analysis_job.status = "success"
-        analysis_job.finished_at = timezone.now()
-        analysis_job.save()
-
-        # AI Test Generation
-        gen_job = Job.objects.create(pr=pr, job_type="generate", status="running", started_at=timezone.now())
-        py_files = sandbox.list_py_files(workdir)
+    log(job, f"clone code={code}\n{out}")
+    if code != 0:
+        raise RuntimeError("Clone failed")
+    code, out = sandbox.run_cmd("git rev-parse HEAD", cwd=workdir)
+    head_sha = out.strip().splitlines()[-1] if code == 0 and out.strip() else (job.head_sha or pr.head_sha)
+    # The checked-out commit is the root input of every later stage's checkpoint key.
+    checkpoint.save(ctx, job.id, "clone", checkpoint.key("clone", head_sha), {"head_sha": head_sha})
+    with tracing.span("workspace.quota") as sp:
+        sp["bytes"] = pool.check_quota(workdir, settings.WORKSPACE_MAX_BYTES)
+    tracing.end("success")
+    return {**ctx, "workdir": workdir, "head_sha": head_sha}
+
+@shared_task
+def dispatch_stages(ctx: Dict[str, Any]) -> None:
+    ensure_active(ctx)
+    build_stages(ctx).apply_async()
+
+@shared_task
+def stage_analysis(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.select_related("project").get(id=ctx["pr_id"])
+    workdir = ctx["workdir"]
+    cp_key = checkpoint.key("analysis", ctx["head_sha"], pr.project.default_branch)
+    cp = checkpoint.load(ctx, "analysis", cp_key)
+    if cp is not None:
+        resume_job(pr, "analysis", cp)
+        return cp.result
+    analysis_job = start_job(pr, "analysis")
+    files = diff_mod.changed_files(workdir, pr.project.default_branch)
+    if files is None:
+        log(analysis_job, "no merge base; analysing every Python file")
+        files = sandbox.list_py_files(workdir)
+    files = [f for f in files if not set(f.split(os.sep)[:-1]) & sandbox.SKIP_DIRS
+             and os.path.isfile(os.path.join(workdir, f))]
+    with tracing.span("analysis.tools", files=len(files)) as sp:
+        findings, stats = analysis.analyze(pr.project, workdir, files, lambda rel: sandbox.read_file(workdir, rel))
+        sp.update(findings=len(findings), cache_hits=sum(t["cached"] for t in stats.values()),
+                  cache_misses=sum(t["scanned"] for t in stats.values()))
+    AnalysisFinding.objects.bulk_create([
+        AnalysisFinding(pr=pr, job=analysis_job, tool=f["tool"], path=f["path"][:512], line=f["line"],
+                        column=f["column"], rule=f["rule"][:255], severity=f["severity"][:16], message=f["message"])
+        for f in findings
+    ], batch_size=500)
+    lines = [f"{tool}: {s['status']}, {s['files']} files ({s['scanned']} scanned, {s['cached']} cached)"
+             for tool, s in stats.items()]
+    lines += [f"{f['path']}:{f['line']}:{f['column']} [{f['tool']} {f['rule']}] {f['severity']}: {f['message']}"
+              for f in sorted(findings, key=lambda f: (f["path"], f["line"]))]
+    finish_job(analysis_job, logs="\n".join(lines))
+    result = {"analysis_findings": len(findings)}
+    checkpoint.save(ctx, analysis_job.id, "analysis", cp_key, result)
+    return result
+
+@shared_task
+def stage_generate(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.select_related("project").get(id=ctx["pr_id"])
+    workdir = ctx["workdir"]
+    cp_key = checkpoint.key("generate", ctx["head_sha"], pr.project.default_branch, settings.GENERATION_MODE,
+                            ai_mod.generator_id(), ai_mod.PROMPT_TEMPLATE + ai_mod.DIFF_PROMPT_TEMPLATE)
+    cp = checkpoint.load(ctx, "generate", cp_key)
+    if cp is not None and blobs.exists(settings.BLOB_ROOT, cp.blob):
+        # Same commit and generator: write the tests generated last time instead of asking again.
+        with blobs.open_blob(settings.BLOB_ROOT, cp.blob) as f:
+            sandbox.write_files(workdir, json.load(f))
+        resume_job(pr, "generate", cp)
+        return {**ctx, **cp.result}
+    gen_job = start_job(pr, "generate")
+    py_files = sandbox.list_py_files(workdir)
+    def _read(rel: str) -> str:
+        try:
+            return sandbox.read_file(workdir, rel)
+        except Exception:
+            return ""
+    with tracing.span("index.update", files=len(py_files)) as sp:
+        idx, hits, misses = index_mod.build(pr.project, workdir, py_files, _read)
+        sp.update(cache_hits=hits, cache_misses=misses)
+    log(gen_job, f"symbol index: {len(py_files)} files ({misses} parsed, {hits} cached)")
+    symbols = None
+    affected: List[str] = []
+    if settings.GENERATION_MODE == "diff":
+        symbols = diff_mod.changed_symbols_by_file(workdir, pr.project.default_branch, _read, index=idx)
+        if symbols is None:
+            log(gen_job, "no merge base with default branch; generating for the whole repo")
+        else:
+            log(gen_job, f"diff-aware: {sum(len(v) for v in symbols.values())} changed symbols in {len(symbols)} files")
+            changed = diff_mod.changed_files(workdir, pr.project.default_branch) or []
+            affected = idx.affected_tests(changed)
+            log(gen_job, f"{len(affected)} existing test files import the changed code")
+    gen_cache = cache_mod.GenerationCache(
+        pr.project, ai_mod.generator_id(), ai_mod.PROMPT_TEMPLATE + ai_mod.DIFF_PROMPT_TEMPLATE
+    )
+    with tracing.span("generate.tests", files=len(py_files)) as sp:
+        gens = ai_mod.generate_tests_for_repo(py_files, _read, symbols, cache=gen_cache, index=idx)
+        sp.update(cache_hits=gen_cache.hits, cache_misses=gen_cache.misses)
+    gen_cache.flush_stats()
+    files_to_write = {}
+    for rel, content, rationale in gens:
+        files_to_write[rel] = content
+    sandbox.write_files(workdir, files_to_write)
+    # Only store a new row when the content for that path actually changed.
+    latest = {}
+    for path, content in pr.generated_tests.order_by("created_at").values_list("path", "content"):
+        latest[path] = content
+    GeneratedTest.objects.bulk_create(
+        [GeneratedTest(pr=pr, path=rel, content=content, rationale=rationale)
+         for rel, content, rationale in gens if latest.get(rel) != content]
+    )
+    finish_job(gen_job, logs=f"Generated {len(gens)} test files (cache hits: {gen_cache.hits})")
+    blob = blobs.put_text(settings.BLOB_ROOT, json.dumps(files_to_write, sort_keys=True))
+    # Generated file -> [source, targeted symbols], for pre-flight regeneration.
+    sources = {ai_mod.generated_path(f): [f, symbols.get(f) if symbols is not None else None]
+               for f in py_files if (symbols is None or f in symbols)}
+    result = {"generated": len(gens), "affected_tests": affected, "generated_blob": blob,
+              "generated_sources": {rel: sources[rel] for rel in files_to_write if rel in sources}}
+    checkpoint.save(ctx, gen_job.id, "generate", cp_key, result, blob)
+    return {**ctx, **result}
+
+@shared_task
+def stage_prepare_env(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    workdir = ctx["workdir"]
+    env_job = start_job(pr, "env")
+    hit = False
+    with tracing.span("venv.materialize") as sp:
+        if settings.VENV_CACHE_ENABLED:
+            venv, hit = envcache.materialize(settings.VENV_CACHE_DIR, workdir, settings.VENV_CACHE_MAX_BYTES,
+                                             seed=pool.spare_venv(workdir))
+        else:
+            venv = pool.adopt_venv(workdir) or sandbox.prepare_env(workdir)
+            if venv:
+                sandbox.install_requirements(workdir, venv)
+        sp["cache"] = "hit" if hit else "miss"
+    if not venv:
+        finish_job(env_job, "failure", "virtualenv failed")
+        raise RuntimeError("virtualenv failed")
+    pool.check_quota(workdir, settings.WORKSPACE_MAX_BYTES)
+    # The venv itself is restored from the venv cache on a resume; its fingerprint feeds the execute key.
+    env_key = envcache.env_key(workdir)
+    checkpoint.save(ctx, env_job.id, "env", checkpoint.key("env", ctx["head_sha"], env_key), {"env_key": env_key})
+    finish_job(env_job, logs=f"venv: {venv} (cache {'hit' if hit else 'miss'})")
+    return {**ctx, "venv": venv, "env_key": env_key}
+
+SUMMARY_RE = re.compile(r"(\d+) (passed|failed|errors?)\b")
+
+def summary_counts(out: str) -> Dict[str, int]:
+    counts = {"passed": 0, "failed": 0, "errors": 0}
+    for line in reversed(out.splitlines()):
+        found = SUMMARY_RE.findall(line)
+        if found:
+            for n, word in found:
+                counts["errors" if word.startswith("error") else word] += int(n)
+            break
+    return counts
+
+def record_test_run(ctx: Dict[str, Any], exec_job: Job, code: int, out: str,
+                    cached: Dict[str, int], fingerprints: Dict[str, str], selection: str = "full") -> Dict[str, Any]:
+    """out is the head/tail the runner kept in memory; the full output was spilled to OUTPUT_LOG."""
+    pr = exec_job.pr
+    report = os.path.join(ctx["workdir"], "report.xml")
+    spilled = os.path.join(ctx["workdir"], sandbox.OUTPUT_LOG)
+    # Full output and report go to compressed blob storage; the row keeps a tail.
+    with tracing.span("blob.put") as sp:
+        if os.path.exists(spilled):
+            output_blob = blobs.put_file(settings.BLOB_ROOT, spilled)
+            sp["bytes"] = os.path.getsize(spilled)
+        else:
+            output_blob = blobs.put_text(settings.BLOB_ROOT, out)
+            sp["bytes"] = len(out)
+        test_run = TestRun.objects.create(
+            pr=pr,
+            raw_output=out[-settings.RAW_OUTPUT_TAIL_CHARS:],
+            output_blob=output_blob,
+        )
+        if os.path.exists(report):
+            test_run.junit_blob = blobs.put_file(settings.BLOB_ROOT, report)
+            sp["bytes"] += os.path.getsize(report)
+
+    with tracing.span("orm.junit_ingest") as sp:
+        totals, durations = junit.ingest(report, test_run)
+        sp.update(cases=len(durations), failures=totals["failed"] + totals["errors"])
+    with tracing.span("orm.record_durations", cases=len(durations)):
+        sharding.record_durations(pr.project, durations)
+    if fingerprints:
+        with tracing.span("cache.test_result.store"):
+            cache_mod.store_passes(pr.project, fingerprints, junit.file_outcomes(report, fingerprints))
+    if durations:
+        passed, failed, error = totals["passed"], totals["failed"], totals["errors"]
+    else:
+        # No report at all (pytest crashed before writing one): fall back to the summary line.
+        summary = summary_counts(out)
+        passed, failed, error = summary["passed"], summary["failed"], summary["errors"]
+    passed += sum(cached.values())
+    test_run.passed = passed
+    test_run.failed = failed
+    test_run.errors = error
+    test_run.selection = selection
+    if settings.TEST_COVERAGE_ENABLED:
+        test_run.coverage = impact_mod.percent_covered(ctx["workdir"])
+    test_run.finished_at = timezone.now()
+    test_run.save()
+    # Folded into the PR summary by stage_rerun, once flaky failures are known.
+
+    finish_job(exec_job, "success" if code == 0 else "failure")
+    result = {
+        "test_run_id": test_run.id,
+        "passed": passed,
+        "failed": failed,
+        "errors": error,
+        "failure_count": failed + error,
+        "coverage": test_run.coverage,
+    }
+    if ctx.get("execute_key"):
+        checkpoint.save(ctx, exec_job.id, "execute", ctx["execute_key"], result)
+    return {**ctx, **result}
+
+def run_isolated(ctx: Dict[str, Any], exec_job: Job, node_ids: List[str]) -> Tuple[int, str]:
+    log(exec_job, f"running {len(node_ids)} known-flaky tests in isolation")
+    with tracing.span("flaky.isolated", tests=len(node_ids)):
+        return flaky.run_isolated(ctx["workdir"], ctx["venv"], node_ids, local_shard_count())
+
+def local_shard_count() -> int:
+    return settings.PYTEST_SHARDS or os.cpu_count() or 1
+
+def impact_selection(pr: PullRequest, ctx: Dict[str, Any], job: Job) -> Optional[Dict[str, Any]]:
+    """Tests to run for the PR per the latest coverage map, or None to run the full suite."""
+    cmap = impact_mod.latest(pr.project)
+    if cmap is None:
+        request_coverage_map(pr.project_id)
+        log(job, "no coverage map for this project yet; running the full suite")
+        return None
+    with tracing.span("impact.select") as sp:
+        data = impact_mod.load(settings.BLOB_ROOT, cmap)
+        sel = impact_mod.select(ctx["workdir"], cmap.base_sha, data) if data else {"full": "coverage map blob is missing"}
+        sp["tests"] = len(sel.get("tests", ()))
+    if sel["full"]:
+        log(job, f"running the full suite: {sel['full']}")
+        return None
+    # Generated tests, and tests the map has never seen that import changed code, always run.
+    known = impact_mod.known_files(data)
+    files = set(sel["files"]) | {t for t in ctx.get("affected_tests", []) if t not in known}
+    return {"tests": sel["tests"], "files": files, "generated": ai_mod.GENERATED_DIR + "/", "base": cmap.base_sha}
+
+def regenerate(pr: PullRequest, workdir: str, broken: Dict[str, List[Any]]) -> Dict[str, str]:
+    """Heuristic replacements for broken generated files ({rel: [source, only]}), where they differ."""
+    def _read(rel: str) -> str:
+        try:
+            return sandbox.read_file(workdir, rel)
+        except Exception:
+            return ""
+    idx, _, _ = index_mod.build(pr.project, workdir, sandbox.list_py_files(workdir), _read)
+    out: Dict[str, str] = {}
+    for rel, (source, only) in broken.items():
+        code = _read(source)
+        if not code:
+            continue
+        if source in idx:
+            content = ai_mod.heuristic_generate_tests(source, code, only, idx.modules[source], idx.symbols(source))
+        else:
+            content = ai_mod.heuristic_generate_tests(source, code, only)
+        if content != _read(rel):
+            out[rel] = content
+    return out
+
+@shared_task
+def stage_preflight(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ctx = merge_ctx(results)
+    ensure_active(ctx)
+    sources = ctx.get("generated_sources") or {}
+    if not settings.PREFLIGHT_ENABLED or not sources:
+        return ctx
+    pr = PullRequest.objects.select_related("project").get(id=ctx["pr_id"])
+    workdir, venv = ctx["workdir"], ctx["venv"]
+    job = start_job(pr, "preflight")
+    workers = settings.PREFLIGHT_CONCURRENCY or os.cpu_count() or 1
+    files = sorted(rel for rel in sources if os.path.isfile(os.path.join(workdir, rel)))
+    with tracing.span("preflight.check", files=len(files)) as sp:
+        broken = preflight.check(workdir, venv, files, workers)
+        sp["broken"] = len(broken)
+    for rel, reason in broken.items():
+        log(job, f"{rel}: {reason}")
+        # Otherwise every later run of the same source would be served the same broken file.
+        try:
+            content = sandbox.read_file(workdir, rel)
+        except (OSError, UnicodeDecodeError):
+            continue
+        if cache_mod.invalidate_generated(pr.project, sources[rel][0], content):
+            log(job, f"{rel}: dropped from the generation cache")
+    fixed: List[str] = []
+    if broken:
+        # One more try with the AST generator, which only imports what the symbol index resolved.
+        replacements = regenerate(pr, workdir, {rel: sources[rel] for rel in broken})
+        sandbox.write_files(workdir, replacements)
+        with tracing.span("preflight.recheck", files=len(replacements)):
+            still = preflight.check(workdir, venv, sorted(replacements), workers)
+        fixed = sorted(rel for rel in replacements if rel not in still)
+        GeneratedTest.objects.bulk_create([
+            GeneratedTest(pr=pr, path=rel, content=replacements[rel],
+                          rationale=f"Heuristic AST-based generator (replaced a file that failed pre-flight: {broken[rel]})")
+            for rel in fixed
+        ])
+    quarantined = [preflight.quarantine(workdir, rel) for rel in sorted(broken) if rel not in fixed]
+    for rel in fixed:
+        log(job, f"{rel}: regenerated")
+    for dest in quarantined:
+        log(job, f"quarantined {dest}")
+    finish_job(job, logs=f"{len(files)} generated files checked: {len(broken)} broken, {len(fixed)} regenerated, "
+                         f"{len(quarantined)} quarantined")
+    return {**ctx, "preflight": {"checked": len(files), "regenerated": fixed, "quarantined": quarantined}}
+
+@shared_task(bind=True)
+def stage_execute(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    workdir = ctx["workdir"]
+    venv = ctx["venv"]
+    cp_key = checkpoint.key("execute", ctx["head_sha"], ctx.get("generated_blob", ""), ctx.get("env_key", ""),
+                            ctx.get("preflight"),
+                            settings.TEST_IMPACT_ENABLED, settings.TEST_COVERAGE_ENABLED,
+                            settings.TEST_RESULT_CACHE_ENABLED)
+    cp = checkpoint.load(ctx, "execute", cp_key)
+    if cp is not None and TestRun.objects.filter(id=cp.result.get("test_run_id")).exists():
+        resume_job(pr, "execute", cp)
+        return {**ctx, **cp.result}
+    ctx = {**ctx, "execute_key": cp_key}
+    exec_job = start_job(pr, "execute")
+
+    fingerprints: Dict[str, str] = {}
+    cached: Dict[str, int] = {}
+    extra_args = ""
+    if settings.TEST_RESULT_CACHE_ENABLED:
         def _read(rel: str) -> str:
             try:
                 return sandbox.read_file(workdir, rel)
             except Exception:
                 return ""
-        gens = ai_mod.generate_tests_for_repo(py_files, _read)
-        files_to_write = {}
-        for rel, content, rationale in gens:
-            files_to_write[rel] = content
-        sandbox.write_files(workdir, files_to_write)
-        for rel, content, rationale in gens:
-            GeneratedTest.objects.create(pr=pr, path=rel, content=content, rationale=rationale)
-        gen_job.logs = f"Generated {len(gens)} test files"
-        gen_job.status = "success"
-        gen_job.finished_at = timezone.now()
-        gen_job.save()
-
-        # Prepare env & install
-        exec_job = Job.objects.create(pr=pr, job_type="execute", status="running", started_at=timezone.now())
-        venv = sandbox.prepare_env(workdir)
-        if not venv:
-            raise RuntimeError("virtualenv failed")
-        sandbox.install_requirements(workdir, venv)
-
-        # Execute tests
-        code, out = sandbox.run_pytest(workdir, venv)
-        test_run = TestRun.objects.create(pr=pr, raw_output=out)
-        # Read JUnit if exists
-        try:
-            report_xml = sandbox.read_file(workdir, "report.xml")
-            test_run.junit_xml = report_xml
-        except Exception:
-            pass
-
-        # naive parsing
-        passed = out.count(" PASSED")
-        failed = out.count(" FAILED")
-        error = out.count(" ERROR")
-        test_run.passed = passed
-        test_run.failed = failed
-        test_run.errors = error
-        test_run.finished_at = timezone.now()
-        test_run.save()
-
-        exec_job.logs = out
-        exec_job.status = "success" if code == 0 else "failure"
-        exec_job.finished_at = timezone.now()
-        exec_job.save()
-
-        # Failure triage
-        triage_job = Job.objects.create(pr=pr, job_type="triage", status="running", started_at=timezone.now())
-        failures_list = []
-        for line in out.splitlines():
-            if "FAILED " in line and "::" in line:
-                test_name = line.strip().split()[0]
-                failures_list.append({"test_name": test_name, "message": line.strip()})
-        clusters = ai_mod.cluster_failures(failures_list)
-        for f in failures_list:
-            Failure.objects.create(test_run=test_run, test_name=f["test_name"], message=f.get("message", ""))
-        for sig, meta in clusters.items():
-            FailureCluster.objects.create(pr=pr, signature=sig[:128], summary=meta["summary"], count=meta["count"])
-        triage_job.logs = json.dumps(clusters, indent=2)
-        triage_job.status = "success"
-        triage_job.finished_at = timezone.now()
-        triage_job.save()
-
-        # Patch suggestion (placeholder heuristic)
-        patch_job = Job.objects.create(pr=pr, job_type="patch", status="running", started_at=timezone.now())
-        if failures_list:
-            diff = """diff --git a/example.py b/example.py
+        with tracing.span("cache.test_result") as sp:
+            fingerprints = cache_mod.fingerprint_tests(sandbox.list_py_files(workdir), _read, envcache.env_key(workdir))
+            cached = cache_mod.cached_passes(pr.project, fingerprints)
+            sp.update(cache_hits=len(cached), cache_misses=len(fingerprints) - len(cached))
+        extra_args = " ".join(f"--ignore={rel}" for rel in sorted(cached))
+        if cached:
+            log(exec_job, f"skipping {len(cached)} unchanged, previously passing test files")
+
+    cov_sources = impact_mod.cov_sources(sandbox.list_py_files(workdir)) if settings.TEST_COVERAGE_ENABLED else None
+    selection = impact_selection(pr, ctx, exec_job) if settings.TEST_IMPACT_ENABLED else None
+
+    worker_shards = settings.PYTEST_WORKER_SHARDS
+    node_ids, broken = [], []
+    if selection is not None or worker_shards > 1 or local_shard_count() > 1:
+        node_ids, broken = sharding.collect(workdir, venv, extra_args)
+    if selection is not None and node_ids:
+        total = len(node_ids)
+        node_ids = [n for n in node_ids if n in selection["tests"] or n.split("::")[0] in selection["files"]
+                    or n.startswith(selection["generated"])]
+        log(exec_job, f"test impact: {len(node_ids)} of {total} tests affected since {selection['base'][:12]}")
+        if not node_ids and not broken:
+            return record_test_run(ctx, exec_job, 0, "no tests affected by this change", cached, fingerprints, "impact")
+        if not node_ids:
+            # Only files that failed to collect are left; run them so the errors are reported.
+            node_ids, broken = broken, []
+    else:
+        selection = None
+    # Known-flaky tests leave the shared run and get a pytest process each (see run_isolated).
+    isolated = flaky.known_flaky(pr.project, settings.FLAKY_THRESHOLD, settings.FLAKY_ISOLATE_MAX)
+    # collected: node_ids came from collection (and impact selection), so the run is planned from them;
+    # otherwise pytest runs the whole suite by itself.
+    collected = bool(node_ids)
+    if collected:
+        planned = set(node_ids)
+        isolated = [n for n in isolated if n in planned]
+        isolated_set = set(isolated)
+        node_ids = [n for n in node_ids if n not in isolated_set]
+        if not node_ids:
+            # Every planned test is isolated; files that failed to collect still get a shared run.
+            node_ids, broken = broken, []
+    else:
+        isolated = [n for n in isolated if n.split("::")[0] not in cached
+                    and os.path.exists(os.path.join(workdir, n.split("::")[0]))]
+    selected = "impact" if selection is not None else "full"
+    if collected and not node_ids:
+        # Nothing left for a shared run: only the isolated tests run.
+        code, out = run_isolated(ctx, exec_job, isolated)
+        sharding.merge_junit(workdir)
+        return record_test_run(ctx, exec_job, code, out, cached, fingerprints, selected)
+    if not node_ids:
+        run_args = extra_args + "".join(f" --deselect={shlex.quote(n)}" for n in isolated)
+        if cov_sources is not None:
+            run_args = f"{run_args} {impact_mod.coverage_args(cov_sources, impact_mod.report_path('main'))}"
+        with joblog.JobLogWriter(exec_job) as live:
+            code, out = sandbox.run_pytest(workdir, venv, run_args, on_line=live.write)
+        if isolated:
+            iso_code, iso_out = run_isolated(ctx, exec_job, isolated)
+            code, out = max(code, iso_code), f"{out}\n{iso_out}"
+            # Merge the main report with the isolated ones (sharding.merge_junit reads report-*.xml).
+            if os.path.exists(os.path.join(workdir, "report.xml")):
+                os.replace(os.path.join(workdir, "report.xml"), os.path.join(workdir, "report-main.xml"))
+            sharding.merge_junit(workdir)
+        return record_test_run(ctx, exec_job, code, out, cached, fingerprints)
+
+    durations = sharding.known_durations(pr.project, node_ids)
+    if worker_shards > 1:
+        plan = sharding.plan_shards(node_ids, durations, worker_shards)
+        plan[0].extend(broken)
+        log(exec_job, f"{len(node_ids)} tests in {len(plan)} worker shards")
+        state = {"exec_job_id": exec_job.id, "cached": cached, "fingerprints": fingerprints, "extra_args": extra_args,
+                 "selection": selected, "isolated": isolated}
+        return self.replace(chord(
+            group(stage_execute_shard.si(ctx, i, ids, extra_args, exec_job.id, cov_sources) for i, ids in enumerate(plan)),
+            stage_collect_shards.s(ctx, state),
+        ))
+
+    plan = sharding.plan_shards(node_ids, durations, local_shard_count())
+    # Files that failed to collect go to one shard so their errors are still reported.
+    plan[0].extend(broken)
+    log(exec_job, f"{len(node_ids)} tests in {len(plan)} local shards")
+    with joblog.JobLogWriter(exec_job) as live:
+        code, out = sharding.run_local(workdir, venv, plan, extra_args=extra_args, on_line=live.write,
+                                       cov_sources=cov_sources)
+    if isolated:
+        iso_code, iso_out = run_isolated(ctx, exec_job, isolated)
+        code, out = max(code, iso_code), f"{out}\n{iso_out}"
+    sharding.merge_junit(workdir)
+    sharding.combine_output(workdir)
+    return record_test_run(ctx, exec_job, code, out, cached, fingerprints, selected)
+
+@shared_task
+def stage_execute_shard(ctx: Dict[str, Any], index: int, node_ids: List[str], extra_args: str,
+                        exec_job_id: Optional[int] = None, cov_sources: Optional[List[str]] = None) -> Dict[str, Any]:
+    ensure_active(ctx)
+    # One worker's slice, further split across this worker's cores.
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    durations = sharding.known_durations(pr.project, node_ids)
+    plan = sharding.plan_shards(node_ids, durations, local_shard_count())
+    exec_job = Job.objects.get(id=exec_job_id) if exec_job_id else None
+    with joblog.JobLogWriter(exec_job) as live:
+        code, out = sharding.run_local(ctx["workdir"], ctx["venv"], plan, prefix=f"w{index}-", extra_args=extra_args,
+                                       on_line=live.write if exec_job else None, cov_sources=cov_sources)
+    # Full output stays in the shared workdir; only a tail travels through the result backend.
+    return {"index": index, "code": code, "out": out[-settings.RAW_OUTPUT_TAIL_CHARS:]}
+
+@shared_task
+def stage_collect_shards(shard_results: List[Dict[str, Any]], ctx: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    exec_job = Job.objects.get(id=state["exec_job_id"])
+    shard_results = sorted(shard_results, key=lambda r: r["index"])
+    code = max(r["code"] for r in shard_results)
+    out = "\n".join(r["out"] for r in shard_results)
+    if state.get("isolated"):
+        iso_code, iso_out = run_isolated(ctx, exec_job, state["isolated"])
+        code, out = max(code, iso_code), f"{out}\n{iso_out}"
+    sharding.merge_junit(ctx["workdir"])
+    sharding.combine_output(ctx["workdir"])
+    return record_test_run(ctx, exec_job, code, out, state["cached"], state["fingerprints"],
+                           state.get("selection", "full"))
+
+@shared_task
+def stage_rerun(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    # Failed tests are rerun on their own: any pass makes the failure flaky, reported apart from real failures.
+    ensure_active(ctx)
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    cp_key = checkpoint.key("rerun", ctx["test_run_id"], settings.FLAKY_RERUNS)
+    cp = checkpoint.load(ctx, "rerun", cp_key)
+    if cp is not None:
+        resume_job(pr, "rerun", cp)
+        return {**ctx, **cp.result}
+    rerun_job = start_job(pr, "rerun")
+    test_run = TestRun.objects.get(id=ctx["test_run_id"])
+    # The stored report, not <workdir>/report.xml: a retry that resumed execute has a fresh workspace.
+    report = os.path.join(ctx["workdir"], flaky.REPORT_COPY)
+    if test_run.junit_blob and blobs.exists(settings.BLOB_ROOT, test_run.junit_blob):
+        blobs.copy_to(settings.BLOB_ROOT, test_run.junit_blob, report)
+        results = flaky.outcomes(report)
+    else:
+        results = {}
+        log(rerun_job, "no JUnit report stored for this run; flaky tests cannot be told apart")
+    failing = flaky.failed_ids(results)
+    flaky_ids: Set[str] = set()
+    if settings.FLAKY_RERUNS > 0 and len(failing) > settings.FLAKY_RERUN_MAX_TESTS:
+        log(rerun_job, f"{len(failing)} failed tests (over FLAKY_RERUN_MAX_TESTS); not rerunning")
+    elif settings.FLAKY_RERUNS > 0 and failing:
+        log(rerun_job, f"rerunning {len(failing)} failed tests {settings.FLAKY_RERUNS}x")
+        with tracing.span("flaky.rerun", tests=len(failing), rounds=settings.FLAKY_RERUNS) as sp:
+            reruns = flaky.rerun(ctx["workdir"], ctx["venv"], failing, settings.FLAKY_RERUNS, local_shard_count())
+            flaky_ids = flaky.classify(reruns)
+            sp["flaky"] = len(flaky_ids)
+        log(rerun_job, "\n".join(f"{'flaky' if n in flaky_ids else 'failed'}: {n} ({', '.join(reruns[n])})"
+                                  for n in failing))
+    with tracing.span("orm.flaky_history", tests=len(results)):
+        flaky.record_history(pr.project, results, flaky_ids)
+    if flaky_ids:
+        Failure.objects.filter(test_run=test_run, test_name__in=list(flaky_ids)).update(flaky=True)
+        flaky_failed = sum(1 for n in flaky_ids if results[n] == "failed")
+        test_run.failed = max(0, test_run.failed - flaky_failed)
+        test_run.errors = max(0, test_run.errors - (len(flaky_ids) - flaky_failed))
+        test_run.flaky = len(flaky_ids)
+        test_run.save(update_fields=["failed", "errors", "flaky"])
+    summary_mod.record_run(test_run)
+    finish_job(rerun_job)
+    result = {"failed": test_run.failed, "errors": test_run.errors, "flaky": test_run.flaky,
+              "failure_count": test_run.failed + test_run.errors}
+    checkpoint.save(ctx, rerun_job.id, "rerun", cp_key, result)
+    return {**ctx, **result}
+
+@shared_task
+def stage_triage(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    cp_key = checkpoint.key("triage", ctx["test_run_id"])
+    cp = checkpoint.load(ctx, "triage", cp_key)
+    if cp is not None:
+        resume_job(pr, "triage", cp)
+        return ctx
+    triage_job = start_job(pr, "triage")
+    failures_list = list(
+        Failure.objects.filter(test_run_id=ctx["test_run_id"])
+        .values("id", "test_name", "message", "stacktrace", "file", "line", "failure_type", "flaky")
+        .iterator(chunk_size=2000)
+    )
+    with tracing.span("triage.cluster", failures=len(failures_list)) as sp:
+        # Flaky failures are clustered on their own, so a flake never merges into a real failure's cluster.
+        clusters = [(is_flaky, fp, meta) for is_flaky in (False, True)
+                    for fp, meta in ai_mod.cluster_failures([f for f in failures_list if f["flaky"] == is_flaky]).items()]
+        sp["clusters"] = len(clusters)
+    with tracing.span("orm.triage_store", clusters=len(clusters)):
+        created = FailureCluster.objects.bulk_create([
+            FailureCluster(pr=pr, project=pr.project, fingerprint=fp, exception_type=meta["exception"][:128],
+                           signature=meta["signature"][:512], summary=meta["summary"], count=meta["count"],
+                           flaky=is_flaky)
+            for is_flaky, fp, meta in clusters
+        ])
+        for cluster, (is_flaky, _, meta) in zip(created, clusters):
+            if cluster.pk is None:
+                cluster = FailureCluster.objects.get(pr=pr, fingerprint=cluster.fingerprint, flaky=is_flaky)
+            Failure.objects.filter(id__in=[f["id"] for f in meta["items"]]).update(cluster=cluster)
+
+    # Same fingerprint on other PRs of this project (most recent first).
+    seen_elsewhere: Dict[str, List[int]] = {}
+    for fp, number in (FailureCluster.objects.filter(project=pr.project, fingerprint__in=[fp for _, fp, _ in clusters])
+                       .exclude(pr=pr).order_by("-id").values_list("fingerprint", "pr__number")):
+        if number not in seen_elsewhere.setdefault(fp, []):
+            seen_elsewhere[fp].append(number)
+    # Real failures first, then flakes.
+    report = [
+        {"fingerprint": fp, "exception": meta["exception"], "count": meta["count"], "summary": meta["summary"],
+         "signature": meta["signature"], "tests": [f["test_name"] for f in meta["items"][:10]],
+         "also_in_prs": seen_elsewhere.get(fp, [])[:10], "flaky": is_flaky}
+        for is_flaky, fp, meta in sorted(clusters, key=lambda c: (c[0], -c[2]["count"]))
+    ]
+    finish_job(triage_job, logs=json.dumps(report, indent=2))
+    checkpoint.save(ctx, triage_job.id, "triage", cp_key, {})
+    return ctx
+
+@shared_task
+def stage_patch(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ensure_active(ctx)
+    pr = PullRequest.objects.get(id=ctx["pr_id"])
+    cp_key = checkpoint.key("patch", ctx["test_run_id"])
+    cp = checkpoint.load(ctx, "patch", cp_key)
+    if cp is not None:
+        resume_job(pr, "patch", cp)
+        return ctx
+    # Patch suggestion (placeholder heuristic)
+    patch_job = start_job(pr, "patch")
+    if ctx["failure_count"]:
+        diff = """diff --git a/example.py b/example.py
 index 000000..111111 100644
 --- a/example.py
 +++ b/example.py
 @@ -1,4 +1,4 @@
 -def add(a,b):return a+b
 +def add(a, b):\n    # fix: ensure ints\n    return int(a) + int(b)\n"""
-            PatchSuggestion.objects.create(pr=pr, diff=diff, rationale="Auto-fix formatting/types (example)")
-            patch_job.logs = "Suggested 1 patch"
-        else:
-            patch_job.logs = "No failures -> no patch"
-        patch_job.status = "success"
-        patch_job.finished_at = timezone.now()
-        patch_job.save()
-
-        # Report back to GitHub (comment summary)
-        summary = f"Static Analysis done. Generated {len(gens)} tests. Test result: {passed} passed, {failed} failed, {error} errors."
-        post_pr_comment(repo_full_name, pr.number, summary)
-
-        pr.status = "success" if failed == 0 and error == 0 else "failure"
-        pr.save(update_fields=["status"])
-
-    except Exception as e:
-        job.logs += f"\nERROR: {e}\n"
-        job.status = "failure"
-        pr.status = "failure"
-        job.finished_at = timezone.now()
-        job.save()
-        pr.save(update_fields=["status"])
-        post_pr_comment(pr.project.repo_full_name, pr.number, f"Pipeline failed: {e}")
+        PatchSuggestion.objects.create(pr=pr, diff=diff, rationale="Auto-fix formatting/types (example)")
+        finish_job(patch_job, logs="Suggested 1 patch")
+    else:
+        finish_job(patch_job, logs="No failures -> no patch")
+    checkpoint.save(ctx, patch_job.id, "patch", cp_key, {})
+    return ctx
+
+@shared_task
+def stage_report(results: List[Dict[str, Any]]) -> None:
+    ctx = merge_ctx(results)
+    ensure_active(ctx)
+    pr = PullRequest.objects.select_related("project").get(id=ctx["pr_id"])
+    job = Job.objects.get(id=ctx["job_id"])
+    passed, failed, error = ctx["passed"], ctx["failed"], ctx["errors"]
+
+    # Report back to GitHub (sticky comment summary, plus the check run if enabled)
+    summary = f"Static analysis: {ctx.get('analysis_findings', 0)} findings in changed files. Generated {ctx['generated']} tests. Test result: {passed} passed, {failed} failed, {error} errors."
+    if settings.TEST_COVERAGE_ENABLED:
+        summary += f" Coverage: {ctx.get('coverage', 0.0):.1f}%."
+    if ctx.get("flaky"):
+        summary += f" {ctx['flaky']} flaky (failed, then passed on rerun)."
+    quarantined = (ctx.get("preflight") or {}).get("quarantined", [])
+    if quarantined:
+        summary += f" {len(quarantined)} generated test files failed pre-flight and were not run."
+    pr.status = "success" if failed == 0 and error == 0 else "failure"
+    report_to_github(pr, job, summary, pr.status)
+
+    pr.save(update_fields=["status"])
+    finish_job(job)
+    pool.release(settings.SANDBOX_POOL_DIR, job.id)
+    schedule_pipelines.delay()
+
+@shared_task
+def pipeline_failed(request, exc, traceback, pr_id: int, job_id: int) -> None:
+    # Errbacks are linked to every stage, so only the first failure reports.
+    job = Job.objects.get(id=job_id)
+    if job.status != "running":
+        return
+    pr = PullRequest.objects.select_related("project").get(id=pr_id)
+    attempt = job.payload.get("attempt", 1)
+    if attempt < settings.PIPELINE_MAX_ATTEMPTS and not isinstance(exc, PipelineCancelled):
+        # Crashed stage or lost worker: queue another attempt, which resumes from the last checkpoint.
+        finish_job(job, "failure", f"\nERROR: {exc}\nretrying (attempt {attempt + 1} of {settings.PIPELINE_MAX_ATTEMPTS})\n")
+        report_to_github(pr, job, f"Retrying after: {exc}")
+        Job.objects.create(pr=pr, job_type="orchestrate", status="queued", head_sha=job.head_sha,
+                           priority=job.priority, payload={**job.payload, "attempt": attempt + 1})
+        pool.release(settings.SANDBOX_POOL_DIR, job.id)
+        schedule_pipelines.delay()
         return
+    finish_job(job, "failure", f"\nERROR: {exc}\n")
+    pr.status = "failure"
+    pr.save(update_fields=["status"])
+    report_to_github(pr, job, f"Pipeline failed: {exc}", "failure")
+    pool.release(settings.SANDBOX_POOL_DIR, job.id)
+    schedule_pipelines.delay()
 
-    job.status = "success"
-    job.finished_at = timezone.now()
-    job.save()
+@shared_task
+def reap_pipelines() -> int:
+    """Fail (and requeue, within PIPELINE_MAX_ATTEMPTS) pipelines whose worker died without reporting,
+    and send admitted pipelines whose message never reached a worker back to the scheduler."""
+    dead = list(scheduler.stale(settings.WORKSPACE_LEASE_TTL).values_list("id", "pr_id"))
+    for job_id, pr_id in dead:
+        pipeline_failed(None, RuntimeError("worker lost: no result within WORKSPACE_LEASE_TTL"), None, pr_id, job_id)
+    lost = scheduler.requeue_lost(settings.WORKSPACE_LEASE_TTL)
+    if lost:
+        schedule_pipelines.delay()
+    return len(dead) + lost
+
+@shared_task
+def refill_sandbox_pool() -> int:
+    # Serialized so concurrent leases do not over-provision.
+    with sandbox.file_lock(os.path.join(settings.SANDBOX_POOL_DIR, "refill.lock"), blocking=False) as got:
+        if not got:
+            return 0
+        return pool.refill(settings.SANDBOX_POOL_DIR, settings.SANDBOX_POOL_SIZE, settings.SANDBOX_POOL_MAX_BYTES)
+
+@shared_task
+def maintain_sandbox_pool() -> int:
+    def is_active(job_ids: List[int]) -> Dict[int, bool]:
+        active = set(Job.objects.filter(id__in=job_ids, status__in=ACTIVE_STATUSES).values_list("id", flat=True))
+        return {job_id: job_id in active for job_id in job_ids}
+
+    removed = pool.gc(settings.SANDBOX_POOL_DIR, is_active, settings.WORKSPACE_LEASE_TTL, legacy_root=settings.WORKSPACE_ROOT)
+    refill_sandbox_pool.delay()
+    return len(removed)
+
+@shared_task
+def prune_spans() -> int:
+    cutoff = timezone.now() - timedelta(days=settings.SPAN_RETENTION_DAYS)
+    deleted, _ = Span.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
+
+def request_coverage_map(project_id: int, sha: str = "") -> bool:
+    # At most one build per project is queued, and none while a failed one is backing off.
+    if not impact_mod.claim_build(project_id, settings.WORKSPACE_LEASE_TTL):
+        return False
+    refresh_coverage_map.delay(project_id, sha)
+    return True
+
+@shared_task
+def refresh_coverage_map(project_id: int, sha: str = "") -> Optional[int]:
+    """Run the suite at sha (default: the tip of the default branch) with per-test coverage
+    contexts and store the result as the project's newest CoverageMap."""
+    project = Project.objects.get(id=project_id)
+    with sandbox.file_lock(os.path.join(settings.WORKSPACE_ROOT, "coverage", f"{project_id}.lock"), blocking=False) as got:
+        if not got:
+            return None
+        if sha and CoverageMap.objects.filter(project=project, base_sha=sha).exists():
+            impact_mod.build_finished(project_id, True, settings.COVERAGE_MAP_BACKOFF)
+            return None
+        workdir = sandbox.new_workspace(settings.WORKSPACE_ROOT)
+        try:
+            rev = sha or f"refs/heads/{project.default_branch}"
+            repo_url = f"{settings.GIT_BASE_URL}/{project.repo_full_name}.git"
+            if settings.REPO_MIRROR_ENABLED:
+                code, out = mirror.checkout_commit(settings.REPO_MIRROR_DIR, project.repo_full_name, repo_url,
+                                                   settings.GITHUB_TOKEN or "", workdir, rev, project.default_branch)
+            else:
+                code, out = sandbox.run_cmd(f"git clone -q {sandbox.auth_url(repo_url, settings.GITHUB_TOKEN or '')} . "
+                                            f"&& git checkout -q --detach {sha or 'HEAD'}", cwd=workdir, timeout=1800)
+            if code != 0:
+                raise RuntimeError(f"checkout of {rev} failed: {out}")
+            base_sha = sandbox.run_cmd("git rev-parse HEAD", cwd=workdir)[1].strip().splitlines()[-1]
+            if settings.VENV_CACHE_ENABLED:
+                venv, _ = envcache.materialize(settings.VENV_CACHE_DIR, workdir, settings.VENV_CACHE_MAX_BYTES)
+            else:
+                venv = sandbox.prepare_env(workdir)
+                if venv:
+                    sandbox.install_requirements(workdir, venv)
+            if not venv:
+                raise RuntimeError("virtualenv failed")
+            data_file = os.path.join(workdir, impact_mod.MAP_DATA_FILE)
+            sources = impact_mod.cov_sources(sandbox.list_py_files(workdir))
+            # Failing tests still record what they ran; only a missing data file is fatal.
+            sandbox.run_stream(f"{os.path.join(venv, 'bin', 'pytest')} -q -p no:cacheprovider --disable-warnings "
+                               f"{impact_mod.coverage_args(sources, contexts=True)}",
+                               cwd=workdir, env={**os.environ, "COVERAGE_FILE": data_file}, timeout=3600,
+                               limited=True)
+            if not os.path.exists(data_file):
+                raise RuntimeError("pytest wrote no coverage data")
+            data = impact_mod.read_contexts(data_file, workdir)
+            cmap = impact_mod.store(project, settings.BLOB_ROOT, base_sha, data)
+            impact_mod.build_finished(project_id, True, settings.COVERAGE_MAP_BACKOFF)
+            return cmap.id
+        except Exception:
+            impact_mod.build_finished(project_id, False, settings.COVERAGE_MAP_BACKOFF)
+            raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
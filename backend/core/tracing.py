@@ -0,0 +1,171 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+# Lightweight spans for pipeline stages.
+#
+# start_job()/finish_job() bracket each stage: begin() makes the stage's Job the
+# current trace and end() writes every span recorded since in one bulk insert.
+# Spans from helper threads (pytest shards, LLM pool, analyzers) attach to the
+# stage that is current in the process, which is exact for prefork workers.
+
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("qa_trace", default=None)
+_process_trace: Optional[Dict[str, Any]] = None
+_buffer: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+
+def current() -> Optional[Dict[str, Any]]:
+    return _current.get() or _process_trace
+
+def begin(job_id: int, project_id: Optional[int], stage: str, began: Optional[float] = None) -> None:
+    global _process_trace
+    flush()  # leftovers of a stage that raised before it finished
+    trace = {"job_id": job_id, "project_id": project_id, "stage": stage, "began": began or time.time()}
+    _current.set(trace)
+    _process_trace = trace
+
+def record(name: str, started: float, duration: float, exit_code: Optional[int] = None, nbytes: int = 0,
+           cache: str = "", **attrs: Any) -> None:
+    trace = current()
+    if trace is None:
+        return
+    with _lock:
+        _buffer.append({"job_id": trace["job_id"], "project_id": trace["project_id"], "stage": trace["stage"],
+                        "name": name[:64], "started": started, "duration": duration,
+                        "exit_code": exit_code, "bytes": nbytes, "cache": cache, "attrs": attrs})
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block. The yielded dict may be filled with exit_code/bytes/cache and extra attrs."""
+    info: Dict[str, Any] = {}
+    started, t0 = time.time(), time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(name, started, time.perf_counter() - t0, info.pop("exit_code", None), info.pop("bytes", 0),
+               info.pop("cache", ""), **attrs, **info)
+
+def flush() -> int:
+    with _lock:
+        pending = _buffer[:]
+        _buffer.clear()
+    if not pending:
+        return 0
+    from .models import Span
+    Span.objects.bulk_create([
+        Span(job_id=s["job_id"], project_id=s["project_id"], stage=s["stage"], name=s["name"],
+             started_at=datetime.fromtimestamp(s["started"], dt_timezone.utc), duration=s["duration"],
+             exit_code=s["exit_code"], bytes=s["bytes"], cache=s["cache"], attrs=s["attrs"])
+        for s in pending
+    ], batch_size=500)
+    return len(pending)
+
+def end(status: str) -> None:
+    """Record the stage span itself (from begin() until now) and write everything out."""
+    global _process_trace
+    trace = current()
+    if trace is not None:
+        record("stage", trace["began"], time.time() - trace["began"], status=status)
+    flush()
+    _current.set(None)
+    _process_trace = None
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def step_name(name: str, attrs: Dict[str, Any]) -> str:
+    # Commands are told apart by program (pip vs pytest vs git).
+    return f"{name}:{attrs['cmd']}" if name == "cmd" and attrs.get("cmd") else name
+
+def stage_latency(since: datetime, project_id: Optional[int] = None) -> Dict[str, Any]:
+    """p50/p95 per stage overall, per day and per project, and per step within each stage."""
+    from .models import Span
+    qs = Span.objects.filter(started_at__gte=since)
+    if project_id is not None:
+        qs = qs.filter(project_id=project_id)
+    stages: Dict[str, List[float]] = {}
+    daily: Dict[tuple, List[float]] = {}
+    projects: Dict[tuple, List[float]] = {}
+    steps: Dict[tuple, List[float]] = {}
+    step_cache: Dict[tuple, List[int]] = {}
+    rows = qs.values_list("stage", "name", "project__repo_full_name", "started_at", "duration", "cache", "attrs")
+    for stage, name, project, started_at, duration, cache, attrs in rows.iterator(chunk_size=5000):
+        if name == "stage":
+            stages.setdefault(stage, []).append(duration)
+            daily.setdefault((started_at.date(), stage), []).append(duration)
+            projects.setdefault((project or "-", stage), []).append(duration)
+            continue
+        key = (stage, step_name(name, attrs or {}))
+        steps.setdefault(key, []).append(duration)
+        if cache:
+            counts = step_cache.setdefault(key, [0, 0])
+            counts[0 if cache == "hit" else 1] += 1
+
+    def summary(values: List[float]) -> Dict[str, float]:
+        return {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "count": len(values),
+                "total": sum(values)}
+
+    return {
+        "stages": [{"stage": k, **summary(v)} for k, v in sorted(stages.items())],
+        "daily": [{"day": d, "stage": s, **summary(v)} for (d, s), v in sorted(daily.items())],
+        "projects": [{"project": p, "stage": s, **summary(v)} for (p, s), v in sorted(projects.items())],
+        "steps": sorted(
+            ({"stage": s, "step": n, **summary(v),
+              "hit_rate": (step_cache[(s, n)][0] / sum(step_cache[(s, n)])) if (s, n) in step_cache else None}
+             for (s, n), v in steps.items()),
+            key=lambda r: -r["total"],
+        ),
+    }
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels: Any) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+def metrics_text(window_seconds: int) -> str:
+    """Prometheus text exposition: stage/step quantiles over the window, all-time counts/sums."""
+    from django.db.models import Count, Sum
+    from django.utils import timezone
+    from .models import Span, CacheStats
+    since = timezone.now() - timedelta(seconds=window_seconds)
+    latency = stage_latency(since)
+    lines = [
+        "# HELP qa_stage_duration_seconds Pipeline stage latency (quantiles over the recent window).",
+        "# TYPE qa_stage_duration_seconds summary",
+    ]
+    for row in latency["stages"]:
+        for q in ("0.5", "0.95"):
+            value = row["p50"] if q == "0.5" else row["p95"]
+            lines.append(f"qa_stage_duration_seconds{{{_labels(stage=row['stage'], quantile=q)}}} {value:.6f}")
+    totals = Span.objects.filter(name="stage").values("stage").annotate(n=Count("id"), s=Sum("duration"))
+    for row in totals:
+        lines.append(f"qa_stage_duration_seconds_count{{{_labels(stage=row['stage'])}}} {row['n']}")
+        lines.append(f"qa_stage_duration_seconds_sum{{{_labels(stage=row['stage'])}}} {row['s'] or 0:.6f}")
+    lines += [
+        "# HELP qa_step_duration_seconds Latency of steps inside a stage (quantiles over the recent window).",
+        "# TYPE qa_step_duration_seconds summary",
+    ]
+    for row in latency["steps"]:
+        labels = dict(stage=row["stage"], step=row["step"])
+        lines.append(f"qa_step_duration_seconds{{{_labels(**labels, quantile='0.5')}}} {row['p50']:.6f}")
+        lines.append(f"qa_step_duration_seconds{{{_labels(**labels, quantile='0.95')}}} {row['p95']:.6f}")
+        lines.append(f"qa_step_duration_seconds_count{{{_labels(**labels)}}} {row['count']}")
+        lines.append(f"qa_step_duration_seconds_sum{{{_labels(**labels)}}} {row['total']:.6f}")
+    lines += [
+        "# HELP qa_cache_requests_total Cache lookups by cache and result.",
+        "# TYPE qa_cache_requests_total counter",
+    ]
+    for row in CacheStats.objects.values("cache").annotate(h=Sum("hits"), m=Sum("misses")):
+        lines.append(f"qa_cache_requests_total{{{_labels(cache=row['cache'], result='hit')}}} {row['h'] or 0}")
+        lines.append(f"qa_cache_requests_total{{{_labels(cache=row['cache'], result='miss')}}} {row['m'] or 0}")
+    return "\n".join(lines) + "\n"
@@ -1,10 +1,24 @@
 from django.urls import path
 from . import views
+from . import api
 
 urlpatterns = [
     path("", views.splash, name="splash"),  # Splash page
     path("dashboard/", views.dashboard, name="dashboard"),
     path("webhook/gh/", views.gh_webhook, name="gh_webhook"),
     # path("pr/<str:project>/<int:number>/", views.pr_detail, name="pr_detail"),
-    path("pr/<str:user>/<str:project>/<int:number>/", views.pr_detail, name="pr_detail")
+    path("pr/<str:user>/<str:project>/<int:number>/", views.pr_detail, name="pr_detail"),
+    path("pr/<str:user>/<str:project>/<int:number>/rerun/", views.rerun_pr, name="pr_rerun"),
+    path("runs/<int:run_id>/junit.xml", views.run_artifact, {"kind": "junit"}, name="run_junit"),
+    path("runs/<int:run_id>/output.txt", views.run_artifact, {"kind": "output"}, name="run_output"),
+    path("runs/<int:run_id>/output/tail/", views.run_output_tail, name="run_output_tail"),
+    path("jobs/<int:job_id>/logs/", views.job_logs, name="job_logs"),
+    path("jobs/<int:job_id>/logs/stream/", views.job_logs_stream, name="job_logs_stream"),
+    path("cache/<str:user>/<str:project>/", views.cache_stats, name="cache_stats"),
+    path("latency/", views.latency, name="latency"),
+    path("metrics", views.metrics, name="metrics"),
+    path("queue/", views.queue_status, name="queue_status"),
+    path("api/prs/", api.PullRequestList.as_view(), name="api_prs"),
+    path("api/pr/<str:user>/<str:project>/<int:number>/runs/", api.TestRunList.as_view(), name="api_pr_runs"),
+    path("api/runs/<int:run_id>/failures/", api.FailureList.as_view(), name="api_run_failures"),
 ]
@@ -1,13 +1,23 @@
 import json
 import hmac
+import time
+from datetime import timedelta
 from typing import Any, Dict
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpRequest, HttpResponseBadRequest
+from django.views.decorators.http import require_POST
+from django.http import JsonResponse, HttpRequest, HttpResponse, HttpResponseBadRequest, FileResponse, Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 from django.conf import settings
 from .github import verify_signature
-from .models import Project, PullRequest, TestRun
-from .tasks import orchestrate_pr
+from .models import Project, PullRequest, TestRun, Job, WebhookDelivery, TEST_RUN_LIST_FIELDS
+from .tasks import ingest_delivery, schedule_pipelines, pr_priority
+from .cache import hit_rates
+from . import blobs
+from . import joblog
+from . import tracing
+from . import scheduler
 
 # # 🔹 New Splash View
 # def splash(request: HttpRequest):
@@ -18,6 +28,7 @@ def splash(request):
 
 @csrf_exempt
 def gh_webhook(request: HttpRequest):
+    # Fast path: verify, record the delivery once, hand it to a worker and return.
     if request.method != "POST":
         return HttpResponseBadRequest("POST only")
     payload = request.body
@@ -25,33 +36,46 @@ def gh_webhook(request: HttpRequest):
     if not verify_signature(payload, sig):
         return HttpResponseBadRequest("bad signature")
     event = request.headers.get("X-GitHub-Event", "")
-    data = json.loads(payload.decode("utf-8"))
-    if event in ("pull_request",):
-        action = data.get("action")
-        if action in ("opened", "synchronize", "ready_for_review", "reopened"):
-            repo_full = data["repository"]["full_name"]
-            pr_num = data["number"]
-            title = data["pull_request"]["title"]
-            head_sha = data["pull_request"]["head"]["sha"]
-            head_ref = data["pull_request"]["head"]["ref"]
-            project, _ = Project.objects.get_or_create(
-                repo_full_name=repo_full, defaults={"default_branch": data["repository"]["default_branch"]}
-            )
-            pr, _ = PullRequest.objects.get_or_create(
-                project=project, number=pr_num,
-                defaults={"title": title, "head_sha": head_sha, "head_ref": head_ref, "status": "pending"}
-            )
-            pr.title = title
-            pr.head_sha = head_sha
-            pr.head_ref = head_ref
-            pr.status = "pending"
-            pr.save()
-            orchestrate_pr.delay(pr.id)
-    return JsonResponse({"ok": True})
+    if event not in ("pull_request", "push"):
+        return JsonResponse({"ok": True, "ignored": event})
+    delivery_id = request.headers.get("X-GitHub-Delivery", "")
+    if not delivery_id:
+        return HttpResponseBadRequest("missing X-GitHub-Delivery")
+    delivery, created = WebhookDelivery.objects.get_or_create(
+        delivery_id=delivery_id[:64], defaults={"event": event, "payload": payload.decode("utf-8")}
+    )
+    if not created:
+        return JsonResponse({"ok": True, "duplicate": True})
+    ingest_delivery.delay(delivery.id)
+    return JsonResponse({"ok": True}, status=202)
+
+RERUN_SCOPES = ("pipeline", "tests")
+
+@require_POST
+def rerun_pr(request: HttpRequest, user: str, project: str, number: int):
+    # "pipeline" resumes every stage that has a checkpoint for the head; "tests" also runs the tests again.
+    pr = get_object_or_404(PullRequest, project__repo_full_name=f"{user}/{project}", number=number)
+    scope = request.POST.get("scope", "pipeline")
+    if scope not in RERUN_SCOPES:
+        return HttpResponseBadRequest(f"scope must be one of {', '.join(RERUN_SCOPES)}")
+    if not scheduler.live(settings.WORKSPACE_LEASE_TTL).filter(pr=pr).exists():
+        Job.objects.create(pr=pr, job_type="orchestrate", status="queued", head_sha=pr.head_sha,
+                           priority=pr_priority(pr), payload={"rerun": "tests" if scope == "tests" else ""})
+        schedule_pipelines.delay()
+    return redirect("pr_detail", user=user, project=project, number=number)
+
+PRS_PER_PAGE = 50
+RUNS_PER_PAGE = 25
+# Characters of a run's output shown inline when its panel is opened.
+OUTPUT_PREVIEW_CHARS = 8000
 
 def dashboard(request: HttpRequest):
-    prs = PullRequest.objects.select_related("project").order_by("-updated_at")[:50]
-    return render(request, "dashboard.html", {"prs": prs})
+    prs = (PullRequest.objects.select_related("project", "summary")
+           .only("id", "number", "title", "status", "updated_at", "project__repo_full_name",
+                 "summary__latest_status", "summary__pass_rate", "summary__runs")
+           .order_by("-updated_at"))
+    page = Paginator(prs, PRS_PER_PAGE).get_page(request.GET.get("page"))
+    return render(request, "dashboard.html", {"prs": page, "page": page})
 
 # def pr_detail(request: HttpRequest, project: str, number: int):
 #     project_obj = Project.objects.get(repo_full_name=project)
@@ -61,7 +85,110 @@ def dashboard(request: HttpRequest):
 
 def pr_detail(request: HttpRequest, user: str, project: str, number: int):
     repo_full_name = f"{user}/{project}"   # "AliHShahid/PeerStudy"
-    project_obj = Project.objects.get(repo_full_name=repo_full_name)
-    pr = get_object_or_404(PullRequest, project=project_obj, number=number)
-    runs = pr.test_runs.order_by("-started_at")
-    return render(request, "pr_detail.html", {"pr": pr, "runs": runs})
+    pr = get_object_or_404(PullRequest.objects.select_related("project", "summary"),
+                           project__repo_full_name=repo_full_name, number=number)
+    # The chart reads the cached trend; runs are paginated and their output is fetched when opened.
+    runs = pr.test_runs.only(*TEST_RUN_LIST_FIELDS).order_by("-started_at")
+    page = Paginator(runs, RUNS_PER_PAGE).get_page(request.GET.get("page"))
+    jobs = pr.jobs.order_by("-created_at").only("id", "job_type", "status", "created_at")[:20]
+    summary = getattr(pr, "summary", None)
+    return render(request, "pr_detail.html", {"pr": pr, "runs": page, "page": page, "jobs": jobs,
+                                              "trend": summary.trend if summary else []})
+
+def latency(request: HttpRequest):
+    # Per-stage p50/p95 over the last ?days= (default 14), optionally for one ?project=org/repo.
+    try:
+        days = max(1, min(int(request.GET.get("days", 14) or 14), 90))
+    except ValueError:
+        return HttpResponseBadRequest("days must be an integer")
+    repo = request.GET.get("project", "")
+    project_obj = get_object_or_404(Project, repo_full_name=repo) if repo else None
+    data = tracing.stage_latency(timezone.now() - timedelta(days=days), project_obj.id if project_obj else None)
+    series = {}
+    for row in data["daily"]:
+        series.setdefault(row["stage"], {})[row["day"].isoformat()] = round(row["p95"], 3)
+    chart = {
+        "labels": sorted({row["day"].isoformat() for row in data["daily"]}),
+        "series": series,
+    }
+    return render(request, "latency.html", {
+        "data": data, "days": days, "project": repo, "chart": chart,
+        "projects": Project.objects.order_by("repo_full_name").values_list("repo_full_name", flat=True),
+    })
+
+def metrics(request: HttpRequest):
+    body = tracing.metrics_text(settings.METRICS_WINDOW_SECONDS) + scheduler.metrics_text(settings.WORKSPACE_LEASE_TTL)
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def queue_status(request: HttpRequest):
+    # Pipelines waiting and running per project; wait-time quantiles are the "queue" stage on /latency/.
+    return JsonResponse({"projects": scheduler.queue_stats(settings.WORKSPACE_LEASE_TTL),
+                         "max_concurrency": settings.PIPELINE_MAX_CONCURRENCY,
+                         "project_concurrency": settings.PIPELINE_PROJECT_CONCURRENCY})
+
+def cache_stats(request: HttpRequest, user: str, project: str):
+    project_obj = get_object_or_404(Project, repo_full_name=f"{user}/{project}")
+    return JsonResponse({"project": project_obj.repo_full_name, "caches": hit_rates(project_obj)})
+
+def run_artifact(request: HttpRequest, run_id: int, kind: str):
+    run = get_object_or_404(TestRun.objects.only("id", "junit_blob", "output_blob"), id=run_id)
+    key, content_type, name = {
+        "junit": (run.junit_blob, "application/xml", f"run-{run.id}-junit.xml"),
+        "output": (run.output_blob, "text/plain; charset=utf-8", f"run-{run.id}-output.txt"),
+    }[kind]
+    if not blobs.exists(settings.BLOB_ROOT, key):
+        raise Http404("artifact not stored")
+    return FileResponse(blobs.open_blob(settings.BLOB_ROOT, key), content_type=content_type, filename=name)
+
+def run_output_tail(request: HttpRequest, run_id: int):
+    run = get_object_or_404(TestRun.objects.only("id", "raw_output"), id=run_id)
+    return HttpResponse(run.raw_output[-OUTPUT_PREVIEW_CHARS:], content_type="text/plain; charset=utf-8")
+
+LOG_POLL_INTERVAL = 0.5
+LOG_MAX_WAIT = 25
+
+def job_logs(request: HttpRequest, job_id: int):
+    # Long-poll tail: ?after=<cursor>&wait=<seconds>. Returns as soon as there is new text.
+    job = get_object_or_404(Job.objects.only("id", "status"), id=job_id)
+    try:
+        after = int(request.GET.get("after", 0) or 0)
+        wait = float(request.GET.get("wait", 0) or 0)
+    except ValueError:
+        return HttpResponseBadRequest("after must be an integer and wait a number")
+    deadline = time.monotonic() + max(0.0, min(wait, LOG_MAX_WAIT))
+    while True:
+        chunks = joblog.read_after(job.id, after)
+        done = Job.objects.filter(id=job.id).exclude(status__in=("queued", "running")).exists()
+        if chunks or done or time.monotonic() >= deadline:
+            break
+        time.sleep(LOG_POLL_INTERVAL)
+    cursor = chunks[-1]["seq"] if chunks else after
+    return JsonResponse({"cursor": cursor, "text": "".join(c["text"] for c in chunks), "done": done and not chunks})
+
+def job_logs_stream(request: HttpRequest, job_id: int):
+    # Server-sent events; the chunk seq is the event id, so EventSource resumes via Last-Event-ID.
+    job = get_object_or_404(Job.objects.only("id"), id=job_id)
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.GET.get("after", 0) or 0)
+    except ValueError:
+        return HttpResponseBadRequest("after must be an integer")
+
+    def events():
+        cursor = after
+        while True:
+            chunks = joblog.read_after(job.id, cursor)
+            for c in chunks:
+                cursor = c["seq"]
+                data = "\n".join(f"data: {line}" for line in c["text"].rstrip("\n").split("\n"))
+                yield f"id: {cursor}\n{data}\n\n"
+            if not chunks:
+                if Job.objects.filter(id=job.id).exclude(status__in=("queued", "running")).exists():
+                    yield "event: done\ndata: \n\n"
+                    return
+                yield ": keepalive\n\n"
+                time.sleep(LOG_POLL_INTERVAL * 2)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
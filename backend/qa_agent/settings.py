@@ -79,10 +79,114 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1")
 CELERY_TASK_ALWAYS_EAGER = False
+# Stages are acknowledged when they finish, and a task whose worker is killed goes back to the queue;
+# stages resume from their checkpoints. Orchestrations still lost are reaped by reap_pipelines.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# One queue per pipeline stage so CPU-bound (analysis, execute) and I/O-bound
+# (git, generate, env) workers can be scaled independently.
+CELERY_TASK_ROUTES = {
+    "core.tasks.ingest_delivery": {"queue": "pipeline"},
+    "core.tasks.schedule_pipelines": {"queue": "pipeline"},
+    "core.tasks.orchestrate_pr": {"queue": "pipeline"},
+    "core.tasks.stage_clone": {"queue": "git"},
+    "core.tasks.dispatch_stages": {"queue": "pipeline"},
+    "core.tasks.stage_analysis": {"queue": "analysis"},
+    "core.tasks.stage_generate": {"queue": "generate"},
+    "core.tasks.stage_prepare_env": {"queue": "env"},
+    "core.tasks.stage_preflight": {"queue": "execute"},
+    "core.tasks.stage_execute": {"queue": "execute"},
+    "core.tasks.stage_execute_shard": {"queue": "execute"},
+    "core.tasks.stage_collect_shards": {"queue": "pipeline"},
+    "core.tasks.stage_rerun": {"queue": "execute"},
+    "core.tasks.stage_triage": {"queue": "pipeline"},
+    "core.tasks.stage_patch": {"queue": "pipeline"},
+    "core.tasks.stage_report": {"queue": "pipeline"},
+    "core.tasks.pipeline_failed": {"queue": "pipeline"},
+    "core.tasks.reap_pipelines": {"queue": "pipeline"},
+    "core.tasks.refill_sandbox_pool": {"queue": "env"},
+    "core.tasks.maintain_sandbox_pool": {"queue": "env"},
+    "core.tasks.prune_spans": {"queue": "pipeline"},
+    # Whole-suite coverage runs get their own queue, so a small worker pool caps them.
+    "core.tasks.refresh_coverage_map": {"queue": "coverage"},
+}
+CELERY_BEAT_SCHEDULE = {
+    "maintain-sandbox-pool": {"task": "core.tasks.maintain_sandbox_pool", "schedule": 300.0},
+    "prune-spans": {"task": "core.tasks.prune_spans", "schedule": 86400.0},
+    "schedule-pipelines": {"task": "core.tasks.schedule_pipelines", "schedule": 30.0},
+    "reap-pipelines": {"task": "core.tasks.reap_pipelines", "schedule": 300.0},
+}
 
 # App config
 WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "/workspaces")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+GIT_BASE_URL = os.getenv("GIT_BASE_URL", "https://github.com").rstrip("/")
+REPO_MIRROR_ENABLED = os.getenv("REPO_MIRROR_ENABLED", "1") == "1"
+REPO_MIRROR_DIR = os.getenv("REPO_MIRROR_DIR", os.path.join(WORKSPACE_ROOT, "mirrors"))
+REPO_CHECKOUT_MODE = os.getenv("REPO_CHECKOUT_MODE", "shared")  # shared/reference/worktree
+REPO_CLONE_DEPTH = int(os.getenv("REPO_CLONE_DEPTH", "0"))
+REPO_SPARSE_PATHS = [p for p in os.getenv("REPO_SPARSE_PATHS", "").split(",") if p]
+# Warm workspaces (base venv with pip + test tools ready) leased by pipelines and
+# reclaimed when they report; beat runs the GC for leases of finished or reaped jobs.
+SANDBOX_POOL_DIR = os.getenv("SANDBOX_POOL_DIR", os.path.join(WORKSPACE_ROOT, "pool"))
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+SANDBOX_POOL_MAX_BYTES = int(os.getenv("SANDBOX_POOL_MAX_BYTES", str(50 * 1024 ** 3)))
+WORKSPACE_MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", str(5 * 1024 ** 3)))
+WORKSPACE_LEASE_TTL = int(os.getenv("WORKSPACE_LEASE_TTL", str(6 * 3600)))
+VENV_CACHE_ENABLED = os.getenv("VENV_CACHE_ENABLED", "1") == "1"
+VENV_CACHE_DIR = os.getenv("VENV_CACHE_DIR", os.path.join(WORKSPACE_ROOT, "venv-cache"))
+VENV_CACHE_MAX_BYTES = int(os.getenv("VENV_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
 GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+# "diff": only symbols touched by the PR (vs. merge base); "repo": every source file
+GENERATION_MODE = os.getenv("GENERATION_MODE", "diff")
+# Compressed artifact store for JUnit reports and full console output
+BLOB_ROOT = os.getenv("BLOB_ROOT", os.path.join(WORKSPACE_ROOT, "blobs"))
+RAW_OUTPUT_TAIL_CHARS = int(os.getenv("RAW_OUTPUT_TAIL_CHARS", "65536"))
+# Compile and collect each generated test file (in parallel, in the prepared env) before the real run;
+# broken ones are regenerated with the AST generator or moved to .qa-quarantine/. 0 workers = one per core.
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT_ENABLED", "1") == "1"
+PREFLIGHT_CONCURRENCY = int(os.getenv("PREFLIGHT_CONCURRENCY", "0"))
+# Skip test files whose source, local imports, conftests and env are unchanged since they last passed
+TEST_RESULT_CACHE_ENABLED = os.getenv("TEST_RESULT_CACHE_ENABLED", "0") == "1"
+# pytest processes per worker (0 = one per CPU core) and Celery workers to shard across.
+# Shards are balanced on historical per-test durations; sharded runs do not stop at the first failure.
+PYTEST_SHARDS = int(os.getenv("PYTEST_SHARDS", "1"))
+PYTEST_WORKER_SHARDS = int(os.getenv("PYTEST_WORKER_SHARDS", "1"))
+# Failed tests are rerun FLAKY_RERUNS times (0 disables) when there are at most FLAKY_RERUN_MAX_TESTS of them;
+# any pass marks the failure flaky. Up to FLAKY_ISOLATE_MAX tests whose history scores at least FLAKY_THRESHOLD
+# (flaky or flipping runs / recorded runs) run in isolation, one pytest process each.
+FLAKY_RERUNS = int(os.getenv("FLAKY_RERUNS", "2"))
+FLAKY_RERUN_MAX_TESTS = int(os.getenv("FLAKY_RERUN_MAX_TESTS", "50"))
+FLAKY_THRESHOLD = float(os.getenv("FLAKY_THRESHOLD", "0.1"))
+FLAKY_ISOLATE_MAX = int(os.getenv("FLAKY_ISOLATE_MAX", "50"))
+# Run only the tests whose lines (per the latest default-branch coverage map) the PR touches;
+# maps are rebuilt on pushes to the default branch. Coverage of every run goes to TestRun.coverage.
+TEST_IMPACT_ENABLED = os.getenv("TEST_IMPACT_ENABLED", "1") == "1"
+TEST_COVERAGE_ENABLED = os.getenv("TEST_COVERAGE_ENABLED", "1") == "1"
+# Seconds before retrying a failed coverage map build, doubling per consecutive failure (up to a day).
+COVERAGE_MAP_BACKOFF = int(os.getenv("COVERAGE_MAP_BACKOFF", "3600"))
+# A push to a PR cancels its runs for older heads; in-flight stage tasks are terminated
+# unless this is 0, in which case they stop at the next stage boundary.
+PIPELINE_CANCEL_TERMINATE = os.getenv("PIPELINE_CANCEL_TERMINATE", "1") == "1"
+# Window for the quantiles on /metrics; spans older than SPAN_RETENTION_DAYS are pruned.
+METRICS_WINDOW_SECONDS = int(os.getenv("METRICS_WINDOW_SECONDS", "3600"))
+SPAN_RETENTION_DAYS = int(os.getenv("SPAN_RETENTION_DAYS", "30"))
+# Pipelines wait in a per-project queue until core.scheduler admits them: at most PIPELINE_MAX_CONCURRENCY
+# running overall (0 = unlimited) and PIPELINE_PROJECT_CONCURRENCY per project (Project.max_concurrency
+# overrides), slots shared by Project.weight. Draft PRs and labels shift priority; waiting raises it by one
+# point every PIPELINE_AGING_SECONDS. Admitted pipelines older than WORKSPACE_LEASE_TTL no longer hold a slot.
+PIPELINE_MAX_CONCURRENCY = int(os.getenv("PIPELINE_MAX_CONCURRENCY", "8"))
+PIPELINE_PROJECT_CONCURRENCY = int(os.getenv("PIPELINE_PROJECT_CONCURRENCY", "2"))
+PIPELINE_DRAFT_PENALTY = int(os.getenv("PIPELINE_DRAFT_PENALTY", "50"))
+PIPELINE_AGING_SECONDS = int(os.getenv("PIPELINE_AGING_SECONDS", "30"))
+# "label=points" pairs, e.g. "urgent=100,hotfix=100,low-priority=-50"
+PIPELINE_LABEL_PRIORITIES = {
+    name.strip(): int(points) for name, _, points in
+    (p.partition("=") for p in os.getenv("PIPELINE_LABEL_PRIORITIES", "urgent=100,hotfix=100,low-priority=-50").split(","))
+    if name.strip() and points.strip().lstrip("-").isdigit()
+}
+# A pipeline whose stage raises (crash, lost worker, clone error) is queued again up to this many attempts
+# in total; stages resume from their checkpoints (core.checkpoint), so only unfinished work is redone.
+PIPELINE_MAX_ATTEMPTS = int(os.getenv("PIPELINE_MAX_ATTEMPTS", "2"))
 HF_INFERENCE_API_URL = os.getenv("HF_INFERENCE_API_URL")
 HF_API_KEY = os.getenv("HF_API_KEY")